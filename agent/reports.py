@@ -5,9 +5,14 @@ from langchain.schema import HumanMessage, SystemMessage
 from agent.custome_agent import MyCustomMultiImageChatLLM
 from utils.helper_functions import parse_llm_response_pydantic
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from utils.schemas import LLMComplianceResult
 from typing import List, Dict, Optional, Any
 
+# Images of one submission evaluated at the same time, each its own chain of VLM calls
+REPORT_IMAGE_CONCURRENCY = int(os.getenv("REPORT_IMAGE_CONCURRENCY", "4"))
+
 class old_Reports():
 
     def __init__(self, control_number, list_image_paths, controls_content, api):
@@ -283,22 +288,35 @@ class Reports:
 
     def generate_and_parse_report(self) -> dict:
         """
-        Generates a compliance report using the LLM and immediately parses it
-        into a structured JSON object according to the defined schema.
+        Generates a compliance report for all images using the LLM and
+        immediately parses it into a structured JSON object according to the
+        defined schema. The generated report is cached on the instance.
+        """
+        result = self.evaluate_images(self.image_paths, self.report_text)
+        if result.get("report"):
+            self.report_text = result["report"]
+        return result
+
+
+    def evaluate_images(self, image_paths: List[str], report_text: Optional[str] = None) -> dict:
+        """
+        Same as `generate_and_parse_report` for the given images, without
+        touching the instance, so several evaluations can run at once.
+        An existing `report_text` skips the generation step.
         """
         try:
             # 1️⃣ Generate report if not cached
-            if not self.report_text:
+            if not report_text:
                 messages = [
                     SystemMessage(content=self.clause_audit_instructions),
                     HumanMessage(content=self.build_control_context())
                 ]
                 response = self.llm.invoke(
                     messages,
-                    image_paths=self.image_paths,
+                    image_paths=image_paths,
                     language=self.language
                 )
-                self.report_text = response.content
+                report_text = response.content
 
             # 2️⃣ Parse report to structured JSON
             schema_instruction = f"""
@@ -322,12 +340,12 @@ class Reports:
             - Output only the JSON object without explanations.
 
             Report:
-            {self.report_text}
+            {report_text}
             """
 
             parse_response = self.llm.invoke(
                 [HumanMessage(content=schema_instruction)],
-                image_paths=self.image_paths,
+                image_paths=image_paths,
                 language=self.language
             )
 
@@ -367,12 +385,12 @@ class Reports:
                 "flags": flags,
                 "needs_review": info.needs_human_review,
                 "Brief_report": brief_report,
-                "report": self.report_text
+                "report": report_text
             }
 
         except Exception as e:
             logging.exception("Error in generating and parsing report.")
-            return {"error": str(e), "report": self.report_text}
+            return {"error": str(e), "report": report_text}
 
 
     def combine_image_results(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -416,28 +434,31 @@ class Reports:
         # self.generate_report()
         return self.generate_and_parse_report()
 
-    def run_full_pipeline_ids(self) -> List[dict]:
+    def run_full_pipeline_ids(self, max_concurrency: Optional[int] = None) -> List[dict]:
         """
-        Runs the full pipeline for each image and returns structured results for all.
+        Runs the full pipeline for each image on its own and returns
+        structured results for all, in image order. Up to `max_concurrency`
+        images (REPORT_IMAGE_CONCURRENCY by default) are evaluated at once;
+        each result carries its own `latency_seconds`.
         """
-        results = []
-
-        for idx, image_path in enumerate(self.image_paths):
-            self.report_text = ""  # Reset before each image
-            self.image_paths = [image_path]  # Process one image at a time
+        image_paths = list(self.image_paths)
+        if not image_paths:
+            return []
 
+        def evaluate(idx: int, image_path: str) -> dict:
+            started = time.perf_counter()
             try:
-                parsed = self.generate_and_parse_report()
-                results.append({
-                    "id": idx,
-                    "image_name": os.path.basename(image_path),
-                    **parsed
-                })
+                parsed = self.evaluate_images([image_path])
             except Exception as e:
-                results.append({
-                    "id": idx,
-                    "image_name": os.path.basename(image_path),
-                    "error": str(e)
-                })
+                parsed = {"error": str(e)}
+            return {
+                "id": idx,
+                "image_name": os.path.basename(image_path),
+                **parsed,
+                "latency_seconds": round(time.perf_counter() - started, 3)
+            }
 
-        return results
+        workers = max(1, min(max_concurrency or REPORT_IMAGE_CONCURRENCY, len(image_paths)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-image") as pool:
+            # map keeps the input order whatever order the images finish in
+            return list(pool.map(evaluate, range(len(image_paths)), image_paths))
@@ -1,14 +1,19 @@
 import os, sys, json
+import shutil
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from fastapi import APIRouter, Form, HTTPException, UploadFile, File
+from fastapi import APIRouter, Form, HTTPException, UploadFile, File, BackgroundTasks
 import logging
 from fastapi.responses import JSONResponse
 # from utils.dynamic_controls import generate_compliance_prompt, save_control_prompt, merge_all_controls
+from typing import List
 from utils.schemas import FilterTermsRequestRegulator, FileURLsRag
-from utils.helper_functions import (extract_json_from_text, extract_json_objects, flatten_clauses, init_oss_bucket)
+from utils.helper_functions import (extract_json_from_text, extract_json_objects, flatten_clauses, init_oss_bucket,
+                                    collect_parsed_responses)
 from dotenv import load_dotenv
 from utils.create_instructions import process_parsed_response
-from rag.knowledge_retriever import retrieve_relevant_knowledge_regulator
+from rag.knowledge_retriever import (retrieve_relevant_knowledge_regulator, retrieve_relevant_knowledge_regulator_batch,
+                                    publish_store_version, reload_vectorstore, resolve_store_path)
+from rag.store_versions import new_version_id, version_directory
 from rag.knowledge_ingestion import ingest_company_knowledge, download_files_from_cloud_storage
 from utils.logs import setup_logger
 
@@ -37,7 +42,7 @@ QWEN3_ENDPOINT_CHAT = os.getenv('QWEN3_ENDPOINT_CHAT')
 
 
 @router.post("/using_rag_system")
-def using_rag_system_reg_licenses(file_urls_json: FileURLsRag):
+def using_rag_system_reg_licenses(file_urls_json: FileURLsRag, background_tasks: BackgroundTasks):
     Pathes = "./database/vectorstore_glasshub/regulator/licenses"
 
     try:
@@ -49,13 +54,28 @@ def using_rag_system_reg_licenses(file_urls_json: FileURLsRag):
         file_urls = file_urls_json.urls
         logger.info(f"The URLs are {file_urls}")
 
-        # 🧠 Ingest knowledge from files
-        download_files_from_cloud_storage(json_data=file_urls, download_dir=Pathes)
-        logger.info("📥 Files are downloaded and processed successfully.")
+        # 🧠 Download into a new version next to the one being served
+        version = new_version_id()
+        download_dir = version_directory(Pathes, version)
+        try:
+            downloaded = download_files_from_cloud_storage(json_data=file_urls, download_dir=download_dir)
+            failed = sorted(name for name, ok in downloaded.items() if not ok)
+            if failed:
+                raise RuntimeError(f"Could not download {failed}")
+            publish_store_version(Pathes, version)
+        except BaseException:
+            # A partial version must never be published, or picked up by a later rollback
+            shutil.rmtree(download_dir, ignore_errors=True)
+            raise
+        logger.info(f"📥 Files are downloaded and published as version {version}.")
+
+        # This worker swaps in the background; the others follow through their version watchers
+        background_tasks.add_task(reload_vectorstore, Pathes)
 
         return {
             "message": "RAG system created and files processed.",
-            "success": True
+            "success": True,
+            "version": version
         }
 
     except Exception as e:
@@ -68,34 +88,32 @@ def using_rag_system_reg_licenses(file_urls_json: FileURLsRag):
 
 # For RAG System
 @router.post("/filter_terms", description="Search for relevant documents based on user input and company details")
-async def filter_terms_reg_licenses(payload: FilterTermsRequestRegulator):
+def filter_terms_reg_licenses(payload: FilterTermsRequestRegulator):
     logger.info("Semantic search initiated...")
 
-    results = retrieve_relevant_knowledge_regulator(
-        path_load="./database/vectorstore_glasshub/regulator/licenses",
-        license_type=payload.license_type,
-        regulations=payload.regulations,
-        k=payload.k,
-    )
+    try:
+        results = retrieve_relevant_knowledge_regulator(
+            # Tenant stores live under the vectorstore directory; empty or unknown means this router's store
+            path_load=resolve_store_path(payload.path_load, default="./database/vectorstore_glasshub/regulator/licenses"),
+            license_type=payload.license_type,
+            regulations=payload.regulations,
+            k=payload.k,
+            filters=payload.filters.model_dump(exclude_none=True) if payload.filters else None,
+            score_threshold=payload.score_threshold,
+            use_mmr=payload.use_mmr,
+            fetch_k=payload.fetch_k,
+            lambda_mult=payload.lambda_mult,
+        )
+    except ValueError as e:
+        # Filters on a store without a metadata index
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
     if not results:
         raise HTTPException(status_code=404, detail="No documents found")
 
-    js_clean_data = []
-    for idx, result in enumerate(results):
-        content = result.get("content", "")
-        js = extract_json_from_text(content)
-
-        if not js or not isinstance(js, list):
-            logger.warning(f"Skipping result {idx}: no valid JSON array found.")
-            continue
-
-        # Loop over all elements in the JSON array
-        for item in js:
-            if isinstance(item, dict) and "parsed_response" in item:
-                parsed = item["parsed_response"]
-                if parsed:  # Only append non-empty lists
-                    js_clean_data.extend(parsed)
+    js_clean_data = collect_parsed_responses(results)
 
     if not js_clean_data:
         raise HTTPException(status_code=404, detail="No valid parsed responses found")
@@ -104,7 +122,41 @@ async def filter_terms_reg_licenses(payload: FilterTermsRequestRegulator):
     return JSONResponse(content=response)
 
 
+@router.post("/filter_terms_batch", description="Run many filter_terms searches in one call with a single batched embedding and FAISS search")
+def filter_terms_reg_licenses_batch(payloads: List[FilterTermsRequestRegulator]):
+    logger.info(f"Batch semantic search initiated for {len(payloads)} queries...")
 
+    if not payloads:
+        raise HTTPException(status_code=400, detail="At least one query is required")
 
-
-
+    try:
+        batch_results = retrieve_relevant_knowledge_regulator_batch(
+            path_load="./database/vectorstore_glasshub/regulator/licenses",
+            queries=[
+                {
+                    "path_load": resolve_store_path(payload.path_load, default="./database/vectorstore_glasshub/regulator/licenses"),
+                    "license_type": payload.license_type,
+                    "regulations": payload.regulations,
+                    "k": payload.k,
+                    "filters": payload.filters.model_dump(exclude_none=True) if payload.filters else None,
+                    "score_threshold": payload.score_threshold,
+                    "use_mmr": payload.use_mmr,
+                    "fetch_k": payload.fetch_k,
+                    "lambda_mult": payload.lambda_mult
+                }
+                for payload in payloads
+            ],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    # Keep one entry per query, in request order, even when nothing matched
+    response = {
+        "results": [
+            {"index": idx, "results": collect_parsed_responses(results)}
+            for idx, results in enumerate(batch_results)
+        ]
+    }
+    return JSONResponse(content=response)
@@ -1,9 +1,9 @@
-import os, logging, glob, sys, httpx, json
+import os, logging, glob, sys, httpx, json, shutil
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
 from typing import List, Union
-from utils.schemas import FileURLs, FileURLsRag
+from utils.schemas import FileURLs, FileURLsRag, CreateRagSystemRequest
 from docx import Document
 from dotenv import load_dotenv
 from rag.knowledge_ingestion import ingest_company_knowledge
@@ -11,8 +11,10 @@ from utils.helper_functions import (chunk_pages, estimate_chunk_size,save_temp_f
                                     convert_docx_to_pdf, extract_pages_from_pdf, init_oss_bucket,
                                     upload_to_alibaba_oss_static, download_files_from_cloud_storage,
                                     retrieve_full_knowledge_from_docx, load_documents,
-                                    process_all_formatted_results, process_all_formatted_results_no_llm)
+                                    process_all_formatted_results, process_all_formatted_results_no_llm,
+                                    forget_control_checkpoints)
 from utils.logs import setup_logger
+from utils.jobs import submit_endpoint_job, submit_upload_job, report_progress, check_cancelled, scratch_directory
 
 # Load environment variables from .env file
 load_dotenv()
@@ -47,8 +49,9 @@ def extract_terms_reg_organizations(
     thinking: bool = Form(False),
     timeout: int = Form(180)
 ):
-    response_path = "./database/llm_raw_outputs/regulator/organization"
-    os.makedirs(response_path, exist_ok=True)
+    # Per-call directories: the same endpoint may run at once in another worker
+    response_path = scratch_directory("./database/llm_raw_outputs/regulator/organization")
+    upload_directory = scratch_directory("tmp")
     all_results = []
 
     # Normalize names into a list
@@ -70,8 +73,9 @@ def extract_terms_reg_organizations(
         if len(word_file) != len(names_list):
             return JSONResponse(status_code=400, content={"error": "Number of files and names must match"})
 
-        for file, file_name in zip(word_file, names_list):
+        for file_index, (file, file_name) in enumerate(zip(word_file, names_list)):
             logger.info(f"Processing file: {file.filename} as {file_name}")
+            report_progress(file_index / len(word_file), f"Processing {file_name}")
 
             # ✅ Validate extension
             if not file.filename.endswith(".docx"):
@@ -79,8 +83,7 @@ def extract_terms_reg_organizations(
                 continue
 
             # ✅ Save temp file
-            os.makedirs("tmp", exist_ok=True)
-            word_path = save_temp_file(file, f"tmp/{file.filename}")
+            word_path = save_temp_file(file, os.path.join(upload_directory, file.filename))
             pdf_path = word_path.replace(".docx", ".pdf")
             logger.info(f"Saved DOCX to {word_path}, converting to {pdf_path}")
 
@@ -94,6 +97,9 @@ def extract_terms_reg_organizations(
             # ✅ Build prompts and collect responses
             all_responses = ""
             for idx, chunk in enumerate(chunks):
+                # Background jobs stop here when cancelled; plain requests are unaffected
+                check_cancelled()
+                report_progress((file_index + idx / len(chunks)) / len(word_file), f"{file_name}: chunk {idx + 1}/{len(chunks)}")
                 prompt = (
                     f"Your task is to extract (التعليمات والبنود والمطلوب من المستخدم ان يقوم به او ما يجب ان يتجنبه ) "
                     f"from raw text:\n\n{chunk}\nThe language is {language}"
@@ -146,12 +152,9 @@ def extract_terms_reg_organizations(
         return JSONResponse(status_code=500, content={"error": str(e)})
 
     finally:
-        # Clear old responses
-        for file_path in glob.glob(os.path.join(response_path, "*")):
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                logger.warning(f"⚠️ Could not delete {file_path}: {e}")
+        # Clear this call's responses and uploads
+        for directory in (response_path, upload_directory):
+            shutil.rmtree(directory, ignore_errors=True)
 
 
 
@@ -174,7 +177,11 @@ def generate_controls_reg_organizations(
         }
 
     """
-    DOCX_DIRECTORY = "./database/controls/regulator/organization"
+    # Per-call directory: the same endpoint may run at once in another worker
+    DOCX_DIRECTORY = scratch_directory("./database/controls/regulator/organization")
+    # Outputs sit apart from the downloads, which load_documents reads as input
+    OUTPUT_DIRECTORY = os.path.join(DOCX_DIRECTORY, "output")
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
     results = []
 
     try:
@@ -182,10 +189,12 @@ def generate_controls_reg_organizations(
             logger.exception("Input list is required")
             raise HTTPException(status_code=400, detail="files are required")
 
-        for entry in file_urls_json.files:
+        for file_index, entry in enumerate(file_urls_json.files):
             url = entry.url
             name_file = entry.name_file
-            OUTPUT_DOCX = f"./database/controls/regulator/{name_file}.docx"
+            check_cancelled()
+            report_progress(file_index / len(file_urls_json.files), f"Processing {name_file}")
+            OUTPUT_DOCX = os.path.join(OUTPUT_DIRECTORY, f"{name_file}.docx")
 
             logger.info(f"Processing: {name_file} from {url}")
 
@@ -198,12 +207,18 @@ def generate_controls_reg_organizations(
             # 3. Retrieve knowledge
             retrieve_doc = retrieve_full_knowledge_from_docx(documents)
 
-            # 4. Process results
-            js_result = process_all_formatted_results(retrieve_doc)
+            # 4. Process results; finished chunks and clauses are checkpointed, so a rerun resumes.
+            #    Chunks or clauses that keep failing are left out and the file is flagged partial; a rerun retries them
+            checkpoint = {}
+            js_result = process_all_formatted_results(retrieve_doc, stats=checkpoint)
+            if checkpoint["partial"]:
+                logger.warning(f"⚠️ Some chunks or clauses of {name_file} kept failing and were left out: {checkpoint}")
 
             # 5. Save to docx
             document = Document()
             document.add_heading("Controls", level=1)
+            if checkpoint["partial"]:
+                document.add_paragraph("Partial result: some chunks or clauses failed repeatedly and are missing.")
             document.add_paragraph(json.dumps(js_result, ensure_ascii=False, indent=2))
             document.save(OUTPUT_DOCX)
             logger.info(f"✅ Saved DOCX: {OUTPUT_DOCX}")
@@ -218,17 +233,23 @@ def generate_controls_reg_organizations(
                 "url": url_uploaded,
                 "name_file": name_file,
                 "result": js_result,
-                "uploaded_doc": oss_path
+                "uploaded_doc": oss_path,
+                "partial": checkpoint["partial"],
+                "checkpoint": checkpoint
             })
 
             # 8. Clean individual output
             if os.path.exists(OUTPUT_DOCX):
                 os.remove(OUTPUT_DOCX)
 
-        return {
+        response = {
             "success": True,
             "files_processed": results
         }
+        partial = [result["name_file"] for result in results if result["partial"]]
+        if partial:
+            response["message"] = f"Uploaded with some chunks or clauses left out after repeated failures: {', '.join(partial)}."
+        return response
 
     except Exception as e:
         logger.exception("❌ Failed to process or upload.")
@@ -238,22 +259,53 @@ def generate_controls_reg_organizations(
         }
 
     finally:
-        # 🧹 Cleanup any leftover docx files
+        # 🧹 Cleanup this call's input and output files
         try:
-            for file in os.listdir(DOCX_DIRECTORY):
-                if file.endswith(".docx"):
-                    os.remove(os.path.join(DOCX_DIRECTORY, file))
-                    logger.info(f"Cleaned up input: {file}")
+            shutil.rmtree(DOCX_DIRECTORY)
+            logger.info(f"Cleaned up input: {DOCX_DIRECTORY}")
         except Exception as cleanup_err:
             logger.warning(f"⚠️ Cleanup failed: {cleanup_err}")
 
 
 
+@router.post("/forget_controls_checkpoints", description="Drop the saved progress of /generate_controls for these files")
+def forget_controls_checkpoints_reg_organizations(file_urls_json: FileURLs):
+    """
+    Makes the next /generate_controls over these files start over instead of
+    reusing finished chunks and clauses. Checkpoints are keyed by the file
+    contents, so the files are downloaded to find them.
+    """
+    if not file_urls_json or not file_urls_json.files:
+        raise HTTPException(status_code=400, detail="files are required")
+
+    DOCX_DIRECTORY = scratch_directory("./database/controls/regulator/organization")
+    try:
+        download_files_from_cloud_storage([entry.url for entry in file_urls_json.files], DOCX_DIRECTORY)
+        documents = forget_control_checkpoints(retrieve_full_knowledge_from_docx(load_documents(docx_path=DOCX_DIRECTORY)))
+        logger.info(f"🧹 Forgot controls checkpoints of: {', '.join(documents) or 'no documents'}")
+        return {
+            "success": True,
+            "documents_forgotten": sorted(documents)
+        }
+
+    except Exception as e:
+        logger.exception("❌ Failed to forget controls checkpoints.")
+        return {
+            "message": f"Failed to forget controls checkpoints: {str(e)}",
+            "success": False
+        }
+
+    finally:
+        shutil.rmtree(DOCX_DIRECTORY, ignore_errors=True)
+
+
+
 # For RAG System
 @router.post("/create_rag_system")
-def create_rag_system(file_urls_json: FileURLsRag):
+def create_rag_system(file_urls_json: CreateRagSystemRequest):
 
-    DOCX_DIRECTORY = "./database/glasshub_files/regulator/organization"
+    # Per-call directory: the same endpoint may run at once in another worker
+    DOCX_DIRECTORY = scratch_directory("./database/glasshub_files/regulator/organization")
     path_upload = "cst/cst_rag/regulator/organization"
     try:
         # ✅ Validate input
@@ -265,15 +317,31 @@ def create_rag_system(file_urls_json: FileURLsRag):
         logger.info(f"The URLs are {file_urls}")
 
         # 🧠 Ingest knowledge from files
-        ingest_company_knowledge(file_urls, DOCX_DIRECTORY, path_upload)
+        index_options = file_urls_json.index_options.model_dump(mode="json")
+        metadata = file_urls_json.metadata.model_dump(exclude_none=True)
+        index_report = ingest_company_knowledge(
+            file_urls, DOCX_DIRECTORY, path_upload, metadata=metadata, incremental=file_urls_json.incremental, **index_options
+        )
         logger.info("📥 Files are downloaded and processed successfully.")
+        logger.info(f"📈 Index report: {index_report}")
 
-        return {
+        response = {
             "message": "RAG system created and files processed.",
             "success": True,
             "path_faiss":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/index.faiss",
-            "path_pkl":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/index.pkl"
+            "path_docstore":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/docstore.jsonl",
+            "path_docstore_offsets":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/docstore.offsets.npy",
+            "path_config":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/index_config.json",
+            "path_metadata_index":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/metadata_index.json",
+            "path_metadata_positions":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/metadata_positions.npy",
+            "path_faiss_ids":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/faiss_ids.npy",
+            "path_vector_norms":f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/vector_norms.npy",
+            "index_report": index_report
         }
+        # IVF stores also ship where each vector's code sits, so searches need no direct map
+        if index_report.get("index", {}).get("index_type") == "ivf":
+            response["path_ivf_locations"] = f"https://glasshub-files-staging.oss-me-central-1.aliyuncs.com/{path_upload}/ivf_locations.npy"
+        return response
 
     except Exception as e:
         logger.exception("❌ Failed to download or process files.")
@@ -283,14 +351,40 @@ def create_rag_system(file_urls_json: FileURLsRag):
         }
 
     finally:
-        # 🧹 Clean up temporary .docx files from local storage
+        # 🧹 Clean up this call's downloaded files from local storage
         try:
-            for file in os.listdir(DOCX_DIRECTORY):
-                if file.endswith(".docx"):
-                    full_path = os.path.join(DOCX_DIRECTORY, file)
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
-                        logger.info(f"🧹 Deleted temp file: {full_path}")
+            shutil.rmtree(DOCX_DIRECTORY)
+            logger.info(f"🧹 Deleted temp directory: {DOCX_DIRECTORY}")
         except Exception as cleanup_err:
             logger.warning(f"⚠️ Cleanup failed: {cleanup_err}")
 
+
+# Background job variants: respond with a job id at once; poll /jobs/{job_id} and fetch /jobs/{job_id}/result
+@router.post("/extract_terms_job", status_code=202, description="Run /extract_terms as a background job")
+def extract_terms_reg_organizations_job(
+    word_file: List[UploadFile] = File(..., description="Upload one or more Word files"),
+    name_word_file: Union[List[str], str] = Form(..., description="Matching names for the uploaded files"),
+    language: str = Form(..., description="Arabic or English"),
+    max_tokens: int = Form(512),
+    thinking: bool = Form(False),
+    timeout: int = Form(180)
+):
+    return submit_upload_job(
+        "extract_terms", extract_terms_reg_organizations, "word_file", word_file,
+        params={"files": [file.filename for file in word_file], "name_word_file": name_word_file, "language": language},
+        name_word_file=name_word_file, language=language, max_tokens=max_tokens, thinking=thinking, timeout=timeout
+    )
+
+
+@router.post("/generate_controls_job", status_code=202, description="Run /generate_controls as a background job")
+def generate_controls_reg_organizations_job(file_urls_json: FileURLs):
+    return submit_endpoint_job(
+        "generate_controls", generate_controls_reg_organizations, file_urls_json, params=file_urls_json.model_dump(mode="json")
+    )
+
+
+@router.post("/create_rag_system_job", status_code=202, description="Run /create_rag_system as a background job")
+def create_rag_system_job(file_urls_json: CreateRagSystemRequest):
+    return submit_endpoint_job(
+        "create_rag_system", create_rag_system, file_urls_json, params=file_urls_json.model_dump(mode="json")
+    )
@@ -0,0 +1,490 @@
+"""
+Retrieval benchmark on a synthetic Arabic/English regulation corpus.
+
+Builds stores of the requested sizes with the same file layout ingestion
+writes, replays a query set through `retrieve_relevant_knowledge_regulator`
+/ `_enterprise`, and reports load time, RSS, p50/p95/p99 latency, QPS per
+thread count and recall@k of the vector index against exact search as JSON.
+With `--hybrid`, the overlap of the fused results with the exact top-k is
+reported next to it as `hybrid_overlap_at_k`; it is not a recall figure and
+is left out of `compare`.
+
+`worker_private_bytes` is the anonymous memory the loaded store added to the
+process after replaying the queries, i.e. what each extra uvicorn worker
+costs; with `--max-worker-bytes` the run fails when it is exceeded:
+
+    python -m benchmarks.retrieval_benchmark run --sizes 100000 --load-mode mmap --max-worker-bytes 33554432
+
+    python -m benchmarks.retrieval_benchmark run --sizes 10000 100000 --output bench.json
+    python -m benchmarks.retrieval_benchmark run --sizes 100000 --index-type hnsw --compression sq8 --compare bench.json
+    python -m benchmarks.retrieval_benchmark compare bench.json bench_new.json
+
+The default `hash` embedding is a deterministic feature-hashing model, so
+million-chunk stores build in minutes without a GPU; `--embedding model`
+uses the configured sentence-transformers model instead.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import subprocess
+import numpy as np
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from rag.embedding_provider import embedding_provider
+from rag.index_builder import (build_index_config, build_faiss_index, save_index_config, save_full_vectors, save_id_layout,
+                               save_vector_norms, vector_norms)
+from rag.keyword_index import KeywordIndex, tokenize
+from rag.metadata_index import MetadataIndex
+from rag.mmap_docstore import MmapDocstore, write_mmap_docstore
+from utils.memory import current_rss_bytes, private_memory_bytes, format_bytes
+import rag.knowledge_retriever as knowledge_retriever
+
+# Metrics where a larger value is a regression when comparing runs
+LOWER_IS_BETTER = ("load_seconds", "rss_delta_bytes", "worker_private_bytes", "p50_ms", "p95_ms", "p99_ms")
+HIGHER_IS_BETTER = ("qps", "recall_at_k")
+
+
+# ---------------------------------------------------------------- corpus
+
+LICENSE_TYPES = ["ترخيص تقديم خدمات الاتصالات", "ترخيص الطيف الترددي", "ترخيص مزود خدمة الإنترنت",
+                 "ترخيص الحوسبة السحابية", "Class A telecom license", "Cloud service provider license"]
+REGULATIONS = ["نظام الاتصالات وتقنية المعلومات", "لائحة حماية البيانات الشخصية", "ضوابط الأمن السيبراني",
+               "لائحة جودة الخدمة", "Data Protection Regulation", "Cybersecurity Controls Framework"]
+ARABIC_TERMS = ["يجب", "على", "مقدم", "الخدمة", "الالتزام", "بالضوابط", "الصادرة", "عن", "الهيئة", "حماية",
+                "بيانات", "المستفيدين", "الإبلاغ", "عن", "الحوادث", "خلال", "مدة", "لا", "تتجاوز", "ساعة",
+                "الاحتفاظ", "بالسجلات", "التشفير", "المراجعة", "الدورية", "الترخيص", "الطيف", "الشبكة",
+                "الاستمرارية", "التعاقد", "مع", "الطرف", "الثالث", "الإفصاح", "الموافقة", "المسبقة"]
+ENGLISH_TERMS = ["the", "licensee", "shall", "ensure", "compliance", "with", "incident", "reporting", "within",
+                 "hours", "retain", "records", "encryption", "periodic", "audit", "third", "party", "consent",
+                 "network", "availability", "service", "quality", "data", "subscriber", "notify", "authority"]
+
+
+def make_chunk(position: int, seed: int = 0) -> Document:
+    """Deterministic regulation-like chunk; the same position always yields the same text."""
+    rng = np.random.default_rng(seed * 1_000_003 + position)
+    license_type = LICENSE_TYPES[position % len(LICENSE_TYPES)]
+    regulation = REGULATIONS[(position // len(LICENSE_TYPES)) % len(REGULATIONS)]
+    terms = ARABIC_TERMS if rng.random() < 0.7 else ENGLISH_TERMS
+    body = " ".join(rng.choice(terms, size=int(rng.integers(25, 60))))
+    article = int(rng.integers(1, 400))
+    text = f"المادة {article} من {regulation} - {license_type}: {body} (بند {position})"
+    return Document(page_content=text, metadata={
+        "source": f"regulation_{position % 50}.docx",
+        "page": int(position // 20) + 1,
+        "regulation": regulation,
+        "license_type": license_type
+    })
+
+
+def iter_chunks(size: int, seed: int = 0) -> Iterator[Document]:
+    for position in range(size):
+        yield make_chunk(position, seed)
+
+
+def make_queries(size: int, count: int, seed: int = 0) -> List[dict]:
+    rng = np.random.default_rng(seed + 17)
+    queries = []
+    for position in rng.choice(size, size=min(count, size), replace=False):
+        chunk = make_chunk(int(position), seed)
+        words = chunk.page_content.split()
+        snippet = " ".join(words[-12:-3])
+        queries.append({
+            "license_type": chunk.metadata["license_type"],
+            "regulations": f"{chunk.metadata['regulation']} {snippet}",
+            "user_question": snippet
+        })
+    return queries
+
+
+# ------------------------------------------------------------ embeddings
+
+class HashEmbeddings(Embeddings):
+    """Feature-hashing bag of words over the retriever's Arabic-aware tokens."""
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    @lru_cache(maxsize=200_000)
+    def _bucket(self, token: str):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dimension, 1.0 if (value >> 63) else -1.0
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            bucket, sign = self._bucket(token)
+            vector[bucket] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+def embed_corpus(embeddings, size: int, seed: int, batch_size: int = 4096) -> np.ndarray:
+    vectors = None
+    for start in range(0, size, batch_size):
+        texts = [make_chunk(position, seed).page_content for position in range(start, min(size, start + batch_size))]
+        batch = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        if vectors is None:
+            vectors = np.empty((size, batch.shape[1]), dtype=np.float32)
+        vectors[start:start + len(batch)] = batch
+    return vectors
+
+
+# ----------------------------------------------------------------- build
+
+def build_store(directory: str, embeddings, size: int, seed: int, index_options: dict) -> dict:
+    """Writes a store with the same files as ingestion (index, docstore, config, keyword/metadata indexes)."""
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    vectors = embed_corpus(embeddings, size, seed)
+    embed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    config = build_index_config(len(vectors), vectors.shape[1], **index_options)
+    index = build_faiss_index(vectors, config)
+    faiss.write_index(index, os.path.join(directory, "index.faiss"))
+    save_id_layout(directory, index)
+    save_vector_norms(directory, vector_norms(vectors))
+    save_index_config(directory, config)
+    if config["rerank"]:
+        save_full_vectors(directory, vectors)
+    index_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    write_mmap_docstore(directory, iter_chunks(size, seed))
+    KeywordIndex.build(chunk.page_content for chunk in iter_chunks(size, seed)).save(directory)
+    MetadataIndex.build(chunk.metadata for chunk in iter_chunks(size, seed)).save(directory)
+    side_seconds = time.perf_counter() - started
+
+    return {
+        "vectors": vectors,
+        "config": config,
+        "embed_seconds": round(embed_seconds, 3),
+        "index_seconds": round(index_seconds, 3),
+        "docstore_and_keyword_seconds": round(side_seconds, 3),
+        "index_bytes": os.path.getsize(os.path.join(directory, "index.faiss"))
+    }
+
+
+# --------------------------------------------------------------- measure
+
+def percentile_summary(latencies_ms: List[float]) -> dict:
+    return {
+        "mean_ms": round(float(np.mean(latencies_ms)), 3),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3)
+    }
+
+
+def run_query(api: str, path: str, query: dict, k: int):
+    if api == "enterprise":
+        return knowledge_retriever.retrieve_relevant_knowledge_enterprise(
+            path_load=path, user_question=query["user_question"], license_type=query["license_type"],
+            regulations=query["regulations"], k=k
+        )
+    return knowledge_retriever.retrieve_relevant_knowledge_regulator(
+        path_load=path, license_type=query["license_type"], regulations=query["regulations"], k=k
+    )
+
+
+def timed_query(api: str, path: str, query: dict, k: int):
+    started = time.perf_counter()
+    results = run_query(api, path, query, k)
+    return (time.perf_counter() - started) * 1000, results
+
+
+def overlap(expected: List[set], retrieved: List[set]) -> float:
+    """Mean share of each `expected` set that the matching `retrieved` set contains."""
+    return round(float(np.mean([len(e & r) / max(1, len(e)) for e, r in zip(expected, retrieved)])), 4)
+
+
+def measure_recall(api: str, path: str, queries: List[dict], vectors: np.ndarray, embeddings, k: int, results) -> dict:
+    """
+    `recall_at_k` is the share of the exact (flat L2) top-k, by content, that
+    the vector index alone returns. With HYBRID_SEARCH on, BM25 fusion is meant
+    to change the ranking, so how much of the exact top-k the timed (fused)
+    results kept is reported apart as `hybrid_overlap_at_k`.
+    """
+    if api == "enterprise":
+        texts = [knowledge_retriever.build_enterprise_query(q["user_question"], "", q["license_type"], "", q["regulations"]) for q in queries]
+    else:
+        texts = [knowledge_retriever.build_regulator_query(q["license_type"], q["regulations"]) for q in queries]
+    query_vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    _, exact_ids = faiss.knn(query_vectors, vectors, k)
+
+    docstore = MmapDocstore(path)
+    try:
+        expected = [{docstore.search(int(i)).page_content.strip() for i in ids if i >= 0} for ids in exact_ids]
+    finally:
+        docstore.close()
+
+    # Without keyword queries search_many runs the vector search only
+    with knowledge_retriever.vectorstore_registry.acquire(path) as db:
+        vector_results = knowledge_retriever.search_many(db, texts, [k] * len(texts))
+    recall = {"recall_at_k": overlap(expected, [{doc.page_content.strip() for doc, _ in docs} for docs in vector_results])}
+    if knowledge_retriever.HYBRID_SEARCH:
+        recall["hybrid_overlap_at_k"] = overlap(expected, [{result["content"] for result in retrieved} for retrieved in results])
+    return recall
+
+
+def measure_throughput(api: str, path: str, queries: List[dict], k: int, threads: int, duration: float) -> dict:
+    """Replays the query set from `threads` threads for about `duration` seconds."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    def worker(offset: int):
+        local = []
+        position = offset
+        while time.perf_counter() < deadline:
+            latency, _ = timed_query(api, path, queries[position % len(queries)], k)
+            local.append(latency)
+            position += threads
+        return local
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for local in executor.map(worker, range(threads)):
+            latencies.extend(local)
+    elapsed = time.perf_counter() - started
+
+    return {"threads": threads, "queries": len(latencies), "qps": round(len(latencies) / elapsed, 2), **percentile_summary(latencies)}
+
+
+def benchmark_size(args, embeddings, size: int) -> dict:
+    directory = os.path.join(args.workdir, f"store_{size}")
+    index_options = {"index_type": args.index_type, "compression": args.compression, "rerank": args.rerank}
+    if args.nprobe:
+        index_options["nprobe"] = args.nprobe
+    if args.ef_search:
+        index_options["ef_search"] = args.ef_search
+
+    print(f"🏗️ Building {size} chunks in {directory}...")
+    build = build_store(directory, embeddings, size, args.seed, index_options)
+    vectors = build.pop("vectors")
+    queries = make_queries(size, args.queries, args.seed)
+
+    rss_before = current_rss_bytes()
+    private_before = private_memory_bytes()
+    started = time.perf_counter()
+    knowledge_retriever.vectorstore_registry.get(directory)
+    load_seconds = time.perf_counter() - started
+    rss_after = current_rss_bytes()
+
+    report = {
+        "size": size,
+        "index_config": build.pop("config"),
+        "build": build,
+        "load_seconds": round(load_seconds, 3),
+        "rss_delta_bytes": max(0, rss_after - rss_before),
+        "rss_bytes": rss_after,
+        "apis": {}
+    }
+
+    for api in args.apis:
+        # Warm up page cache and lazy structures before timing
+        for query in queries[:min(10, len(queries))]:
+            run_query(api, directory, query, args.k)
+
+        latencies, results = [], []
+        for query in queries:
+            latency, retrieved = timed_query(api, directory, query, args.k)
+            latencies.append(latency)
+            results.append(retrieved)
+
+        report["apis"][api] = {
+            "latency": percentile_summary(latencies),
+            **measure_recall(api, directory, queries, vectors, embeddings, args.k, results),
+            "throughput": [
+                measure_throughput(api, directory, queries, args.k, threads, args.duration)
+                for threads in args.threads
+            ]
+        }
+        api_report = report["apis"][api]
+        hybrid = f", hybrid overlap@{args.k}={api_report['hybrid_overlap_at_k']}" if "hybrid_overlap_at_k" in api_report else ""
+        print(f"📊 {size} / {api}: {json.dumps(api_report['latency'])}, recall@{args.k}={api_report['recall_at_k']}{hybrid}")
+
+    report["worker_private_bytes"] = max(0, private_memory_bytes() - private_before)
+    print(f"🧠 {size}: {format_bytes(report['worker_private_bytes'])} of private memory per worker ({args.load_mode})")
+
+    knowledge_retriever.vectorstore_registry.invalidate(directory)
+    del vectors
+    if not args.keep_stores:
+        shutil.rmtree(directory, ignore_errors=True)
+    return report
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+# --------------------------------------------------------------- compare
+
+def flatten_metrics(report: dict) -> dict:
+    """{(size, api, metric): value} for every comparable number in a report."""
+    metrics = {}
+    for result in report["results"]:
+        size = result["size"]
+        metrics[(size, "-", "load_seconds")] = result["load_seconds"]
+        metrics[(size, "-", "rss_delta_bytes")] = result["rss_delta_bytes"]
+        if "worker_private_bytes" in result:
+            metrics[(size, "-", "worker_private_bytes")] = result["worker_private_bytes"]
+        for api, api_report in result["apis"].items():
+            metrics[(size, api, "recall_at_k")] = api_report["recall_at_k"]
+            for name in ("p50_ms", "p95_ms", "p99_ms"):
+                metrics[(size, api, name)] = api_report["latency"][name]
+            for run in api_report["throughput"]:
+                metrics[(size, api, f"qps@{run['threads']}")] = run["qps"]
+    return metrics
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float = 0.1) -> dict:
+    """Relative change of every shared metric; regressions are changes in the bad direction beyond `tolerance`."""
+    old, new = flatten_metrics(baseline), flatten_metrics(current)
+    rows, regressions = [], []
+    for key in sorted(set(old) & set(new), key=str):
+        size, api, metric = key
+        before, after = old[key], new[key]
+        change = (after - before) / before if before else 0.0
+        name = metric.split("@")[0]
+        worse = (name in LOWER_IS_BETTER and change > tolerance) or (name in HIGHER_IS_BETTER and change < -tolerance)
+        row = {"size": size, "api": api, "metric": metric, "baseline": before, "current": after, "change": round(change, 4), "regression": worse}
+        rows.append(row)
+        if worse:
+            regressions.append(row)
+    return {"tolerance": tolerance, "rows": rows, "regressions": regressions}
+
+
+def print_comparison(comparison: dict):
+    for row in comparison["rows"]:
+        marker = "❌" if row["regression"] else "  "
+        print(f"{marker} {row['size']:>8} {row['api']:>10} {row['metric']:>16}: {row['baseline']} → {row['current']} ({row['change']:+.1%})")
+    print(f"{'❌' if comparison['regressions'] else '✅'} {len(comparison['regressions'])} regressions beyond {comparison['tolerance']:.0%}")
+
+
+# ------------------------------------------------------------------ main
+
+def run(args) -> int:
+    knowledge_retriever.HYBRID_SEARCH = args.hybrid
+    knowledge_retriever.VECTORSTORE_LOAD_MODE = args.load_mode
+    # Every replayed query must pay for its embedding
+    embedding_provider.query_cache.max_size = args.query_cache_size
+    embedding_provider.query_cache.invalidate()
+    # Synthetic corpora must not fill the shared on-disk chunk cache
+    embedding_provider.document_cache = None
+
+    if args.embedding == "hash":
+        embedding_provider.use_embeddings(HashEmbeddings(args.dimension), f"hash-{args.dimension}")
+    embeddings = embedding_provider.get()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "faiss": faiss.__version__,
+            "cpu_count": os.cpu_count(),
+            "embedding": embedding_provider.model_name,
+            "args": {key: value for key, value in vars(args).items() if key != "func"}
+        },
+        "results": [benchmark_size(args, embeddings, size) for size in args.sizes]
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Results written to {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    status = 0
+    if args.max_worker_bytes:
+        for result in report["results"]:
+            if result["worker_private_bytes"] > args.max_worker_bytes:
+                print(f"❌ {result['size']}: {format_bytes(result['worker_private_bytes'])} of private memory per worker, "
+                      f"limit {format_bytes(args.max_worker_bytes)}")
+                status = 1
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            comparison = compare_reports(json.load(f), report, args.tolerance)
+        print_comparison(comparison)
+        return 1 if comparison["regressions"] else status
+    return status
+
+
+def compare(args) -> int:
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    comparison = compare_reports(baseline, current, args.tolerance)
+    print_comparison(comparison)
+    return 1 if comparison["regressions"] else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieval latency / throughput / recall benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Build synthetic stores and benchmark them")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000], help="Chunks per store, e.g. 10000 100000 1000000")
+    run_parser.add_argument("--queries", type=int, default=200)
+    run_parser.add_argument("--k", type=int, default=10)
+    run_parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    run_parser.add_argument("--duration", type=float, default=5.0, help="Seconds per throughput run")
+    run_parser.add_argument("--apis", nargs="+", choices=["regulator", "enterprise"], default=["regulator", "enterprise"])
+    run_parser.add_argument("--embedding", choices=["hash", "model"], default="hash")
+    run_parser.add_argument("--dimension", type=int, default=256, help="Hash embedding size")
+    run_parser.add_argument("--index-type", choices=["flat", "ivf", "hnsw"], default="flat")
+    run_parser.add_argument("--compression", choices=["none", "fp16", "sq8", "pq"], default="none")
+    run_parser.add_argument("--rerank", action="store_true")
+    run_parser.add_argument("--nprobe", type=int, default=None)
+    run_parser.add_argument("--ef-search", type=int, default=None)
+    run_parser.add_argument("--load-mode", choices=["memory", "mmap"], default="memory")
+    run_parser.add_argument("--max-worker-bytes", type=int, default=0, help="Fail when a store adds more private memory per worker (0 = no check)")
+    run_parser.add_argument("--hybrid", action=argparse.BooleanOptionalAction, default=False, help="Fuse BM25 hits (HYBRID_SEARCH)")
+    run_parser.add_argument("--query-cache-size", type=int, default=0, help="0 embeds every replayed query")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--workdir", default="./database/benchmarks")
+    run_parser.add_argument("--keep-stores", action="store_true")
+    run_parser.add_argument("--output", help="JSON report path (printed if omitted)")
+    run_parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    run_parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change counted as a regression")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    compare_parser.set_defaults(func=compare)
+
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    sys.exit(arguments.func(arguments))
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
@@ -35,15 +35,12 @@ from apis.enterprise.licenses.api_admin_router import router as admin_enterprise
 from apis.enterprise.licenses.api_chat_router import router as chat_enterprise_lic
 from apis.enterprise.licenses.api_data_router import router as data_enterprise_lic
 
-from rag.knowledge_retriever import load_vectorstore
-
-# Global variables - Dictionary to store multiple vector stores
-vector_stores = {
-    "regulator_organizations": None,
-    "regulator_licenses": None,
-    "enterprise_organizations": None,
-    "enterprise_licenses": None
-}
+from rag.knowledge_retriever import vectorstore_registry, reload_vectorstore, VECTORSTORE_WATCH_INTERVAL
+from rag.store_versions import StoreVersionWatcher, current_version
+from rag.embedding_provider import embedding_provider
+from rag.index_builder import storage_report
+from utils.downloader import downloader
+from utils.jobs import job_manager, FINISHED_STATUSES
 
 # Vector store paths configuration
 VECTOR_STORE_PATHS = {
@@ -53,12 +50,26 @@ VECTOR_STORE_PATHS = {
     "enterprise_licenses": "./database/vectorstore_glasshub/enterprise/licenses"
 }
 
+
+def vector_stores_status():
+    """Loaded/not_loaded state of every configured store, read from the shared registry"""
+    return {
+        name: "loaded" if vectorstore_registry.is_loaded(path) else "not_loaded"
+        for name, path in VECTOR_STORE_PATHS.items()
+    }
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
-    global vector_stores
-    
     logger.info("🚀 Starting up GlassHub Agent...")
+    logger.info("⏳ Loading embedding model at startup...")
+    embedding_provider.get()
+    logger.info(f"🧠 Embedding model ready: {embedding_provider.stats()}")
+
+    orphaned = job_manager.store.fail_orphaned()
+    if orphaned:
+        logger.warning(f"⚠️ Marked {orphaned} jobs of stopped workers as failed")
+
     logger.info("⏳ Loading Vector Stores at startup...")
     
     loaded_count = 0
@@ -67,9 +78,11 @@ async def lifespan(app: FastAPI):
     for store_name, path in VECTOR_STORE_PATHS.items():
         try:
             logger.info(f"📂 Loading {store_name} from {path}...")
-            vector_stores[store_name] = load_vectorstore(path_load=path)
+            # The default stores stay resident; tenant stores share the pool budget
+            vectorstore_registry.pin(path)
+            store = vectorstore_registry.get(path)
             
-            if vector_stores[store_name]:
+            if store:
                 logger.info(f"✅ {store_name} loaded successfully!")
                 print(f"✅ {store_name} loaded successfully!")
                 loaded_count += 1
@@ -81,17 +94,29 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"❌ Failed to load {store_name}: {str(e)}")
             print(f"❌ Failed to load {store_name}: {str(e)}")
-            vector_stores[store_name] = None
             failed_count += 1
     
     logger.info(f"📊 Vector Store Loading Summary: {loaded_count} loaded, {failed_count} failed")
     print(f"📊 Vector Store Loading Summary: {loaded_count} loaded, {failed_count} failed")
 
+    # Each worker follows newly published store versions without a restart
+    watcher = None
+    if VECTORSTORE_WATCH_INTERVAL > 0:
+        watcher = StoreVersionWatcher(
+            lambda: vectorstore_registry.loaded_paths().values(), reload_vectorstore, VECTORSTORE_WATCH_INTERVAL
+        ).start()
+        logger.info(f"👀 Watching vector store versions every {VECTORSTORE_WATCH_INTERVAL}s")
+
     yield  # Application is running
     
     # Shutdown
     logger.info("🛑 App shutting down...")
     print("🛑 App shutting down...")
+    if watcher is not None:
+        watcher.stop()
+    job_manager.shutdown()
+    vectorstore_registry.clear()
+    downloader.close()
 
 # Create FastAPI app with lifespan
 app = FastAPI(
@@ -140,32 +165,28 @@ def home():
     logger.info("Home endpoint accessed")
     
     # Count loaded vector stores
-    loaded_stores = sum(1 for store in vector_stores.values() if store is not None)
-    total_stores = len(vector_stores)
+    stores_status = vector_stores_status()
+    loaded_stores = sum(1 for status in stores_status.values() if status == "loaded")
+    total_stores = len(stores_status)
     
     return {
         "message": "Welcome to the GlassHub Agent for Enterprise and Regulator Compliance!",
         "status": "running",
         "vector_stores_loaded": f"{loaded_stores}/{total_stores}",
-        "vector_stores_status": {
-            name: "loaded" if store is not None else "not_loaded" 
-            for name, store in vector_stores.items()
-        }
+        "vector_stores_status": stores_status
     }
 
 @app.get("/health", tags=["Health"])
 def health_check():
     """Health check endpoint"""
-    loaded_stores = sum(1 for store in vector_stores.values() if store is not None)
-    total_stores = len(vector_stores)
+    stores_status = vector_stores_status()
+    loaded_stores = sum(1 for status in stores_status.values() if status == "loaded")
+    total_stores = len(stores_status)
     
     return {
         "status": "healthy",
         "vector_stores_loaded": f"{loaded_stores}/{total_stores}",
-        "vector_stores_status": {
-            name: "loaded" if store is not None else "not_loaded" 
-            for name, store in vector_stores.items()
-        }
+        "vector_stores_status": stores_status
     }
 
 @app.get("/vector-stores/status", tags=["Vector Stores"])
@@ -173,26 +194,104 @@ def get_vector_stores_status():
     """Get detailed status of all vector stores"""
     status_details = {}
     
-    for name, store in vector_stores.items():
-        path = VECTOR_STORE_PATHS[name]
+    for name, path in VECTOR_STORE_PATHS.items():
+        store = vectorstore_registry.peek(path)
+        handle_info = vectorstore_registry.handle_info(path) or {}
         status_details[name] = {
             "loaded": store is not None,
             "path": path,
             "path_exists": os.path.exists(path),
-            "store_type": type(store).__name__ if store else None
+            "version": handle_info.get("version"),
+            "published_version": current_version(path),
+            "loaded_at": handle_info.get("loaded_at"),
+            "in_flight": handle_info.get("in_flight"),
+            "store_type": type(store).__name__ if store else None,
+            "load_mode": getattr(store, "load_mode", None) if store else None,
+            "index_config": getattr(store, "index_config", None) if store else None,
+            "storage": storage_report(store.store_directory, store.index) if store else None
         }
     
     loaded_count = sum(1 for details in status_details.values() if details["loaded"])
+    memory_saved = sum(
+        (details["storage"] or {}).get("memory_saved_bytes", 0) for details in status_details.values()
+    )
     
     return {
         "summary": {
             "total_stores": len(status_details),
             "loaded_stores": loaded_count,
-            "failed_stores": len(status_details) - loaded_count
+            "failed_stores": len(status_details) - loaded_count,
+            "memory_saved_bytes": memory_saved
         },
+        "pool": vectorstore_registry.stats(),
+        "worker_pid": os.getpid(),
+        "embedding_model": embedding_provider.stats(),
         "details": status_details
     }
 
+@app.post("/vector-stores/reload", tags=["Vector Stores"])
+def reload_vector_stores(background_tasks: BackgroundTasks, name: str = None, force: bool = False, wait: bool = False):
+    """
+    Swap in the published version of one store (or all of them) on this worker.
+    The current version keeps serving until the new one is loaded.
+
+    Args:
+        name: Store name from VECTOR_STORE_PATHS, all stores if omitted
+        force: Reload even if the published version is already served
+        wait: Reload before responding instead of in the background
+    """
+    if name is not None and name not in VECTOR_STORE_PATHS:
+        raise HTTPException(status_code=404, detail=f"Unknown vector store: {name}")
+    names = [name] if name is not None else list(VECTOR_STORE_PATHS)
+
+    if not wait:
+        for store_name in names:
+            background_tasks.add_task(reload_vectorstore, VECTOR_STORE_PATHS[store_name], force)
+        return {"scheduled": names, "worker_pid": os.getpid()}
+
+    versions = {}
+    for store_name in names:
+        try:
+            versions[store_name] = reload_vectorstore(VECTOR_STORE_PATHS[store_name], force)
+        except Exception as e:
+            logger.error(f"❌ Failed to reload {store_name}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to reload {store_name}: {str(e)}")
+    return {"versions": versions, "worker_pid": os.getpid()}
+
+@app.get("/jobs", tags=["Jobs"])
+def list_jobs(type: str = None, status: str = None, limit: int = 50):
+    """Most recent background jobs, optionally of one type and/or status"""
+    return {"jobs": job_manager.store.list(type, status, min(max(1, limit), 500))}
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+def get_job(job_id: str):
+    """Status and progress of a background job started by one of the *_job endpoints"""
+    job = job_manager.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}/result", tags=["Jobs"])
+def get_job_result(job_id: str):
+    """The job's response body once it finished; 409 while it is still queued or running"""
+    job = job_manager.store.get(job_id, with_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if job["status"] not in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']} ({round(job['progress'] * 100)}%)")
+    return job
+
+@app.post("/jobs/{job_id}/cancel", tags=["Jobs"])
+def cancel_job(job_id: str):
+    """
+    Cancel a job. A queued job never starts; a running one stops at its next
+    checkpoint (between files, chunks or pipeline batches), on any worker.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
 @app.get("/logs/list", tags=["Logging"])
 def list_all_logs():
     """List all available log files"""
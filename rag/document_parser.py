@@ -0,0 +1,182 @@
+import os
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document
+
+# Parser processes per ingestion run; 0 uses one per CPU (capped at 8)
+DOCUMENT_PARSE_WORKERS = int(os.getenv("DOCUMENT_PARSE_WORKERS", "0"))
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_HEADING_STYLE = re.compile(r"^(?:heading|title)\s*(\d*)$", re.IGNORECASE)
+
+
+def _heading_level(paragraph) -> Optional[int]:
+    """Outline level of a heading paragraph (1 = top), or None for body text."""
+    outline = paragraph._p.find(f"{_W}pPr/{_W}outlineLvl")
+    if outline is not None:
+        level = int(outline.get(f"{_W}val", "9"))
+        return level + 1 if level < 9 else None
+
+    style = paragraph.style.name if paragraph.style is not None else ""
+    match = _HEADING_STYLE.match(style.strip())
+    if match is None:
+        return None
+    return int(match.group(1)) if match.group(1) else 1
+
+
+def _page_breaks(element, rendered: bool) -> Tuple[int, int]:
+    """
+    Page breaks inside a paragraph or table, split into those before its first
+    text and those after. Word records where it actually broke the pages
+    (lastRenderedPageBreak); files never laid out by Word only have explicit
+    breaks.
+    """
+    before = after = 0
+    seen_text = False
+    if not rendered and element.find(f"{_W}pPr/{_W}pageBreakBefore") is not None:
+        before += 1
+    for node in element.iter():
+        if node.tag == f"{_W}t":
+            seen_text = seen_text or bool((node.text or "").strip())
+        elif (node.tag == f"{_W}lastRenderedPageBreak") if rendered else (node.tag == f"{_W}br" and node.get(f"{_W}type") == "page"):
+            if seen_text:
+                after += 1
+            else:
+                before += 1
+    return before, after
+
+
+def _docx_blocks(file_path: str):
+    """
+    Yields (kind, text, heading level, page) for each paragraph and table of
+    the document body, in order. Tables become one line per row.
+    Raises ValueError when the file needs the Unstructured fallback.
+    """
+    from docx import Document as DocxDocument
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    docx_file = DocxDocument(file_path)
+    body = docx_file.element.body
+    # Text boxes and embedded documents are invisible to paragraph iteration
+    if next(body.iter(f"{_W}txbxContent"), None) is not None or next(body.iter(f"{_W}altChunk"), None) is not None:
+        raise ValueError("document has text boxes or embedded documents")
+
+    rendered = next(body.iter(f"{_W}lastRenderedPageBreak"), None) is not None
+    page = 1
+    for child in body.iterchildren():
+        if child.tag == f"{_W}p":
+            paragraph = Paragraph(child, docx_file)
+            before, after = _page_breaks(child, rendered)
+            # A break before any text moves the whole paragraph to the next page
+            page += before
+            text = paragraph.text.strip()
+            if text:
+                level = _heading_level(paragraph)
+                yield ("heading" if level else "paragraph", text, level, page)
+            page += after
+        elif child.tag == f"{_W}tbl":
+            table = Table(child, docx_file)
+            before, after = _page_breaks(child, rendered)
+            page += before
+            rows = []
+            for row in table.rows:
+                cells = list(dict.fromkeys(cell.text.strip() for cell in row.cells))
+                if any(cells):
+                    rows.append(" | ".join(cells))
+            if rows:
+                yield ("table", "\n".join(rows), None, page)
+            page += after
+
+
+def parse_docx(file_path: str, split_sections: bool = True) -> List[Document]:
+    """
+    Reads a DOCX directly with python-docx. With `split_sections`, returns one
+    Document per heading section, carrying its heading path and the pages it
+    spans; otherwise one Document for the whole file. Paragraphs are kept as
+    separate blocks (blank-line separated) so the splitter cuts between them.
+    """
+    source = os.path.basename(file_path)
+    sections = []
+    headings: List[str] = []
+    current = None
+    for kind, text, level, page in _docx_blocks(file_path):
+        if kind == "heading" and split_sections:
+            headings = headings[:level - 1] + [text]
+            current = None
+        if current is None:
+            current = {"blocks": [], "page": page, "page_end": page, "headings": list(headings)}
+            sections.append(current)
+        current["blocks"].append(text)
+        current["page_end"] = page
+
+    if not sections:
+        raise ValueError("no text found")
+
+    documents = []
+    for section_index, section in enumerate(sections):
+        documents.append(Document(
+            page_content="\n\n".join(section["blocks"]),
+            metadata={
+                "source": source,
+                "page": section["page"],
+                "page_end": section["page_end"],
+                "page_number": section["page"],
+                "section": section["headings"][-1] if section["headings"] else "",
+                "heading_path": " > ".join(section["headings"]),
+                "section_index": section_index,
+                "parser": "python-docx"
+            }
+        ))
+    return documents
+
+
+def parse_with_unstructured(file_path: str) -> List[Document]:
+    from langchain_community.document_loaders import UnstructuredFileLoader
+
+    documents = UnstructuredFileLoader(file_path).load()
+    for i, doc in enumerate(documents):
+        doc.metadata["source"] = os.path.basename(file_path)
+        doc.metadata["page_number"] = i + 1
+        doc.metadata["parser"] = "unstructured"
+    return documents
+
+
+def parse_document(file_path: str, split_sections: bool = True) -> List[Document]:
+    """python-docx for plain DOCX files, Unstructured for anything it cannot read fully."""
+    if file_path.lower().endswith(".docx"):
+        try:
+            return parse_docx(file_path, split_sections)
+        except Exception as e:
+            print(f"⚠️ Fast DOCX parsing failed for {os.path.basename(file_path)} ({e}), using Unstructured.")
+    return parse_with_unstructured(file_path)
+
+
+def default_parse_workers() -> int:
+    return DOCUMENT_PARSE_WORKERS or min(8, os.cpu_count() or 1)
+
+
+def _parse_worker(args) -> List[Document]:
+    return parse_document(*args)
+
+
+def parse_documents(file_paths: List[str], split_sections: bool = True, max_workers: Optional[int] = None) -> List[Document]:
+    """
+    Parses files across a process pool; documents come back in file order.
+    Workers are spawned rather than forked, so the pool is safe to start from
+    a server process that already runs model and FAISS threads.
+    """
+    if not file_paths:
+        return []
+
+    max_workers = max_workers or default_parse_workers()
+    max_workers = min(max_workers, len(file_paths))
+    if max_workers <= 1:
+        return [doc for file_path in file_paths for doc in parse_document(file_path, split_sections)]
+
+    print(f"📚 Parsing {len(file_paths)} files with {max_workers} processes...")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        parsed = pool.map(_parse_worker, [(file_path, split_sections) for file_path in file_paths])
+        return [doc for documents in parsed for doc in documents]
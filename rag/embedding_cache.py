@@ -0,0 +1,171 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+
+# SQLite limits the number of bound parameters per statement
+_BATCH = 500
+# Least recently used vectors are dropped beyond this many bytes of vectors (0 = no limit)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Vectors not used for this many days are dropped; 0 keeps them forever
+EMBEDDING_CACHE_MAX_AGE_DAYS = float(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", "90"))
+# A hit refreshes an entry's last use at most this often, so reads rarely write
+_TOUCH_INTERVAL = 24 * 3600
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """
+    On-disk cache of document (chunk) vectors keyed by (model id, sha256 of
+    the chunk text), stored as float32 blobs in SQLite.
+
+    The same regulation files are ingested into several stores; with this
+    cache every distinct chunk is embedded once per model and later builds
+    read the vectors back instead of running the model. The database runs in
+    WAL mode, so ingestion in several worker processes can share it.
+
+    Each entry records when it was last used: entries older than
+    `max_age_days` are dropped when the cache is opened, and `prune` drops
+    the least recently used ones until the vectors fit `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES, max_age_days: float = EMBEDDING_CACHE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on first use and drops expired vectors. Caller holds `_lock`."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                " model_id TEXT NOT NULL, text_hash TEXT NOT NULL, dimension INTEGER NOT NULL, vector BLOB NOT NULL,"
+                " used_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (model_id, text_hash)) WITHOUT ROWID"
+            )
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(chunk_embeddings)")}
+            if "used_at" not in columns:
+                # Caches from before the limits: count every entry as used now
+                connection.execute("ALTER TABLE chunk_embeddings ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+                connection.execute("UPDATE chunk_embeddings SET used_at = ?", (time.time(),))
+            connection.execute("CREATE INDEX IF NOT EXISTS chunk_embeddings_used_at ON chunk_embeddings (used_at)")
+            if self.max_age_days > 0:
+                connection.execute("DELETE FROM chunk_embeddings WHERE used_at < ?", (time.time() - self.max_age_days * 86400,))
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def get_many(self, model_id: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Cached vectors for the given text hashes; missing ones are left out."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(unique), _BATCH):
+                batch = unique[start:start + _BATCH]
+                rows = connection.execute(
+                    f"SELECT text_hash, vector FROM chunk_embeddings WHERE model_id = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model_id, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                keys = list(found)
+                for start in range(0, len(keys), _BATCH):
+                    batch = keys[start:start + _BATCH]
+                    connection.execute(
+                        f"UPDATE chunk_embeddings SET used_at = ? WHERE model_id = ? AND used_at < ?"
+                        f" AND text_hash IN ({','.join('?' * len(batch))})",
+                        [now, model_id, now - _TOUCH_INTERVAL, *batch]
+                    )
+                connection.commit()
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model_id: str, vectors: Dict[str, List[float]]):
+        rows = []
+        now = time.time()
+        for key, vector in vectors.items():
+            vector = np.asarray(vector, dtype=np.float32)
+            rows.append((model_id, key, len(vector), vector.tobytes(), now))
+        if not rows:
+            return
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR IGNORE INTO chunk_embeddings (model_id, text_hash, dimension, vector, used_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            connection.commit()
+            self.writes += len(rows)
+
+    def clear(self, model_id: Optional[str] = None):
+        """Deletes the cached vectors of one model, or of every model."""
+        with self._lock:
+            connection = self._connect()
+            if model_id is None:
+                connection.execute("DELETE FROM chunk_embeddings")
+            else:
+                connection.execute("DELETE FROM chunk_embeddings WHERE model_id = ?", (model_id,))
+            connection.commit()
+
+    def prune(self) -> int:
+        """
+        Drops least recently used vectors until they fit `max_bytes`. Freed
+        pages are reused by later writes, so the file stops growing rather
+        than shrinking. Returns the number of entries dropped.
+        """
+        if not self.max_bytes:
+            return 0
+        with self._lock:
+            connection = self._connect()
+            excess = connection.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM chunk_embeddings").fetchone()[0] - self.max_bytes
+            if excess <= 0:
+                return 0
+            victims = []
+            cursor = connection.execute("SELECT model_id, text_hash, LENGTH(vector) FROM chunk_embeddings ORDER BY used_at")
+            for model_id, key, size in cursor:
+                victims.append((model_id, key))
+                excess -= size
+                if excess <= 0:
+                    break
+            cursor.close()
+            connection.executemany("DELETE FROM chunk_embeddings WHERE model_id = ? AND text_hash = ?", victims)
+            connection.commit()
+        print(f"🧹 Dropped {len(victims)} least recently used vectors from the embedding cache.")
+        return len(victims)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "max_bytes": self.max_bytes,
+                "max_age_days": self.max_age_days,
+                "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            }
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from typing import Optional
+from dotenv import load_dotenv
+from langchain_huggingface import HuggingFaceEmbeddings
+from rag.query_cache import CachedQueryEmbeddings, QueryEmbeddingCache
+from rag.embedding_cache import ChunkEmbeddingCache
+from utils.memory import current_rss_bytes
+
+load_dotenv()
+
+# Embedding settings, shared by ingestion and retrieval
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", "0"))  # 0 keeps the torch default
+EMBEDDING_NORMALIZE = os.getenv("EMBEDDING_NORMALIZE", "false").lower() == "true"
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+# "torch" runs sentence-transformers, "onnx" an int8-quantized ONNX Runtime export
+# of the same model, made ahead of time (see rag.onnx_embeddings and the Dockerfile)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# On-disk chunk vectors shared by every store and worker; empty disables it
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./database/embedding_cache.sqlite")
+
+
+class EmbeddingProvider:
+    """
+    Loads the sentence-transformers model once per process and hands the same
+    instance to every vectorstore, search and ingestion run.
+
+    Query embeddings go through an LRU cache keyed by the model id, which is
+    cleared whenever the model is swapped with `set_model`. Document
+    embeddings go through a persistent cache keyed by (model id, chunk hash),
+    so a chunk already embedded for one store is not embedded again.
+
+    With the "onnx" backend the model runs through ONNX Runtime with int8
+    weights from an export made at image build. Loading fails if the export
+    is missing or did not match the PyTorch vectors within tolerance, rather
+    than exporting or loading torch in every worker.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        num_threads: int = EMBEDDING_NUM_THREADS,
+        normalize: bool = EMBEDDING_NORMALIZE,
+        query_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+        backend: str = EMBEDDING_BACKEND,
+        document_cache_path: str = EMBEDDING_CACHE_PATH
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.normalize = normalize
+        self.requested_backend = backend
+        # Backend actually serving, set on load
+        self.backend = backend
+
+        self.query_cache = QueryEmbeddingCache(max_size=query_cache_size)
+        self.document_cache = ChunkEmbeddingCache(document_cache_path) if document_cache_path else None
+        self._embeddings: Optional[CachedQueryEmbeddings] = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.rss_before_load: Optional[int] = None
+        self.rss_after_load: Optional[int] = None
+
+    def _load_torch(self) -> HuggingFaceEmbeddings:
+        if self.num_threads > 0:
+            import torch
+            torch.set_num_threads(self.num_threads)
+
+        return HuggingFaceEmbeddings(
+            model_name=self.model_name,
+            encode_kwargs={
+                "batch_size": self.batch_size,
+                "normalize_embeddings": self.normalize
+            }
+        )
+
+    def _load(self):
+        print(f"🧠 Loading embedding model {self.model_name} ({self.requested_backend})...")
+        self.rss_before_load = current_rss_bytes()
+        started = time.perf_counter()
+
+        self.backend = self.requested_backend
+        if self.requested_backend == "onnx":
+            from rag.onnx_embeddings import load_onnx_embeddings
+            embeddings = load_onnx_embeddings(self.model_name, self.batch_size, self.num_threads, self.normalize)
+        else:
+            embeddings = self._load_torch()
+
+        self.load_seconds = time.perf_counter() - started
+        self.rss_after_load = current_rss_bytes()
+        print(f"✅ Embedding model loaded in {self.load_seconds:.2f}s ({self.backend}).")
+        return embeddings
+
+    def get(self) -> CachedQueryEmbeddings:
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = CachedQueryEmbeddings(
+                        self._load(), model_id=self.model_id, cache=self.query_cache, document_cache=self.document_cache
+                    )
+        return self._embeddings
+
+    @property
+    def model_id(self) -> str:
+        # ONNX int8 vectors differ slightly from torch ones, so they never share cache entries
+        backend = "" if self.backend == "torch" else f"|backend={self.backend}"
+        return f"{self.model_name}|normalize={self.normalize}{backend}"
+
+    def set_model(self, model_name: str):
+        """Swaps the embedding model in place and drops every cached query vector."""
+        with self._lock:
+            self.model_name = model_name
+            model = self._load()
+            if self._embeddings is None:
+                self._embeddings = CachedQueryEmbeddings(
+                    model, model_id=self.model_id, cache=self.query_cache, document_cache=self.document_cache
+                )
+            else:
+                self._embeddings.embeddings = model
+                self._embeddings.model_id = self.model_id
+            self.query_cache.invalidate()
+
+    def use_embeddings(self, embeddings, model_id: str):
+        """Serves an already-built embeddings object (e.g. a hashing model in benchmarks) instead of loading one."""
+        with self._lock:
+            self.model_name = model_id
+            self._embeddings = CachedQueryEmbeddings(
+                embeddings, model_id=model_id, cache=self.query_cache, document_cache=self.document_cache
+            )
+            self.query_cache.invalidate()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._embeddings is not None
+
+    def stats(self) -> dict:
+        model_rss = None
+        if self.rss_before_load is not None and self.rss_after_load is not None:
+            model_rss = max(0, self.rss_after_load - self.rss_before_load)
+
+        return {
+            "model_name": self.model_name,
+            "backend": self.backend,
+            "loaded": self.is_loaded,
+            "batch_size": self.batch_size,
+            "num_threads": self.num_threads,
+            "normalize": self.normalize,
+            "load_seconds": self.load_seconds,
+            "model_rss_bytes": model_rss,
+            "process_rss_bytes": current_rss_bytes(),
+            "query_cache": self.query_cache.stats(),
+            "document_cache": self.document_cache.stats() if self.document_cache is not None else None
+        }
+
+
+embedding_provider = EmbeddingProvider()
+
+
+def get_embeddings() -> CachedQueryEmbeddings:
+    return embedding_provider.get()
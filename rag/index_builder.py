@@ -0,0 +1,624 @@
+import os
+import json
+import math
+import time
+import uuid
+import threading
+import faiss
+import numpy as np
+from typing import List, Optional, Tuple
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+# Written next to index.faiss / index.pkl
+INDEX_CONFIG_FILE = "index_config.json"
+INDEX_REPORT_FILE = "index_report.json"
+# Full-precision float32 copy of the vectors, only written when re-ranking is enabled
+VECTORS_FILE = "vectors.npy"
+# Sorted FAISS id of each docstore position, and for IVF indexes where each
+# position's code sits (list << 32 | offset), so workers memory-map them
+FAISS_IDS_FILE = "faiss_ids.npy"
+IVF_LOCATIONS_FILE = "ivf_locations.npy"
+# L2 norm of each position's vector, so similarity scores follow from the search distances
+VECTOR_NORMS_FILE = "vector_norms.npy"
+
+# Vectors added to (or compared against) an index per call, so memory-mapped inputs are read in slices
+ADD_BATCH_SIZE = int(os.getenv("INDEX_ADD_BATCH_SIZE", "65536"))
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+COMPRESSIONS = ("none", "fp16", "sq8", "pq")
+# FAISS wants ~39 training points per centroid, i.e. 39 * 2^nbits per PQ code book;
+# stores too small for 2^PQ_MIN_NBITS centroids fall back to SQ8
+PQ_POINTS_PER_CENTROID = 39
+PQ_MIN_NBITS = 4
+
+
+def default_nlist(num_vectors: int) -> int:
+    """~4*sqrt(n) centroids, capped so each centroid still gets ~39 training points."""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def _pq_sub_quantizers(dimension: int, requested: int) -> int:
+    """Largest divisor of `dimension` not above `requested` (PQ needs d % m == 0)."""
+    for m in range(min(requested, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def _storage_factory(config: dict) -> Optional[str]:
+    """Factory suffix for the vector codes, or None for plain float32."""
+    compression = config["compression"]
+    if compression == "fp16":
+        return "SQfp16"
+    if compression == "sq8":
+        return "SQ8"
+    if compression == "pq":
+        return f"PQ{config['pq_m']}x{config['pq_nbits']}"
+    return None
+
+
+def build_index_config(
+    num_vectors: int,
+    dimension: int,
+    index_type: str = "flat",
+    nlist: Optional[int] = None,
+    nprobe: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+    ef_search: int = 64,
+    compression: str = "none",
+    pq_m: int = 48,
+    pq_nbits: int = 8,
+    rerank: bool = False,
+    rerank_factor: int = 4
+) -> dict:
+    index_type = (index_type or "flat").lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index_type '{index_type}', expected one of {INDEX_TYPES}")
+
+    compression = (compression or "none").lower()
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression '{compression}', expected one of {COMPRESSIONS}")
+
+    config = {
+        "index_type": index_type,
+        "dimension": dimension,
+        "num_vectors": num_vectors,
+        "compression": compression,
+        "rerank": bool(rerank) and compression != "none",
+        "rerank_factor": max(1, rerank_factor)
+    }
+
+    if compression == "pq":
+        nbits = min(pq_nbits, int(math.floor(math.log2(max(1, num_vectors) / PQ_POINTS_PER_CENTROID))))
+        if nbits < PQ_MIN_NBITS:
+            print(f"⚠️ {num_vectors} vectors are too few to train PQ code books, using SQ8 instead.")
+            compression = config["compression"] = "sq8"
+        else:
+            config["pq_m"] = _pq_sub_quantizers(dimension, pq_m)
+            config["pq_nbits"] = nbits
+
+    storage = _storage_factory(config)
+
+    if index_type == "ivf":
+        nlist = min(nlist or default_nlist(num_vectors), max(1, num_vectors))
+        config.update({"nlist": nlist, "nprobe": min(nprobe, nlist), "factory": f"IVF{nlist},{storage or 'Flat'}"})
+    elif index_type == "hnsw":
+        config.update({
+            "hnsw_m": hnsw_m,
+            "ef_construction": ef_construction,
+            "ef_search": ef_search,
+            "factory": f"HNSW{hnsw_m}" + (f"_{storage}" if storage else "")
+        })
+    else:
+        config["factory"] = storage or "Flat"
+
+    return config
+
+
+def apply_search_params(index, config: dict):
+    """Restores the query-time parameters (nprobe / efSearch) recorded in `config`."""
+    params = faiss.ParameterSpace()
+    if config.get("index_type") == "ivf":
+        params.set_index_parameter(index, "nprobe", int(config["nprobe"]))
+    elif config.get("index_type") == "hnsw":
+        params.set_index_parameter(index, "efSearch", int(config["ef_search"]))
+
+
+def filtered_search_params(config: Optional[dict], positions: np.ndarray, ids: Optional[np.ndarray] = None):
+    """
+    Search parameters that restrict a FAISS search to `positions`, carrying the
+    store's nprobe / efSearch (per-call parameters replace the index's own).
+    Returns the parameters and the selector, which must outlive the search.
+    """
+    config = config or {}
+    positions = np.asarray(positions, dtype=np.int64)
+    selected = ids[positions] if ids is not None else positions
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(selected, dtype=np.int64))
+    if config.get("index_type") == "ivf":
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=int(config["nprobe"]))
+    elif config.get("index_type") == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=int(config["ef_search"]))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return params, selector
+
+
+def training_sample(vectors: np.ndarray, config: dict, seed: int = 0) -> np.ndarray:
+    """
+    Vectors to train the quantizers on: all of them for small stores, else a
+    random sample large enough for the IVF centroids (256 points each) and
+    the PQ code books. Rows are read in sorted order, which keeps reads from
+    a memory-mapped array sequential.
+    """
+    needed = max(ADD_BATCH_SIZE, 256 * int(config.get("nlist", 1)), 256 * 2 ** int(config.get("pq_nbits", 0)))
+    if len(vectors) <= needed:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    sample = np.sort(np.random.default_rng(seed).choice(len(vectors), size=needed, replace=False))
+    return np.ascontiguousarray(vectors[sample], dtype=np.float32)
+
+
+def add_vectors(index, vectors: np.ndarray, ids: Optional[np.ndarray] = None, batch_size: int = ADD_BATCH_SIZE):
+    """Adds `vectors` (optionally under `ids`) in slices of `batch_size` rows."""
+    for start in range(0, len(vectors), batch_size):
+        batch = np.ascontiguousarray(vectors[start:start + batch_size], dtype=np.float32)
+        if ids is None:
+            index.add(batch)
+        else:
+            index.add_with_ids(batch, np.ascontiguousarray(ids[start:start + batch_size], dtype=np.int64))
+
+
+def build_faiss_index(vectors: np.ndarray, config: dict, ids: Optional[np.ndarray] = None):
+    """
+    Builds and fills the index described by `config`. With `ids`, vectors are
+    stored under those stable ids instead of their positions: IVF indexes keep
+    them natively, other types are wrapped in an IndexIDMap2.
+    `vectors` may be memory-mapped: training uses a sample and vectors are
+    added in slices, so only the index itself has to fit in memory.
+    """
+    index = faiss.index_factory(config["dimension"], config["factory"])
+
+    if config["index_type"] == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = int(config["ef_construction"])
+
+    if not index.is_trained:
+        sample = training_sample(vectors, config)
+        print(f"🎯 Training {config['factory']} on {len(sample)} of {len(vectors)} vectors...")
+        index.train(sample)
+        del sample
+
+    if ids is not None and config["index_type"] != "ivf":
+        index = faiss.IndexIDMap2(index)
+    add_vectors(index, vectors, ids)
+    apply_search_params(index, config)
+    return index
+
+
+def _ivf_entries(ivf) -> Tuple[np.ndarray, np.ndarray]:
+    """Ids stored in an IVF index's inverted lists, with the (list << 32 | offset) location of each."""
+    invlists = ivf.invlists
+    ids, locations = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            list_ids = invlists.get_ids(list_no)
+            ids.append(faiss.rev_swig_ptr(list_ids, size).astype(np.int64))
+            invlists.release_ids(list_no, list_ids)
+            locations.append((np.int64(list_no) << 32) | np.arange(size, dtype=np.int64))
+    return np.concatenate(ids), np.concatenate(locations)
+
+
+def stored_ids(index) -> Optional[np.ndarray]:
+    """
+    Sorted ids of the vectors in `index`, i.e. the id of each docstore
+    position. None when the ids are the positions themselves (stores built
+    in one go), so the common case needs no translation.
+    """
+    index = faiss.downcast_index(index)
+    if hasattr(index, "id_map"):
+        ids = faiss.vector_to_array(index.id_map)
+    else:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            return None
+        ids, _ = _ivf_entries(ivf)
+
+    ids = np.sort(ids.astype(np.int64))
+    return None if _sequential(ids) else ids
+
+
+def _sequential(ids: np.ndarray) -> bool:
+    """Whether sorted unique `ids` are 0..n-1; only the ends are read, so memory-mapped ids stay on disk."""
+    return len(ids) == 0 or (ids[0] == 0 and ids[-1] == len(ids) - 1)
+
+
+def save_id_layout(path: str, index):
+    """
+    Writes the sorted ids of `index` and, for IVF indexes, the location of
+    every docstore position's code. Loading them memory-mapped replaces
+    `stored_ids` and the IVF direct map, which are private to each worker.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ids, locations = _ivf_entries(ivf)
+        order = np.argsort(ids, kind="stable")
+        np.save(os.path.join(path, IVF_LOCATIONS_FILE), locations[order])
+        ids = ids[order]
+    else:
+        ids = stored_ids(index)
+        if ids is None:
+            ids = np.arange(index.ntotal, dtype=np.int64)
+    np.save(os.path.join(path, FAISS_IDS_FILE), ids)
+
+
+def load_id_layout(path: str, index, use_mmap: bool = False) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    The store's (ids, ivf_locations), memory-mapped with `use_mmap`. ids is
+    None when they are the positions themselves. Stores saved without the
+    files get their ids computed (private memory) and no locations.
+    """
+    ids_path = os.path.join(path, FAISS_IDS_FILE)
+    if not os.path.exists(ids_path):
+        return stored_ids(index), None
+    mode = "r" if use_mmap else None
+    ids = np.load(ids_path, mmap_mode=mode)
+    if len(ids) != index.ntotal:
+        raise ValueError(f"❌ {ids_path} has {len(ids)} ids, the index has {index.ntotal} vectors.")
+    locations_path = os.path.join(path, IVF_LOCATIONS_FILE)
+    locations = np.load(locations_path, mmap_mode=mode) if os.path.exists(locations_path) else None
+    return (None if _sequential(ids) else ids), locations
+
+
+def ids_to_positions(ids: Optional[np.ndarray], labels: np.ndarray) -> np.ndarray:
+    """Maps FAISS result ids to docstore positions; -1 stays -1."""
+    if ids is None:
+        return labels
+    positions = np.minimum(np.searchsorted(ids, labels), len(ids) - 1)
+    return np.where((labels >= 0) & (ids[positions] == labels), positions, -1)
+
+
+def update_faiss_index(index, config: dict, removed_ids: np.ndarray, vectors: np.ndarray, new_ids: np.ndarray,
+                       full_vectors: Optional[np.ndarray] = None):
+    """
+    Deletes `removed_ids` and appends `vectors` under `new_ids`; every other
+    vector keeps its id, so nothing unchanged is re-embedded or re-trained.
+    HNSW graphs cannot delete, so when anything is removed they are rebuilt
+    from the remaining stored vectors (exact with `full_vectors` or flat
+    storage, decoded from the codes otherwise). Returns the updated index.
+    """
+    removed_ids = np.asarray(removed_ids, dtype=np.int64)
+    new_ids = np.asarray(new_ids, dtype=np.int64)
+
+    if len(removed_ids) and config["index_type"] == "hnsw":
+        ids = stored_ids(index)
+        all_ids = ids if ids is not None else np.arange(index.ntotal, dtype=np.int64)
+        kept = np.flatnonzero(~np.isin(all_ids, removed_ids))
+        print(f"🔁 Rebuilding HNSW graph from {len(kept)} stored vectors...")
+        kept_vectors = reconstruct_vectors(index, kept, full_vectors, ids)
+        return build_faiss_index(
+            np.vstack([kept_vectors, np.asarray(vectors, dtype=np.float32)]), config, np.concatenate([all_ids[kept], new_ids])
+        )
+
+    if len(removed_ids):
+        index.remove_ids(faiss.IDSelectorBatch(np.ascontiguousarray(removed_ids)))
+    add_vectors(index, vectors, new_ids)
+    return index
+
+
+def search_vectors(index, queries: np.ndarray, k: int, config: Optional[dict] = None, full_vectors: Optional[np.ndarray] = None, params=None,
+                   ids: Optional[np.ndarray] = None):
+    """
+    `index.search`, plus re-ranking for compressed stores: when the config asks
+    for it and full-precision vectors are available, fetch `rerank_factor * k`
+    candidates and re-order them by exact L2 distance.
+    `params` (see `filtered_search_params`) restricts the search to an id set.
+    Hits are returned as docstore positions, translated through `ids` (see
+    `stored_ids`) for incrementally updated stores.
+    """
+    if not config or not config.get("rerank") or full_vectors is None:
+        distances, labels = index.search(queries, k, params=params)
+        return distances, ids_to_positions(ids, labels)
+
+    fetch_k = min(k * int(config.get("rerank_factor", 4)), index.ntotal)
+    _, candidates = index.search(queries, fetch_k, params=params)
+    candidates = ids_to_positions(ids, candidates)
+
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    indices = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, ids) in enumerate(zip(queries, candidates)):
+        ids = ids[ids >= 0]
+        if len(ids) == 0:
+            continue
+        # Sorted ids keep the memory-mapped reads sequential
+        ids = np.sort(ids)
+        exact = np.sum((np.asarray(full_vectors[ids], dtype=np.float32) - query) ** 2, axis=1)
+        order = np.argsort(exact)[:k]
+        distances[row, :len(order)] = exact[order]
+        indices[row, :len(order)] = ids[order]
+    return distances, indices
+
+
+_direct_map_lock = threading.Lock()
+
+
+def reconstruct_vectors(index, positions: np.ndarray, full_vectors: Optional[np.ndarray] = None,
+                        ids: Optional[np.ndarray] = None, ivf_locations: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Stored vectors at docstore `positions`: exact rows of the full-precision
+    copy when there is one, otherwise decoded from the index. IVF codes are
+    read at their `ivf_locations` (see `save_id_layout`); without them the
+    index gets its id map built on first use (8 bytes per vector, a hash
+    table when incremental updates left the ids non-sequential).
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if full_vectors is not None:
+        order = np.argsort(positions)
+        rows = np.empty((len(positions), full_vectors.shape[1]), dtype=np.float32)
+        rows[order] = full_vectors[positions[order]]
+        return rows
+
+    ivf = faiss.try_extract_index_ivf(index) if ivf_locations is not None else None
+    if ivf is not None:
+        rows = np.empty((len(positions), index.d), dtype=np.float32)
+        for row, location in enumerate(np.asarray(ivf_locations[positions], dtype=np.int64)):
+            ivf.reconstruct_from_offset(int(location >> 32), int(location & 0xFFFFFFFF), faiss.swig_ptr(rows[row]))
+        return rows
+
+    keys = ids[positions] if ids is not None else positions
+    try:
+        return index.reconstruct_batch(keys)
+    except RuntimeError:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None:
+            raise
+        with _direct_map_lock:
+            if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                try:
+                    ivf.make_direct_map()
+                except RuntimeError:
+                    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index.reconstruct_batch(keys)
+
+
+def _search_latencies(index, queries: np.ndarray, k: int, config=None, full_vectors=None) -> Tuple[np.ndarray, List[float]]:
+    latencies = []
+    all_ids = []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = search_vectors(index, query.reshape(1, -1), k, config, full_vectors)
+        latencies.append((time.perf_counter() - started) * 1000)
+        all_ids.append(ids[0])
+    return np.array(all_ids), latencies
+
+
+def _latency_summary(latencies: List[float]) -> dict:
+    return {
+        "mean_ms": round(float(np.mean(latencies)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4)
+    }
+
+
+def _exact_search(vectors: np.ndarray, queries: np.ndarray, k: int, block_size: int = ADD_BATCH_SIZE) -> Tuple[np.ndarray, List[float]]:
+    """
+    Exact top-k ids and per-query latency of flat search over `vectors`,
+    computed block by block so a memory-mapped array is never loaded whole.
+    A query's latency is the sum of its searches over every block.
+    """
+    heap = faiss.ResultHeap(len(queries), k)
+    latencies = np.zeros(len(queries))
+    for start in range(0, len(vectors), block_size):
+        block = faiss.IndexFlatL2(vectors.shape[1])
+        block.add(np.ascontiguousarray(vectors[start:start + block_size], dtype=np.float32))
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        labels = np.empty((len(queries), k), dtype=np.int64)
+        for row, query in enumerate(queries):
+            started = time.perf_counter()
+            distances[row:row + 1], labels[row:row + 1] = block.search(query.reshape(1, -1), k)
+            latencies[row] += (time.perf_counter() - started) * 1000
+        heap.add_result(distances, np.where(labels >= 0, labels + start, -1))
+    heap.finalize()
+    return heap.I, latencies.tolist()
+
+
+def evaluate_index(index, vectors: np.ndarray, config: dict, num_queries: int = 100, k: int = 10, seed: int = 0) -> dict:
+    """
+    Recall@k and per-query latency of `index` against exact flat search,
+    using a random sample of the indexed vectors as queries.
+    """
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False))
+    queries = np.ascontiguousarray(vectors[sample], dtype=np.float32)
+
+    exact_ids, exact_latencies = _exact_search(vectors, queries, k)
+    approx_ids, approx_latencies = _search_latencies(index, queries, k, config, vectors)
+
+    recall = np.mean([
+        len(set(a[a >= 0]) & set(e[e >= 0])) / max(1, len(e[e >= 0]))
+        for a, e in zip(approx_ids, exact_ids)
+    ])
+
+    return {
+        "index": config,
+        "k": k,
+        "num_queries": len(queries),
+        f"recall_at_{k}": round(float(recall), 4),
+        "latency": _latency_summary(approx_latencies),
+        "flat_latency": _latency_summary(exact_latencies)
+    }
+
+
+def build_vectorstore(documents, embeddings, stable_ids: bool = False, **index_options) -> Tuple[FAISS, dict, dict]:
+    """
+    Embeds `documents` and wraps the chosen FAISS index in a LangChain store.
+    With `stable_ids`, the index stores explicit ids (0..n-1) so later
+    incremental updates can remove and add vectors (see `update_faiss_index`).
+    Returns the store, its index config and the recall/latency report.
+    """
+    texts = [doc.page_content for doc in documents]
+    vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+
+    config = build_index_config(len(vectors), vectors.shape[1], **index_options)
+    index = build_faiss_index(vectors, config, np.arange(len(vectors)) if stable_ids else None)
+    report = evaluate_index(index, vectors, config)
+
+    ids = [str(uuid.uuid4()) for _ in documents]
+    db = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, documents))),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+    db.index_config = config
+    db.full_vectors = vectors if config["rerank"] else None
+    return db, config, report
+
+
+def read_faiss_index(path: str, config: Optional[dict] = None, use_mmap: bool = False):
+    """
+    Reads `index.faiss`, optionally memory-mapped read-only so every worker
+    process shares the same page-cache pages instead of a private copy.
+    IVF indexes map their inverted lists; flat, SQ, PQ and HNSW indexes map
+    their code arrays. Falls back to a normal read if mmap is not supported.
+    Returns the index and whether it is memory-mapped.
+    """
+    index_path = os.path.join(path, "index.faiss")
+    if use_mmap:
+        if (config or {}).get("index_type") == "ivf":
+            flags = faiss.IO_FLAG_MMAP
+        else:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(index_path, flags | faiss.IO_FLAG_READ_ONLY), True
+        except RuntimeError as e:
+            print(f"⚠️ Could not memory-map {index_path}, reading it into memory: {e}")
+    return faiss.read_index(index_path), False
+
+
+def mapped_code_bytes(index) -> int:
+    """
+    Bytes of `index` that `read_faiss_index` leaves memory-mapped: the codes,
+    plus the list ids for IVF and the neighbor graph for HNSW.
+    """
+    index = faiss.downcast_index(index)
+    if hasattr(index, "id_map"):
+        index = faiss.downcast_index(index.index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return int(ivf.ntotal) * (int(ivf.code_size) + 8)
+    mapped = 0
+    if hasattr(index, "hnsw"):
+        mapped += int(index.hnsw.neighbors.size()) * 4
+        index = faiss.downcast_index(index.storage)
+    return mapped + int(index.ntotal) * int(getattr(index, "code_size", 0))
+
+
+def index_private_bytes(path: str, index, mapped: bool) -> int:
+    """Approximate private memory of a loaded index: its serialized size, less the mapped part."""
+    size = os.path.getsize(os.path.join(path, "index.faiss"))
+    return max(0, size - mapped_code_bytes(index)) if mapped else size
+
+
+def save_full_vectors(path: str, vectors: np.ndarray):
+    np.save(os.path.join(path, VECTORS_FILE), np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+def write_full_vectors(path: str, parts: List[Tuple[np.ndarray, Optional[np.ndarray]]], batch_size: int = ADD_BATCH_SIZE) -> int:
+    """
+    Writes the re-ranking copy from `(vectors, rows)` parts, in order: the
+    given rows of each (memory-mapped) array, or all of them when rows is
+    None. Copies one slice at a time. Returns the number of rows written.
+    """
+    parts = [(vectors, np.arange(len(vectors)) if rows is None else np.asarray(rows, dtype=np.int64)) for vectors, rows in parts]
+    total = sum(len(rows) for _, rows in parts)
+    target = np.lib.format.open_memmap(
+        os.path.join(path, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(total, parts[0][0].shape[1])
+    )
+    row = 0
+    for vectors, rows in parts:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            target[row:row + len(batch)] = vectors[batch]
+            row += len(batch)
+    target.flush()
+    del target
+    return total
+
+
+def load_full_vectors(path: str) -> Optional[np.ndarray]:
+    """Memory-maps the float32 vectors so re-ranking only pages in the rows it reads."""
+    vectors_path = os.path.join(path, VECTORS_FILE)
+    if not os.path.exists(vectors_path):
+        return None
+    return np.load(vectors_path, mmap_mode="r")
+
+
+def vector_norms(vectors: np.ndarray, batch_size: int = ADD_BATCH_SIZE) -> np.ndarray:
+    """L2 norm of every row, computed slice by slice so a memory-mapped array is never loaded whole."""
+    norms = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), batch_size):
+        norms[start:start + batch_size] = np.linalg.norm(np.asarray(vectors[start:start + batch_size], dtype=np.float32), axis=1)
+    return norms
+
+
+def save_vector_norms(path: str, norms: np.ndarray):
+    np.save(os.path.join(path, VECTOR_NORMS_FILE), np.ascontiguousarray(norms, dtype=np.float32))
+
+
+def load_vector_norms(path: str) -> Optional[np.ndarray]:
+    """Memory-maps the vector norms; None for stores built before they were saved."""
+    norms_path = os.path.join(path, VECTOR_NORMS_FILE)
+    if not os.path.exists(norms_path):
+        return None
+    return np.load(norms_path, mmap_mode="r")
+
+
+def cosine_from_distances(distances: np.ndarray, query_norm: float, norms: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity from squared L2 search distances and the vector norms:
+    |q - x|^2 = |q|^2 + |x|^2 - 2 q.x. For compressed stores the distance is
+    to the decoded vector, so the score is as approximate as the search.
+    """
+    norms = np.asarray(norms, dtype=np.float32)
+    dots = (query_norm ** 2 + norms ** 2 - np.asarray(distances, dtype=np.float32)) / 2
+    return dots / np.maximum(norms * query_norm, 1e-12)
+
+
+def storage_report(path: str, index) -> dict:
+    """On-disk index size against a plain float32 copy of the same vectors."""
+    index_path = os.path.join(path, "index.faiss")
+    index_bytes = os.path.getsize(index_path) if os.path.exists(index_path) else None
+    float32_bytes = int(index.ntotal) * int(index.d) * 4
+
+    report = {"index_bytes": index_bytes, "float32_bytes": float32_bytes}
+    if index_bytes:
+        report["memory_saved_bytes"] = max(0, float32_bytes - index_bytes)
+        report["compression_ratio"] = round(float32_bytes / index_bytes, 2)
+    return report
+
+
+def save_index_config(path: str, config: dict, report: Optional[dict] = None):
+    with open(os.path.join(path, INDEX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    if report is not None:
+        with open(os.path.join(path, INDEX_REPORT_FILE), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load_index_config(path: str) -> Optional[dict]:
+    """Returns the stored index config, or None for stores built before it existed (flat)."""
+    config_path = os.path.join(path, INDEX_CONFIG_FILE)
+    if not os.path.exists(config_path):
+        return None
+    with open(config_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_index_report(path: str) -> Optional[dict]:
+    report_path = os.path.join(path, INDEX_REPORT_FILE)
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path, "r", encoding="utf-8") as f:
+        return json.load(f)
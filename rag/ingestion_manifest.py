@@ -0,0 +1,47 @@
+import os
+import json
+import hashlib
+from typing import Optional
+
+# Written next to the build's index files; records what each ingested file contributed
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def classify_file(previous_files: dict, filename: str, sha256: str, metadata: dict) -> str:
+    """
+    "added", "changed" or "unchanged" against the previous build's files. The
+    request's metadata applies to every listed file, so a file stamped
+    differently last time counts as changed.
+    """
+    entry = previous_files.get(filename)
+    if entry is None:
+        return "added"
+    if entry["sha256"] != sha256 or entry.get("metadata", {}) != metadata:
+        return "changed"
+    return "unchanged"
+
+
+def load_manifest(path: str) -> Optional[dict]:
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict):
+    """Written last and renamed into place, so a manifest always describes a complete build."""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
@@ -0,0 +1,203 @@
+import time
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class StageStats:
+    """Items in/out and busy time of one pipeline stage, summed over its workers."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, items_out: int, seconds: float):
+        with self._lock:
+            self.items_in += 1
+            self.items_out += items_out
+            self.busy_seconds += seconds
+
+    def as_dict(self) -> dict:
+        wall = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        return {
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wall_seconds": round(wall, 3),
+            # Items handled per second of work; the slowest stage bounds the pipeline
+            "items_per_busy_second": round(self.items_in / self.busy_seconds, 2) if self.busy_seconds else None
+        }
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable, workers: int, queue_size: int, flush: Optional[Callable]):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.flush = flush
+        self.inbox: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats(name, workers)
+
+
+class IngestionPipeline:
+    """
+    Runs items from `source` through a chain of stages, each in its own
+    threads, connected by bounded queues. A stage function takes one item and
+    returns an iterable of output items (empty to drop it). Because every
+    queue is bounded, a slow stage makes the ones before it wait instead of
+    piling work up in memory, so peak memory depends on queue sizes and batch
+    sizes, not on the size of the corpus.
+
+    The first error stops every stage and is re-raised by `run`.
+    """
+
+    def __init__(self, source: Iterable, queue_size: int = 4):
+        self.source = source
+        self.queue_size = queue_size
+        self._stages: List[_Stage] = []
+        self._abort = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+    def stage(self, name: str, fn: Callable, workers: int = 1, queue_size: Optional[int] = None,
+              flush: Optional[Callable] = None) -> "IngestionPipeline":
+        """
+        Appends a stage. `flush`, for single-worker stages that accumulate
+        items (e.g. batching), is called after the last input and returns the
+        remaining outputs.
+        """
+        if flush is not None and workers != 1:
+            raise ValueError("Stages with a flush function must run a single worker")
+        self._stages.append(_Stage(name, fn, max(1, workers), queue_size or self.queue_size, flush))
+        return self
+
+    def _fail(self, error: BaseException):
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._abort.set()
+
+    def _put(self, target: "queue.Queue", item) -> bool:
+        """Blocks while `target` is full; gives up when the pipeline is aborted."""
+        while not self._abort.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self):
+        first = self._stages[0]
+        try:
+            for item in self.source:
+                if not self._put(first.inbox, item):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for _ in range(first.workers):
+                self._put(first.inbox, _DONE)
+
+    def _work(self, position: int, sink: Callable, remaining: list, remaining_lock: threading.Lock):
+        stage = self._stages[position]
+        is_last = position == len(self._stages) - 1
+        emit = sink if is_last else (lambda item: self._put(self._stages[position + 1].inbox, item))
+
+        try:
+            while not self._abort.is_set():
+                try:
+                    item = stage.inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                started = time.perf_counter()
+                outputs = list(stage.fn(item) or [])
+                stage.stats.record(len(outputs), time.perf_counter() - started)
+                for output in outputs:
+                    if emit(output) is False:
+                        return
+
+            if stage.flush is not None and not self._abort.is_set():
+                for output in stage.flush() or []:
+                    if emit(output) is False:
+                        return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            with remaining_lock:
+                remaining[position] -= 1
+                last_worker = remaining[position] == 0
+            if last_worker:
+                stage.stats.finished = time.perf_counter()
+                # The next stage stops once every one of its workers got a done marker
+                if not is_last:
+                    for _ in range(self._stages[position + 1].workers):
+                        self._put(self._stages[position + 1].inbox, _DONE)
+
+    def run(self, sink: Callable[[object], None]) -> dict:
+        """
+        Feeds the source through every stage into `sink` (called from the last
+        stage's worker threads) and blocks until done.
+        Returns per-stage throughput statistics.
+        """
+        if not self._stages:
+            raise ValueError("The pipeline has no stages")
+
+        remaining = [stage.workers for stage in self._stages]
+        remaining_lock = threading.Lock()
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._feed, name="ingest-source", daemon=True)]
+        for position, stage in enumerate(self._stages):
+            stage.stats.started = started
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(position, sink, remaining, remaining_lock),
+                    name=f"ingest-{stage.name}-{worker}", daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+        return {
+            "wall_seconds": round(time.perf_counter() - started, 3),
+            "stages": {stage.name: stage.stats.as_dict() for stage in self._stages}
+        }
+
+
+class Batcher:
+    """
+    Stage function that regroups incoming lists of items (e.g. the chunks of
+    one file) into lists of exactly `batch_size`; pass `flush` to the stage
+    for the last, partial batch.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = max(1, batch_size)
+        self._items = []
+
+    def __call__(self, items):
+        self._items.extend(items)
+        batches = []
+        while len(self._items) >= self.batch_size:
+            batches.append(self._items[:self.batch_size])
+            self._items = self._items[self.batch_size:]
+        return batches
+
+    def flush(self):
+        batch, self._items = self._items, []
+        return [batch] if batch else []
@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+# Written next to index.faiss, keyed by FAISS position: parameters, written last
+KEYWORD_INDEX_FILE = "keyword_index.json"
+# CSR postings: sorted term hashes, start of each term's postings, and per posting the position and BM25 weight
+KEYWORD_TERMS_FILE = "keyword_terms.npy"
+KEYWORD_OFFSETS_FILE = "keyword_offsets.npy"
+KEYWORD_DOC_IDS_FILE = "keyword_doc_ids.npy"
+KEYWORD_WEIGHTS_FILE = "keyword_weights.npy"
+KEYWORD_INDEX_FILES = (KEYWORD_TERMS_FILE, KEYWORD_OFFSETS_FILE, KEYWORD_DOC_IDS_FILE, KEYWORD_WEIGHTS_FILE, KEYWORD_INDEX_FILE)
+
+# Tashkeel, superscript alef and Quranic marks
+_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+_TATWEEL = "\u0640"
+_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+    # Arabic-Indic and Persian digits, so article numbers match either way
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4", "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+    "۰": "0", "۱": "1", "۲": "2", "۳": "3", "۴": "4", "۵": "5", "۶": "6", "۷": "7", "۸": "8", "۹": "9",
+})
+_TOKEN = re.compile(r"\w+")
+# Definite article, alone or behind a one-letter conjunction/preposition
+_ARTICLE_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+
+
+def normalize_arabic(text: str) -> str:
+    """Drops diacritics and tatweel, and folds alef/yaa/hamza/taa-marbuta variants."""
+    text = _DIACRITICS.sub("", text or "").replace(_TATWEEL, "")
+    return text.translate(_CHAR_MAP).lower()
+
+
+def _strip_article(token: str) -> str:
+    for prefix in _ARTICLE_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            return token[len(prefix):]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(normalize_arabic(text)):
+        if token.isdigit():
+            tokens.append(token)
+        elif len(token) > 1:
+            tokens.append(_strip_article(token))
+    return tokens
+
+
+def term_hash(term: str) -> int:
+    """64-bit id of a term; the index stores these instead of the strings."""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over a store's records. Document ids are FAISS
+    positions, so keyword and vector hits can be fused directly.
+
+    Postings are CSR arrays: the sorted term hashes, the start of each term's
+    postings, and per posting the record position and its BM25 weight, which
+    depends only on the term and the record and is computed at build time. A
+    query sums the weights of its terms' postings, with no per-record work.
+    The arrays are saved as .npy files and memory-mapped on load, so workers
+    share their pages.
+    """
+
+    def __init__(self, term_hashes: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray,
+                 num_docs: int, k1: float = 1.5, b: float = 0.75):
+        self.term_hashes = term_hashes
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_docs = num_docs
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "KeywordIndex":
+        vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids, tfs, doc_lengths = array("q"), array("q"), array("f"), array("q")
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(position)
+                tfs.append(tf)
+        return cls.from_postings(
+            vocabulary, np.frombuffer(term_ids, dtype=np.int64), np.frombuffer(doc_ids, dtype=np.int64),
+            np.frombuffer(tfs, dtype=np.float32), np.frombuffer(doc_lengths, dtype=np.int64), k1, b
+        )
+
+    @classmethod
+    def from_postings(cls, vocabulary: Dict[str, int], term_ids: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                      doc_lengths: np.ndarray, k1: float = 1.5, b: float = 0.75) -> "KeywordIndex":
+        """Builds the CSR arrays from one (term id, position, tf) triple per posting."""
+        num_docs = len(doc_lengths)
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        avg_doc_length = max(float(doc_lengths.mean()), 1e-6) if num_docs else 1.0
+
+        # Terms ordered by hash, postings grouped by term and kept in position order
+        hashes = np.fromiter((term_hash(term) for term in vocabulary), dtype=np.uint64, count=len(vocabulary))
+        term_order = np.argsort(hashes)
+        term_rank = np.empty(len(vocabulary), dtype=np.int64)
+        term_rank[term_order] = np.arange(len(vocabulary))
+        ranks = term_rank[np.asarray(term_ids, dtype=np.int64)]
+        order = np.argsort(ranks, kind="stable")
+        ranks, doc_ids, tfs = ranks[order], np.asarray(doc_ids, dtype=np.int32)[order], np.asarray(tfs, dtype=np.float32)[order]
+
+        df = np.bincount(ranks, minlength=len(vocabulary))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+
+        idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * doc_lengths / avg_doc_length)
+        weights = (idf[ranks] * tfs * (k1 + 1) / (tfs + norm[doc_ids])).astype(np.float32)
+        return cls(hashes[term_order], offsets, doc_ids, weights, num_docs, k1, b)
+
+    def search(self, query: str, k: int = 10, allowed: Optional[np.ndarray] = None) -> List[tuple]:
+        """Top-k (position, bm25 score) pairs for the query, only among sorted `allowed` positions if given."""
+        if not self.num_docs or not len(self.term_hashes):
+            return []
+
+        hashes = np.array(sorted({term_hash(term) for term in tokenize(query)}), dtype=np.uint64)
+        slots = np.searchsorted(self.term_hashes, hashes)
+        inside = slots < len(self.term_hashes)
+        slots, hashes = slots[inside], hashes[inside]
+        slots = slots[np.asarray(self.term_hashes[slots]) == hashes]
+        if not len(slots):
+            return []
+
+        ids = np.concatenate([self.doc_ids[self.offsets[slot]:self.offsets[slot + 1]] for slot in slots])
+        weights = np.concatenate([self.weights[self.offsets[slot]:self.offsets[slot + 1]] for slot in slots])
+        if allowed is not None:
+            if not len(allowed):
+                return []
+            allowed = np.asarray(allowed, dtype=np.int64)
+            keep = allowed[np.minimum(np.searchsorted(allowed, ids), len(allowed) - 1)] == ids
+            ids, weights = ids[keep], weights[keep]
+            if not len(ids):
+                return []
+
+        # Sum per record: dense over all records when the postings cover many of them, sparse otherwise
+        if len(ids) * 16 > self.num_docs:
+            scores = np.bincount(ids, weights=weights, minlength=self.num_docs)
+            candidates = np.flatnonzero(scores)
+            candidate_scores = scores[candidates]
+        else:
+            candidates, inverse = np.unique(ids, return_inverse=True)
+            candidate_scores = np.bincount(inverse, weights=weights)
+
+        if len(candidates) > k:
+            top = np.argpartition(-candidate_scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.lexsort((candidates[top], -candidate_scores[top]))]
+        return [(int(candidates[i]), float(candidate_scores[i])) for i in top]
+
+    def save(self, path: str):
+        """Writes the arrays, then the parameters file, which marks the index complete."""
+        for name, values in zip(KEYWORD_INDEX_FILES, (self.term_hashes, self.offsets, self.doc_ids, self.weights)):
+            np.save(os.path.join(path, name), np.ascontiguousarray(values))
+        with open(os.path.join(path, KEYWORD_INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump({"format": 2, "k1": self.k1, "b": self.b, "num_docs": self.num_docs}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> Optional["KeywordIndex"]:
+        """Memory-maps the arrays (or reads them with `mmap=False`); None if the store has no keyword index."""
+        index_path = os.path.join(path, KEYWORD_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(path, name), mmap_mode=mode) for name in KEYWORD_INDEX_FILES[:4]]
+        return cls(*arrays, data["num_docs"], data.get("k1", 1.5), data.get("b", 0.75))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in private memory; memory-mapped arrays live in the shared page cache."""
+        return sum(
+            values.nbytes for values in (self.term_hashes, self.offsets, self.doc_ids, self.weights)
+            if not isinstance(values, np.memmap)
+        )
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[int]:
+    """Merges ranked id lists; each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
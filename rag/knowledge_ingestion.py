@@ -1,11 +1,29 @@
 import os
+import json
+import shutil
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import UnstructuredFileLoader  
-from utils.helper_functions import download_from_alibaba_oss, download_from_url, upload_files_to_alibaba_oss_static, init_oss_bucket
+import faiss
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from rag.embedding_provider import get_embeddings
+from rag.index_builder import (build_index_config, build_faiss_index, evaluate_index, save_index_config, write_full_vectors,
+                               load_index_config, load_full_vectors, load_index_report, stored_ids, update_faiss_index,
+                               save_id_layout, vector_norms, save_vector_norms, load_vector_norms,
+                               INDEX_CONFIG_FILE, INDEX_REPORT_FILE, VECTORS_FILE, FAISS_IDS_FILE, IVF_LOCATIONS_FILE, VECTOR_NORMS_FILE)
+from utils.helper_functions import (download_from_alibaba_oss, download_from_url, upload_files_to_alibaba_oss_static, init_oss_bucket,
+                                    extract_control_clauses)
+from langchain_core.documents import Document
+from rag.mmap_docstore import MmapDocstoreWriter, has_mmap_docstore, MmapDocstore, DOCSTORE_FILE, DOCSTORE_OFFSETS_FILE
+from rag.document_parser import parse_documents, parse_document, default_parse_workers
+from rag.ingestion_manifest import file_sha256, classify_file, load_manifest, save_manifest, MANIFEST_FILE
+from rag.ingestion_pipeline import IngestionPipeline, Batcher
+from utils.downloader import download_urls, filename_for_url, DOWNLOAD_CONCURRENCY
+from utils.jobs import current_job
+from rag.keyword_index import KeywordIndex, KEYWORD_INDEX_FILES
+from rag.metadata_index import MetadataIndex, METADATA_INDEX_FILES, FILTER_FIELDS
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
 import urllib.parse
 # Load environment variables from .env file
 load_dotenv()
@@ -26,31 +44,75 @@ def create_path_directory(path: str) -> str:
 DOCX_DIRECTORY = create_path_directory("./database/glasshub_files")
 VECTORSTORE_DIRECTORY = create_path_directory("./database/vectorstore_glasshub")
 
+# Records per embedding call; ingestion memory grows with this and the queue size, not with the corpus
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256"))
+# Items waiting between two ingestion stages before the earlier stage blocks
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+# Pipeline threads waiting on downloads; the shared downloader caps the transfers actually in flight
+INGEST_DOWNLOAD_WORKERS = int(os.getenv("INGEST_DOWNLOAD_WORKERS", str(DOWNLOAD_CONCURRENCY)))
+# Vectors of the records embedded by the running ingestion, spilled to disk as raw float32 rows
+PENDING_VECTORS_FILE = "pending_vectors.f32"
+
 def download_files_from_cloud_storage(json_data: List[str], download_dir="./database/glasshub_files"):
-    os.makedirs(download_dir, exist_ok=True)
-
-    for url in json_data:
-        filename = urllib.parse.unquote(os.path.basename(url))
-        local_path = os.path.join(download_dir, filename)
-        download_from_url(url, local_path)
-
-# Step 1: Load all DOCX files
-def load_documents():
-    documents = []
-    for filename in os.listdir(DOCX_DIRECTORY):
-        if filename.endswith(".docx"):
-            file_path = os.path.join(DOCX_DIRECTORY, filename)
-            loader = UnstructuredFileLoader(file_path)
-            pages = loader.load()
-
-            for i, doc in enumerate(pages):
-                doc.metadata["source"] = filename
-                doc.metadata["page_number"] = i + 1
-                documents.append(doc)
-    return documents
-
-
-# Step 2: Split documents into chunks
+    """Downloads every URL into `download_dir` concurrently; returns file name -> whether the download succeeded."""
+    return {filename: result["ok"] for filename, result in download_urls(json_data, download_dir).items()}
+
+# Step 1: Load all DOCX files (or only `filenames`), one document per heading section
+def load_documents(docx_directory: str = DOCX_DIRECTORY, filenames: Optional[List[str]] = None):
+    filenames = sorted(os.listdir(docx_directory)) if filenames is None else filenames
+    return parse_documents([os.path.join(docx_directory, filename) for filename in filenames if filename.endswith(".docx")])
+
+
+# Step 2a: Turn controls documents into one record per clause
+def build_clause_records(documents):
+    """
+    Splits loaded documents into clause records and plain documents.
+
+    Controls documents (the JSON produced by /generate_controls) are parsed
+    once here. Each clause becomes its own record: the description is what
+    gets embedded, and the clause itself is kept in `metadata["result"]` so
+    search can return it without parsing anything.
+    """
+    clause_records = []
+    plain_documents = []
+
+    for doc in documents:
+        clauses = extract_control_clauses(doc.page_content)
+        if clauses is None:
+            plain_documents.append(doc)
+            continue
+
+        for clause_idx, clause in enumerate(clauses):
+            description = (clause.get("description") or clause.get("title") or "").strip()
+            if not description:
+                continue
+
+            clause_records.append(Document(
+                page_content=description,
+                metadata={
+                    "source": doc.metadata.get("source", "File not specified"),
+                    "page": clause.get("page", "Page not specified"),
+                    "record_type": "clause",
+                    "clause_index": clause_idx,
+                    "result": clause,
+                    # Clauses that name their own regulation / license type keep it for filtering
+                    **{field: clause[field] for field in FILTER_FIELDS if field != "source" and clause.get(field)}
+                }
+            ))
+
+    return clause_records, plain_documents
+
+
+def apply_record_metadata(records, metadata: Optional[dict] = None):
+    """Stamps ingestion-wide metadata (regulation, license_type, tenant) on records that do not set their own."""
+    metadata = {field: value for field, value in (metadata or {}).items() if field in FILTER_FIELDS and value}
+    for record in records:
+        for field, value in metadata.items():
+            record.metadata.setdefault(field, value)
+    return records
+
+
+# Step 2b: Split documents into chunks
 def split_documents(documents):
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
@@ -58,45 +120,373 @@ def split_documents(documents):
     )
     return splitter.split_documents(documents)
 
-# Step 3: Embed documents sentence-transformers/all-MiniLM-L6-v2
-def embed_documents(chunks):
-    print("Chunks:", chunks)
-    print("Number of chunks:", len(chunks))
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-    db = FAISS.from_documents(chunks, embeddings)
-    return db
-
-# Step 4: Save the vector database
-def save_vectorstore(db, path_upload):
-    if not os.path.exists(VECTORSTORE_DIRECTORY):
-        os.makedirs(VECTORSTORE_DIRECTORY)
-    db.save_local(VECTORSTORE_DIRECTORY)
-    faiss = "./database/vectorstore_glasshub/index.faiss"
-    pkl = "./database/vectorstore_glasshub/index.pkl"
-    upload_files_to_alibaba_oss_static(BUCKET, faiss, f"{path_upload}/index.faiss")
-    upload_files_to_alibaba_oss_static(BUCKET, pkl, f"{path_upload}/index.pkl")
+
+def build_records(documents, metadata: Optional[dict] = None):
+    """Clause records for controls documents, chunks for the rest, stamped with the ingestion metadata."""
+    clause_records, plain_documents = build_clause_records(documents)
+    return apply_record_metadata(clause_records + split_documents(plain_documents), metadata)
+
+
+def write_search_indexes(directory: str):
+    """BM25 keyword index (hybrid search) and metadata index (filtered search) over the docstore in `directory`, read one record at a time."""
+    docstore = MmapDocstore(directory)
+    try:
+        # Arabic-aware BM25 index over the same records, for hybrid search
+        KeywordIndex.build(doc.page_content for doc in docstore).save(directory)
+        # Per-value position sets for source / regulation / license type / tenant filters
+        MetadataIndex.build(doc.metadata for doc in docstore).save(directory)
+    finally:
+        docstore.close()
+
+
+def build_directory_for(path_upload: str) -> str:
+    # Stage each upload path separately so concurrent builds do not overwrite each other
+    return os.path.join(VECTORSTORE_DIRECTORY, "builds", path_upload)
+
+
+def full_rebuild_reason(manifest: Optional[dict], build_directory: str, model_id: str, index_options: dict) -> Optional[str]:
+    """Why the previous build cannot be updated in place, or None if it can."""
+    if manifest is None:
+        return "no manifest from a previous build"
+    if manifest.get("embedding_model") != model_id:
+        return f"embedding model changed ({manifest.get('embedding_model')} -> {model_id})"
+    if manifest.get("index_options") != index_options:
+        return "index options changed"
+    if not (os.path.exists(os.path.join(build_directory, "index.faiss")) and has_mmap_docstore(build_directory)):
+        return "previous index files are missing"
+    return None
+
+
+class PendingRecords:
+    """
+    Sink of the ingestion pipeline. Each embedded batch gets the next ids and
+    goes straight to disk: records to a docstore, vectors to a raw float32
+    file that is memory-mapped once the pipeline is done. Only the ids per
+    source file stay in memory.
+    """
+
+    def __init__(self, directory: str, first_id: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.first_id = first_id
+        self.count = 0
+        self.dimension = None
+        self.ids_by_source = {}
+        self._docstore = MmapDocstoreWriter(directory)
+        self._vectors = open(os.path.join(directory, PENDING_VECTORS_FILE), "wb")
+
+    def add(self, batch):
+        records, vectors = batch
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        for record in records:
+            self._docstore.add(record)
+            self.ids_by_source.setdefault(record.metadata.get("source"), []).append(self.first_id + self.count)
+            self.count += 1
+        self._vectors.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+
+    def close(self):
+        self._vectors.close()
+        self._docstore.close()
+
+    def abort(self):
+        self._vectors.close()
+        self._docstore.abort()
+
+    def ids(self) -> np.ndarray:
+        return np.arange(self.first_id, self.first_id + self.count, dtype=np.int64)
+
+    def vectors(self, dimension: int) -> np.ndarray:
+        """The spilled vectors, memory-mapped read-only."""
+        if self.count == 0:
+            return np.empty((0, dimension), dtype=np.float32)
+        return np.memmap(os.path.join(self.directory, PENDING_VECTORS_FILE), dtype=np.float32, mode="r",
+                         shape=(self.count, self.dimension))
+
+
+def write_full_build(directory: str, pending: PendingRecords, index_options: dict):
+    """Trains and fills a new index from the pending vectors; the pending docstore becomes the store's docstore."""
+    vectors = pending.vectors(pending.dimension)
+    config = build_index_config(len(vectors), vectors.shape[1], **index_options)
+    # Stable ids let later runs update the index in place (see write_incremental_build)
+    index = build_faiss_index(vectors, config, pending.ids())
+    report = evaluate_index(index, vectors, config)
+    print(f"📈 Index report: {report}")
+    faiss.write_index(index, os.path.join(directory, "index.faiss"))
+    save_vector_norms(directory, vector_norms(vectors))
+
+    for file_name in (DOCSTORE_FILE, DOCSTORE_OFFSETS_FILE):
+        os.replace(os.path.join(pending.directory, file_name), os.path.join(directory, file_name))
+    # Compressed stores keep float32 vectors on disk for re-ranking
+    if config["rerank"]:
+        write_full_vectors(directory, [(vectors, None)])
+    return index, config, report
+
+
+def write_incremental_build(directory: str, build_directory: str, manifest: dict, pending: PendingRecords, stale_files: List[str]):
+    """
+    Applies one ingestion run to the previous build: vectors of `stale_files`
+    (changed or removed) are deleted, the pending vectors are added under
+    their new ids, and everything else keeps its vector and id. The docstore
+    is rewritten by copying the kept records byte for byte, then the pending
+    ones, which needs no embedding.
+    """
+    config = load_index_config(build_directory)
+    index = faiss.read_index(os.path.join(build_directory, "index.faiss"))
+    old_ids = stored_ids(index)
+    if old_ids is None:
+        old_ids = np.arange(index.ntotal, dtype=np.int64)
+    full_vectors = load_full_vectors(build_directory) if config.get("rerank") else None
+
+    removed_ids = np.array(
+        sorted(record_id for name in stale_files for record_id in manifest["files"][name]["ids"]), dtype=np.int64
+    )
+    kept = np.flatnonzero(~np.isin(old_ids, removed_ids))
+    vectors = pending.vectors(config["dimension"])
+    if vectors.shape[1] != config["dimension"]:
+        raise ValueError(f"❌ New vectors have {vectors.shape[1]} dimensions, the store has {config['dimension']}.")
+
+    index = update_faiss_index(index, config, removed_ids, vectors, pending.ids(), full_vectors)
+    config["num_vectors"] = int(index.ntotal)
+    faiss.write_index(index, os.path.join(directory, "index.faiss"))
+
+    # Records stay in id order, so docstore positions match the sorted FAISS ids
+    writer = MmapDocstoreWriter(directory)
+    old_docstore, new_docstore = MmapDocstore(build_directory), MmapDocstore(pending.directory)
+    try:
+        for position in kept:
+            writer.add_raw(old_docstore.raw(position))
+        for position in range(len(new_docstore)):
+            writer.add_raw(new_docstore.raw(position))
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        old_docstore.close()
+        new_docstore.close()
+
+    if full_vectors is not None:
+        write_full_vectors(directory, [(full_vectors, kept), (vectors, None)])
+    # Builds from before the norms were saved keep scoring from the stored vectors
+    old_norms = load_vector_norms(build_directory)
+    if old_norms is not None:
+        save_vector_norms(directory, np.concatenate([old_norms[kept], vector_norms(vectors)]))
+    # Recall / latency were measured on the last full build
+    report = {**(load_index_report(build_directory) or {}), "index": config}
+    return index, config, report
+
+
+def replace_build(staging_directory: str, build_directory: str):
+    """Swaps a finished staging directory in for the previous build."""
+    previous_directory = f"{build_directory}.previous-{os.getpid()}"
+    if os.path.exists(build_directory):
+        os.rename(build_directory, previous_directory)
+    os.rename(staging_directory, build_directory)
+    shutil.rmtree(previous_directory, ignore_errors=True)
+
+
+# Upload the vector database
+def upload_vectorstore(build_directory: str, path_upload: str):
+    files = [
+        "index.faiss", DOCSTORE_FILE, DOCSTORE_OFFSETS_FILE, INDEX_CONFIG_FILE, INDEX_REPORT_FILE,
+        *KEYWORD_INDEX_FILES, *METADATA_INDEX_FILES, FAISS_IDS_FILE, IVF_LOCATIONS_FILE, VECTOR_NORMS_FILE, VECTORS_FILE
+    ]
+    for file_name in files:
+        if os.path.exists(os.path.join(build_directory, file_name)):
+            upload_files_to_alibaba_oss_static(BUCKET, os.path.join(build_directory, file_name), f"{path_upload}/{file_name}")
+
 
 # Main function to ingest knowledge
-def ingest_company_knowledge(url, path_download, path_upload):
-    print("Download all files for RAG System from cloud storage...")
-    download_files_from_cloud_storage(url, path_download)
-    print(f"✅ Files downloaded.")
+def ingest_company_knowledge(url, path_download, path_upload, metadata=None, incremental=True, embed_batch_size=None, **index_options):
+    """
+    Builds the store for `path_upload` from the files at `url`.
+
+    Files stream through download -> parse -> split -> embed (in batches of
+    `embed_batch_size`) -> disk, with bounded queues between the stages, so
+    no stage holds more than a few files or batches at a time. Vectors and
+    records are spilled to disk as they are embedded, and the index is
+    trained on a sample and filled slice by slice. Throughput of every stage
+    is reported under `ingestion.pipeline`.
+
+    With `incremental`, the content hash of every file is compared with the
+    manifest of the previous build: only new or changed files are parsed and
+    embedded, vectors of changed or no longer listed files are deleted, and
+    unchanged files keep their vectors. Files whose download failed keep their
+    previous vectors. A full rebuild happens when there is no usable previous
+    build, or the embedding model or index options changed.
+
+    Run as a background job, it reports progress and stops between files or
+    batches once cancelled.
 
-    print("📚 Loading documents...")
-    documents = load_documents()
-    print(f"✅ Loaded {len(documents)} documents.")
+    The new build is written next to the previous one and swapped in when
+    complete, so an interrupted run leaves the previous build untouched.
+    """
+    os.makedirs(path_download, exist_ok=True)
+    build_directory = build_directory_for(path_upload)
+    staging_directory = f"{build_directory}.staging-{os.getpid()}"
+    metadata = {field: value for field, value in (metadata or {}).items() if value}
+    index_options = json.loads(json.dumps(index_options, default=str))
+    embeddings = get_embeddings()
+    model_id = embeddings.model_id
 
-    print("✂️ Splitting into chunks...")
-    chunks = split_documents(documents)
-    print(f"✅ Split into {len(chunks)} chunks.")
+    manifest = load_manifest(build_directory)
+    reason = full_rebuild_reason(manifest, build_directory, model_id, index_options) if incremental else "incremental ingestion disabled"
+    previous_files = {} if reason else manifest["files"]
+    listed = {filename_for_url(file_url) for file_url in url}
+    changes = {
+        "added": [], "changed": [], "unchanged": [],
+        "removed": sorted(name for name in previous_files if name not in listed),
+        # A failed download is not a removal: keep what the previous build had for it
+        "kept_after_failed_download": []
+    }
+    hashes = {}
+    # Pipeline stages run on their own threads, so the job is captured here
+    job = current_job()
+    downloaded = [0]
 
-    print("🧠 Embedding chunks...")
-    db = embed_documents(documents)
+    def download(file_url):
+        filename = filename_for_url(file_url)
+        local_path = os.path.join(path_download, filename)
+        ok = download_from_url(file_url, local_path)
+        return [(filename, file_sha256(local_path) if ok and filename.endswith(".docx") else None, ok)]
 
-    print("💾 Saving vector database...")
-    save_vectorstore(db, path_upload)
+    def select(item):
+        filename, file_hash, ok = item
+        if job is not None:
+            job.check_cancelled()
+            downloaded[0] += 1
+            job.progress(0.5 * downloaded[0] / len(url), f"Downloaded {downloaded[0]}/{len(url)} files")
+        if not ok:
+            if filename in previous_files:
+                changes["kept_after_failed_download"].append(filename)
+            return []
+        if file_hash is None:
+            return []
+        status = classify_file(previous_files, filename, file_hash, metadata)
+        changes[status].append(filename)
+        if status == "unchanged":
+            return []
+        hashes[filename] = file_hash
+        return [filename]
 
+    parse_workers = default_parse_workers()
+    # Workers are spawned rather than forked: the server process already runs model and FAISS threads
+    parse_pool = ProcessPoolExecutor(parse_workers, mp_context=multiprocessing.get_context("spawn")) if parse_workers > 1 else None
+
+    def parse(filename):
+        file_path = os.path.join(path_download, filename)
+        if parse_pool is None:
+            return [parse_document(file_path)]
+        return [parse_pool.submit(parse_document, file_path).result()]
+
+    def split(documents):
+        return [build_records(documents, metadata)]
+
+    def embed(batch):
+        if job is not None:
+            job.check_cancelled()
+        vectors = np.asarray(embeddings.embed_documents([record.page_content for record in batch]), dtype=np.float32)
+        return [(batch, vectors.reshape(len(batch), -1))]
+
+    batcher = Batcher(embed_batch_size or INGEST_EMBED_BATCH_SIZE)
+    pipeline = (
+        IngestionPipeline(url, queue_size=INGEST_QUEUE_SIZE)
+        .stage("download", download, workers=INGEST_DOWNLOAD_WORKERS)
+        .stage("select", select)
+        .stage("parse", parse, workers=parse_workers)
+        .stage("split", split)
+        .stage("batch", batcher, flush=batcher.flush)
+        .stage("embed", embed)
+    )
+
+    shutil.rmtree(staging_directory, ignore_errors=True)
+    pending = PendingRecords(os.path.join(staging_directory, "pending"), 0 if reason else manifest["next_id"])
+    try:
+        print(f"🚚 Streaming {len(url)} files through download -> parse -> split -> embed...")
+        try:
+            pipeline_stats = pipeline.run(pending.add)
+        except BaseException:
+            pending.abort()
+            raise
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown(cancel_futures=True)
+        pending.close()
+        # Keep the shared chunk vector cache within its size limit
+        if getattr(embeddings, "document_cache", None) is not None:
+            embeddings.document_cache.prune()
+        for status in changes:
+            changes[status].sort()
+        for stage, stats in pipeline_stats["stages"].items():
+            print(f"⏱️ {stage}: {stats}")
+
+        to_embed = sorted(hashes)
+        print(f"🧾 Files: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+              f"{len(changes['unchanged'])} unchanged, {len(changes['removed'])} removed; {pending.count} records embedded.")
+
+        if reason:
+            print(f"🏗️ Full rebuild: {reason}.")
+            if pending.count == 0:
+                raise ValueError("❌ No documents were downloaded, nothing to index.")
+
+        if not reason and not to_embed and not changes["removed"]:
+            print("✅ Nothing changed since the previous build, keeping it.")
+            return {**(load_index_report(build_directory) or {}),
+                    "ingestion": {"mode": "unchanged", "files": changes, "pipeline": pipeline_stats}}
+
+        if job is not None:
+            job.check_cancelled()
+            job.progress(0.6, "Building the index")
+        if reason:
+            index, config, report = write_full_build(staging_directory, pending, index_options)
+            files = {}
+            removed_vectors = 0
+        else:
+            print("🔁 Updating the previous build in place...")
+            stale_files = changes["changed"] + changes["removed"]
+            removed_vectors = sum(len(manifest["files"][name]["ids"]) for name in stale_files)
+            if manifest["num_vectors"] - removed_vectors + pending.count == 0:
+                raise ValueError("❌ This update would leave the vectorstore empty.")
+            index, config, report = write_incremental_build(staging_directory, build_directory, manifest, pending, stale_files)
+            files = {name: entry for name, entry in manifest["files"].items() if name not in stale_files}
+        shutil.rmtree(pending.directory, ignore_errors=True)
+        write_search_indexes(staging_directory)
+        # Ids and IVF code locations that serving workers memory-map instead of rebuilding
+        save_id_layout(staging_directory, index)
+
+        for name in to_embed:
+            files[name] = {"sha256": hashes[name], "ids": pending.ids_by_source.get(name, []), "metadata": metadata}
+
+        report["ingestion"] = {
+            "mode": "full" if reason else "incremental",
+            "reason": reason,
+            "files": changes,
+            "added_vectors": pending.count,
+            "removed_vectors": removed_vectors,
+            "total_vectors": int(index.ntotal),
+            "pipeline": pipeline_stats
+        }
+
+        print("💾 Saving vector database...")
+        if job is not None:
+            job.progress(0.9, "Saving and uploading")
+        save_index_config(staging_directory, config, report)
+        save_manifest(staging_directory, {
+            "embedding_model": model_id,
+            "index_options": index_options,
+            "next_id": pending.first_id + pending.count,
+            "num_vectors": int(index.ntotal),
+            "files": files
+        })
+        replace_build(staging_directory, build_directory)
+    finally:
+        shutil.rmtree(staging_directory, ignore_errors=True)
+
+    upload_vectorstore(build_directory, path_upload)
     print("🚀 Knowledge ingestion completed!")
+    return report
+
 
     
 
@@ -1,6 +1,19 @@
 import os
+import threading
+import faiss
+import numpy as np
+from typing import Dict, List, Optional
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from rag.embedding_provider import get_embeddings
+from rag.index_builder import (apply_search_params, load_index_config, load_full_vectors, search_vectors, read_faiss_index,
+                               index_private_bytes, filtered_search_params, reconstruct_vectors, load_id_layout, load_vector_norms, cosine_from_distances)
+from rag.mmap_docstore import MmapDocstore, PositionalIds, has_mmap_docstore, migrate_pickle_docstore, PICKLE_DOCSTORE_FILE
+from rag.keyword_index import KeywordIndex, reciprocal_rank_fusion
+from rag.metadata_index import MetadataIndex, filter_key
+from rag.vectorstore_registry import VectorStoreRegistry
+from rag.store_versions import (current_version, resolve_store_directory, publish_version, prune_versions, version_directory,
+                                 VERSIONS_DIR)
 
 
 def create_path_directory(path: str) -> str:
@@ -11,39 +24,231 @@ def create_path_directory(path: str) -> str:
 VECTORSTORE_DIRECTORY = create_path_directory("./database/vectorstore_glasshub")
 
 
+# "memory" reads each index into the worker's private memory,
+# "mmap" maps the index files read-only so workers share them
+VECTORSTORE_LOAD_MODE = os.getenv("VECTORSTORE_LOAD_MODE", "memory").lower()
+# Stores that only have the legacy index.pkl are migrated once on first load;
+# set to "false" to refuse to unpickle anything
+VECTORSTORE_MIGRATE_PICKLE = os.getenv("VECTORSTORE_MIGRATE_PICKLE", "true").lower() == "true"
+# Fuse BM25 keyword hits with vector hits when the store has a keyword index.
+# Off by default: it costs a few milliseconds per query on top of the vector search
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "false").lower() == "true"
+# Candidates taken from each ranking before fusion, as a multiple of k
+HYBRID_CANDIDATES_FACTOR = int(os.getenv("HYBRID_CANDIDATES_FACTOR", "4"))
+# Published store versions kept on disk, for rollback
+VECTORSTORE_KEEP_VERSIONS = int(os.getenv("VECTORSTORE_KEEP_VERSIONS", "3"))
+# Seconds between checks of each store's CURRENT file, 0 disables the watcher
+VECTORSTORE_WATCH_INTERVAL = float(os.getenv("VECTORSTORE_WATCH_INTERVAL", "10"))
+# Per-worker store pool budget; least recently used tenant stores are evicted
+# past either limit (0 = unlimited). Stores pinned at startup never count as victims.
+VECTORSTORE_POOL_MAX_BYTES = int(os.getenv("VECTORSTORE_POOL_MAX_BYTES", "0"))
+VECTORSTORE_POOL_MAX_STORES = int(os.getenv("VECTORSTORE_POOL_MAX_STORES", "0"))
+
+
 # Step 1: Load the FAISS vectorstore
-def load_vectorstore(path_load):
+def load_vectorstore(store_path, load_mode=None):
+    # Versioned stores serve the version named by CURRENT, older ones their own directory
+    path_load, version = resolve_store_directory(store_path)
     if not os.path.isdir(path_load):
         raise FileNotFoundError(
             f"❌ Vectorstore directory '{path_load}' not found.\n"
             "💡 Please run the ingestion script to generate the vector store."
         )
     
-    print("📦 Loading vectorstore...")
-    # sentence-transformers/all-MiniLM-L6-v2
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-    
-    db = FAISS.load_local(
-        path_load,
-        embeddings,
-        allow_dangerous_deserialization=True  # Needed if pickle was used during save
-    )
+    load_mode = (load_mode or VECTORSTORE_LOAD_MODE).lower()
+    print(f"📦 Loading vectorstore ({load_mode}, version {version or 'unversioned'})...")
+    embeddings = get_embeddings()
+    config = load_index_config(path_load) or {}
+
+    if not has_mmap_docstore(path_load):
+        if not (VECTORSTORE_MIGRATE_PICKLE and os.path.exists(os.path.join(path_load, PICKLE_DOCSTORE_FILE))):
+            raise FileNotFoundError(
+                f"❌ No docstore found in '{path_load}'.\n"
+                "💡 Re-run ingestion or migrate the store with `python -m rag.mmap_docstore <path>`."
+            )
+        migrate_pickle_docstore(path_load)
+
+    # Documents stay on disk; only the k hits of each search are materialized
+    docstore = MmapDocstore(path_load)
+    index, mapped = read_faiss_index(path_load, config, use_mmap=load_mode == "mmap")
+    if index.ntotal != len(docstore):
+        raise ValueError(
+            f"❌ Vectorstore '{path_load}' is inconsistent: {index.ntotal} vectors, {len(docstore)} documents."
+        )
+
+    db = FAISS(embeddings, index, docstore, PositionalIds(len(docstore)))
+
+    # Restore nprobe / efSearch for IVF and HNSW indexes
+    if config:
+        apply_search_params(db.index, config)
+        print(f"⚙️ Index type: {config.get('index_type', 'flat')}, compression: {config.get('compression', 'none')}")
+    db.index_config = config
+    db.load_mode = load_mode
+    db.version = version
+    db.store_directory = path_load
+    db.index_private_bytes = index_private_bytes(path_load, index, mapped)
+
+    # Incrementally updated stores keep stable FAISS ids; map them to docstore positions.
+    # IVF stores also get where each position's code sits, so decoding a hit needs no direct map
+    db.faiss_ids, db.ivf_locations = load_id_layout(path_load, db.index, use_mmap=load_mode == "mmap")
+
+    # Compressed stores re-rank against the full-precision vectors kept on disk
+    db.full_vectors = load_full_vectors(path_load) if config.get("rerank") else None
+    # Vector norms turn search distances into similarity scores without decoding vectors
+    db.vector_norms = load_vector_norms(path_load)
+
+    # BM25 index built next to the vectors at ingestion; loaded on the first hybrid search
+    db.keyword_index = None
+    db.keyword_index_loaded = False
+
+    # Metadata value -> positions, for filtered search; the positions are memory-mapped
+    db.metadata_index = MetadataIndex.load(path_load)
+
     print("✅ Vectorstore loaded successfully.")
     return db
 
 
-# Step 2: Retrieve top-k most relevant documents
-def retrieve_relevant_knowledge_enterprise(
-    path_load: str = "",
-    user_question: str = "",
-    is_licensed: str = "",
-    license_type: str = "",
-    service_type: str = "",
-    regulations: str = "",
-    k: int = 10
-):
-    db = load_vectorstore(path_load)
+def close_vectorstore(db):
+    """Releases the memory-mapped docstore of a store that is no longer served."""
+    close = getattr(db.docstore, "close", None)
+    if close is not None:
+        close()
+
+
+def estimate_store_bytes(db):
+    """
+    Private memory a loaded store is charged against the pool budget: the
+    parts of its FAISS index read into memory, plus every array or index
+    that is not memory-mapped. Memory-mapped files (docstore, ids, norms,
+    re-rank vectors, keyword and metadata postings, and in mmap mode the
+    index codes) live in the shared page cache and are not counted.
+    """
+    total = getattr(db, "index_private_bytes", 0)
+    for name in ("faiss_ids", "ivf_locations", "vector_norms", "full_vectors"):
+        values = getattr(db, name, None)
+        if isinstance(values, np.ndarray) and not isinstance(values, np.memmap):
+            total += values.nbytes
+    for name in ("keyword_index", "metadata_index"):
+        index = getattr(db, name, None)
+        if index is not None:
+            total += index.nbytes
+    return total
+
+
+# Shared by every router in the process, so each store is loaded only once
+vectorstore_registry = VectorStoreRegistry(
+    loader=load_vectorstore,
+    closer=close_vectorstore,
+    sizer=estimate_store_bytes,
+    max_bytes=VECTORSTORE_POOL_MAX_BYTES,
+    max_stores=VECTORSTORE_POOL_MAX_STORES
+)
+
+
+def get_vectorstore(path_load):
+    return vectorstore_registry.get(path_load)
+
 
+def is_store_directory(store_path) -> bool:
+    """Whether `store_path` holds a servable store, versioned or not."""
+    path_load, _ = resolve_store_directory(store_path)
+    return os.path.exists(os.path.join(path_load, "index.faiss"))
+
+
+def resolve_store_path(path_load, default=None):
+    """
+    Maps a requested store path (absolute, relative to the working directory,
+    or relative to VECTORSTORE_DIRECTORY, e.g. "tenant_a/regulator") to a store
+    directory. Falls back to `default` when no path is given or it names no
+    store: outside VECTORSTORE_DIRECTORY, inside an ingestion build or a
+    store's versions, or without index files. Clients sending any other value
+    keep getting the router's store, as they did before per-tenant stores.
+    """
+    if not path_load or not path_load.strip():
+        return default
+
+    root = os.path.realpath(VECTORSTORE_DIRECTORY)
+    for candidate in (os.path.realpath(path_load), os.path.realpath(os.path.join(root, path_load))):
+        if candidate == root or os.path.commonpath([root, candidate]) != root:
+            continue
+        # Builds and individual versions are staging areas, never served directly
+        parts = os.path.relpath(candidate, root).split(os.sep)
+        if "builds" in parts or VERSIONS_DIR in parts:
+            continue
+        if is_store_directory(candidate):
+            return candidate
+
+    print(f"⚠️ No vectorstore at '{path_load}', using {default}.")
+    return default
+
+
+def validate_store_version(directory):
+    """
+    Loads a downloaded version the way a worker would (memory-mapped) and
+    checks that every index next to the vectors covers the same records, so
+    a partial or mixed download is never published.
+    """
+    if not os.path.exists(os.path.join(directory, "index.faiss")):
+        raise FileNotFoundError(f"❌ '{directory}' has no index.faiss.")
+    if not (has_mmap_docstore(directory) or os.path.exists(os.path.join(directory, PICKLE_DOCSTORE_FILE))):
+        raise FileNotFoundError(f"❌ '{directory}' has no docstore.")
+
+    db = load_vectorstore(directory, load_mode="mmap")
+    try:
+        num_vectors = db.index.ntotal
+        if db.index_config.get("rerank") and db.full_vectors is None:
+            raise FileNotFoundError(f"❌ '{directory}' re-ranks but has no full-precision vectors.")
+        keyword_index = KeywordIndex.load(directory)
+        counts = {
+            "documents": len(db.docstore),
+            "re-rank vectors": None if db.full_vectors is None else len(db.full_vectors),
+            "vector norms": None if db.vector_norms is None else len(db.vector_norms),
+            "IVF locations": None if db.ivf_locations is None else len(db.ivf_locations),
+            "metadata index records": None if db.metadata_index is None else db.metadata_index.num_records,
+            "keyword index records": None if keyword_index is None else keyword_index.num_docs
+        }
+        for name, count in counts.items():
+            if count is not None and count != num_vectors:
+                raise ValueError(f"❌ '{directory}' is inconsistent: {num_vectors} vectors, {count} {name}.")
+        # A truncated docstore fails to decode its last record
+        if num_vectors:
+            db.docstore.search(num_vectors - 1)
+    finally:
+        close_vectorstore(db)
+
+
+def publish_store_version(store_path, version):
+    """
+    Makes a downloaded version the one every worker serves, after checking it
+    loads and its files agree (see `validate_store_version`). Older versions
+    beyond the retention are pruned.
+    """
+    validate_store_version(version_directory(store_path, version))
+
+    publish_version(store_path, version)
+    removed = prune_versions(store_path, keep=VECTORSTORE_KEEP_VERSIONS)
+    if removed:
+        print(f"🧹 Pruned old versions of {store_path}: {removed}")
+
+
+def reload_vectorstore(path_load, force=False):
+    """
+    Swaps in the published version of a loaded store. Does nothing when that
+    version is already served (unless `force`) or the store is not loaded yet,
+    since its first load picks up the published version anyway.
+    """
+    if not vectorstore_registry.is_loaded(path_load):
+        return None
+    if not force and vectorstore_registry.version(path_load) == current_version(path_load):
+        return vectorstore_registry.version(path_load)
+
+    print(f"🔄 Reloading vectorstore {path_load}...")
+    db = vectorstore_registry.reload(path_load)
+    print(f"✅ Now serving version {db.version or 'unversioned'} of {path_load}")
+    return db.version
+
+
+def build_enterprise_query(user_question="", is_licensed="", license_type="", service_type="", regulations=""):
     enriched_query = f"""
     استعلام المستخدم: {user_question}
     هل الرخصة مرخصة؟ → {is_licensed}
@@ -51,11 +256,20 @@ def retrieve_relevant_knowledge_enterprise(
     نوع الخدمة → {service_type}
     التنظيمات → {regulations}
     """
+    return enriched_query.strip()
 
-    results = db.similarity_search(enriched_query.strip(), k=k)
 
+def build_regulator_query(license_type="", regulations=""):
+    enriched_query = f"""
+    نوع الترخيص → {license_type}
+    التنظيمات → {regulations}
+    """
+    return enriched_query.strip()
+
+
+def format_results(docs_and_scores):
     formatted_results = []
-    for doc in results:
+    for doc, score in docs_and_scores:
         source = doc.metadata.get("source", "File not specified")
         page = doc.metadata.get("page", "Page not specified")
         content = doc.page_content.strip()
@@ -63,38 +277,249 @@ def retrieve_relevant_knowledge_enterprise(
         formatted_results.append({
             "source": source,
             "page": page,
-            "content": content
+            "content": content,
+            "score": score,
+            # Ready-made clause payload for records indexed from controls documents
+            "result": doc.metadata.get("result")
         })
     return formatted_results
 
 
+# Step 2: Retrieve top-k most relevant documents
+def retrieve_relevant_knowledge_enterprise(
+    path_load: str = "",
+    user_question: str = "",
+    is_licensed: str = "",
+    license_type: str = "",
+    service_type: str = "",
+    regulations: str = "",
+    k: int = 10,
+    filters: Optional[dict] = None,
+    score_threshold: Optional[float] = None,
+    use_mmr: bool = False,
+    fetch_k: Optional[int] = None,
+    lambda_mult: float = 0.5
+):
+    enriched_query = build_enterprise_query(user_question, is_licensed, license_type, service_type, regulations)
+    keyword_query = " ".join([user_question, license_type, service_type, regulations])
+
+    selection = build_selection(score_threshold, use_mmr, fetch_k, lambda_mult)
+    # Holding the store keeps it open if a reload swaps in a new version mid-search
+    with vectorstore_registry.acquire(path_load) as db:
+        results = search_many(db, [enriched_query], [k], [keyword_query], [filters], [selection])[0]
+    return format_results(results)
+
+
 def retrieve_relevant_knowledge_regulator(
     path_load: str = "",
     license_type: str = "",
     regulations: str = "",
-    k: int = 10
+    k: int = 10,
+    filters: Optional[dict] = None,
+    score_threshold: Optional[float] = None,
+    use_mmr: bool = False,
+    fetch_k: Optional[int] = None,
+    lambda_mult: float = 0.5
 ):
-    db = load_vectorstore(path_load)
+    enriched_query = build_regulator_query(license_type, regulations)
+    keyword_query = f"{license_type} {regulations}"
 
-    enriched_query = f"""
-    نوع الترخيص → {license_type}
-    التنظيمات → {regulations}
+    selection = build_selection(score_threshold, use_mmr, fetch_k, lambda_mult)
+    with vectorstore_registry.acquire(path_load) as db:
+        results = search_many(db, [enriched_query], [k], [keyword_query], [filters], [selection])[0]
+    return format_results(results)
+
+
+def build_selection(score_threshold=None, use_mmr=False, fetch_k=None, lambda_mult=0.5) -> Optional[dict]:
+    """Per-query result selection for `search_many`, or None for plain top-k."""
+    if score_threshold is None and not use_mmr:
+        return None
+    return {"score_threshold": score_threshold, "use_mmr": use_mmr, "fetch_k": fetch_k, "lambda_mult": lambda_mult}
+
+
+def _candidate_count(k: int, selection: Optional[dict]) -> int:
+    """Hits a query needs from the index before selection; MMR picks k out of fetch_k."""
+    if selection and selection.get("use_mmr"):
+        return max(k, selection.get("fetch_k") or 4 * k)
+    return k
+
+
+def _stored_vectors(db, ids: np.ndarray) -> np.ndarray:
+    return reconstruct_vectors(
+        db.index, ids, getattr(db, "full_vectors", None), getattr(db, "faiss_ids", None), getattr(db, "ivf_locations", None)
+    )
+
+
+def _cosine_scores(query_vector: np.ndarray, doc_vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(doc_vectors, axis=1) * max(float(np.linalg.norm(query_vector)), 1e-12)
+    return doc_vectors @ query_vector / np.maximum(norms, 1e-12)
+
+
+def select_results(db, query_vector: np.ndarray, ranking: List[int], k: int, selection: Optional[dict] = None,
+                   distances: Optional[Dict[int, float]] = None) -> List[tuple]:
     """
+    Turns a ranked id list into (Document, score) pairs. The score is the
+    cosine similarity between the query and the stored vector, so vector and
+    keyword-only hits are comparable. Hits below `score_threshold` are
+    dropped; with `use_mmr`, k diverse hits are picked from the candidates.
 
-    results = db.similarity_search(enriched_query.strip(), k=k)
+    Scores of vector hits come from their search `distances` and the stored
+    vector norms; vectors are only decoded for MMR, for keyword-only hits and
+    for stores saved without norms.
+    """
+    selection = selection or {}
+    candidates = ranking[:_candidate_count(k, selection)]
+    if not candidates:
+        return []
 
-    formatted_results = []
-    for doc in results:
-        source = doc.metadata.get("source", "File not specified")
-        page = doc.metadata.get("page", "Page not specified")
-        content = doc.page_content.strip()
+    ids = np.array(candidates, dtype=np.int64)
+    norms = getattr(db, "vector_norms", None)
+    doc_vectors = None
+    if selection.get("use_mmr") or norms is None or distances is None:
+        doc_vectors = _stored_vectors(db, ids)
+        scores = _cosine_scores(query_vector, doc_vectors)
+    else:
+        scores = np.empty(len(ids), dtype=np.float32)
+        searched = np.array([int(i) in distances for i in ids])
+        if searched.any():
+            scores[searched] = cosine_from_distances(
+                [distances[int(i)] for i in ids[searched]], max(float(np.linalg.norm(query_vector)), 1e-12), norms[ids[searched]]
+            )
+        if not searched.all():
+            scores[~searched] = _cosine_scores(query_vector, _stored_vectors(db, ids[~searched]))
 
-        formatted_results.append({
-            "source": source,
-            "page": page,
-            "content": content
-        })
-    return formatted_results
+    keep = list(range(len(ids)))
+    if selection.get("score_threshold") is not None:
+        keep = [i for i in keep if scores[i] >= selection["score_threshold"]]
+
+    if selection.get("use_mmr") and keep:
+        picked = maximal_marginal_relevance(query_vector, doc_vectors[keep], selection.get("lambda_mult", 0.5), k)
+        keep = [keep[i] for i in picked]
+
+    return [(db.docstore.search(db.index_to_docstore_id[int(ids[i])]), float(scores[i])) for i in keep[:k]]
+
+
+_keyword_index_lock = threading.Lock()
+
+
+def keyword_index_for(db) -> Optional[KeywordIndex]:
+    """The store's keyword index, memory-mapped on first use; None if it has none."""
+    if not getattr(db, "keyword_index_loaded", True):
+        with _keyword_index_lock:
+            if not db.keyword_index_loaded:
+                db.keyword_index = KeywordIndex.load(db.store_directory)
+                db.keyword_index_loaded = True
+    return getattr(db, "keyword_index", None)
+
+
+def allowed_positions(db, filters: Optional[dict]) -> Optional[np.ndarray]:
+    """FAISS positions a filtered query may return, or None when it is not filtered."""
+    if filter_key(filters) is None:
+        return None
+    metadata_index = getattr(db, "metadata_index", None)
+    if metadata_index is None:
+        raise ValueError("This vectorstore has no metadata index; re-run ingestion to enable filtered search.")
+    return metadata_index.select(filters)
+
+
+def search_many(
+    db,
+    queries: List[str],
+    ks: List[int],
+    keyword_queries: List[str] = None,
+    filters: List[Optional[Dict]] = None,
+    selections: List[Optional[Dict]] = None
+) -> List[list]:
+    """
+    Runs several queries against one store with a single batched embedding
+    pass and one multi-query FAISS search per distinct filter. Returns one
+    list of (Document, score) pairs per query, in input order.
+
+    With HYBRID_SEARCH on, when the store has a keyword index and
+    `keyword_queries` are given, vector and BM25 candidates are merged with
+    reciprocal rank fusion, so exact terms such as regulation names and
+    article numbers are not lost.
+
+    `filters` (source, regulation, license_type, tenant) restrict each query to
+    the records whose metadata matches; only those vectors are scored.
+
+    `selections` (see `build_selection`) apply a minimum score and/or MMR to
+    each query's candidates, reusing the stored vectors instead of
+    re-embedding anything.
+    """
+    if not queries:
+        return []
+
+    keyword_index = keyword_index_for(db) if HYBRID_SEARCH and keyword_queries is not None else None
+    hybrid = keyword_index is not None
+    config = getattr(db, "index_config", None)
+    faiss_ids = getattr(db, "faiss_ids", None)
+    filters = filters or [None] * len(queries)
+    selections = selections or [None] * len(queries)
+
+    vectors = np.array(db.embedding_function.embed_queries(queries), dtype=np.float32)
+    if db._normalize_L2:
+        faiss.normalize_L2(vectors)
+
+    # Queries sharing a filter share one FAISS search
+    groups: Dict[Optional[str], List[int]] = {}
+    for query_idx, query_filters in enumerate(filters):
+        groups.setdefault(filter_key(query_filters), []).append(query_idx)
+
+    all_docs = [[] for _ in queries]
+    for key, members in groups.items():
+        allowed = allowed_positions(db, filters[members[0]]) if key is not None else None
+        if allowed is not None and len(allowed) == 0:
+            continue
+
+        max_k = max(_candidate_count(ks[query_idx], selections[query_idx]) for query_idx in members)
+        fetch_k = max_k * HYBRID_CANDIDATES_FACTOR if hybrid else max_k
+        # The selector is referenced by params and must outlive the search
+        params, selector = filtered_search_params(config, allowed, faiss_ids) if allowed is not None else (None, None)
+        distances, indices = search_vectors(
+            db.index, vectors[members], fetch_k,
+            config, getattr(db, "full_vectors", None), params, faiss_ids
+        )
+
+        for query_idx, row, row_distances in zip(members, indices, distances):
+            # -1 marks missing hits when fewer vectors than requested can match
+            hits = {int(i): float(d) for i, d in zip(row, row_distances) if i != -1}
+            ranking = list(hits)
+            if hybrid:
+                keyword_hits = keyword_index.search(keyword_queries[query_idx], fetch_k, allowed)
+                ranking = reciprocal_rank_fusion([ranking, [position for position, _ in keyword_hits]])
+
+            all_docs[query_idx] = select_results(db, vectors[query_idx], ranking, ks[query_idx], selections[query_idx], hits)
+    return all_docs
+
+
+def retrieve_relevant_knowledge_regulator_batch(path_load: str, queries: List[dict]) -> List[list]:
+    """
+    Batch form of `retrieve_relevant_knowledge_regulator`.
+    Each query is a dict with `license_type`, `regulations` and optional `k`,
+    `filters`, `path_load` (defaults to `path_load`) and the selection options
+    of `build_selection`; queries are batched per store.
+    """
+    stores: Dict[str, List[int]] = {}
+    for query_idx, q in enumerate(queries):
+        stores.setdefault(q.get("path_load") or path_load, []).append(query_idx)
+
+    results = [None] * len(queries)
+    for store_path, members in stores.items():
+        group = [queries[query_idx] for query_idx in members]
+        texts = [build_regulator_query(q.get("license_type", ""), q.get("regulations", "")) for q in group]
+        keyword_texts = [f"{q.get('license_type', '')} {q.get('regulations', '')}" for q in group]
+        ks = [q.get("k", 10) for q in group]
+        filters = [q.get("filters") for q in group]
+        selections = [
+            build_selection(q.get("score_threshold"), q.get("use_mmr", False), q.get("fetch_k"), q.get("lambda_mult", 0.5))
+            for q in group
+        ]
+
+        with vectorstore_registry.acquire(store_path) as db:
+            for query_idx, docs in zip(members, search_many(db, texts, ks, keyword_texts, filters, selections)):
+                results[query_idx] = format_results(docs)
+    return results
 
 
 # For CLI Testing
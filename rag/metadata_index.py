@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import numpy as np
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Union
+from rag.keyword_index import normalize_arabic
+
+# Written next to index.faiss, keyed by FAISS position: the positions of every
+# value back to back, and per value its slice of them (written last)
+METADATA_POSITIONS_FILE = "metadata_positions.npy"
+METADATA_INDEX_FILE = "metadata_index.json"
+METADATA_INDEX_FILES = (METADATA_POSITIONS_FILE, METADATA_INDEX_FILE)
+
+# Record metadata that searches can be restricted to
+FILTER_FIELDS = ("source", "regulation", "license_type", "tenant")
+
+
+def normalize_filter_value(value) -> str:
+    """Folds Arabic spelling variants, case and whitespace so filters match loosely typed values."""
+    return re.sub(r"\s+", " ", normalize_arabic(str(value))).strip()
+
+
+class MetadataIndex:
+    """
+    Per-field inverted index from metadata value to the FAISS positions of the
+    records carrying it. Filtered searches turn a filter into the set of
+    positions that can match and only score those vectors.
+
+    The positions of all values are one sorted-per-value array, memory-mapped
+    on load; only the small value -> [start, end) table is read into memory.
+    """
+
+    def __init__(self, slices: Dict[str, Dict[str, list]], positions: np.ndarray, num_records: int):
+        self.num_records = num_records
+        self.positions = positions
+        self._slices = slices
+
+    @classmethod
+    def build(cls, metadatas: Iterable[dict]) -> "MetadataIndex":
+        postings = {field: defaultdict(list) for field in FILTER_FIELDS}
+        num_records = 0
+        for position, metadata in enumerate(metadatas):
+            num_records += 1
+            for field in FILTER_FIELDS:
+                value = metadata.get(field)
+                if value in (None, ""):
+                    continue
+                postings[field][normalize_filter_value(value)].append(position)
+        return cls.from_postings(postings, num_records)
+
+    @classmethod
+    def from_postings(cls, postings: Dict[str, Dict[str, list]], num_records: int) -> "MetadataIndex":
+        slices, parts, start = {}, [np.empty(0, dtype=np.int64)], 0
+        for field, values in postings.items():
+            slices[field] = {}
+            for value, positions in values.items():
+                parts.append(np.asarray(positions, dtype=np.int64))
+                slices[field][value] = [start, start + len(positions)]
+                start += len(positions)
+        return cls(slices, np.concatenate(parts), num_records)
+
+    def values(self, field: str) -> List[str]:
+        return sorted(self._slices.get(field, {}))
+
+    def _positions(self, field: str, value) -> np.ndarray:
+        start, end = self._slices.get(field, {}).get(normalize_filter_value(value), (0, 0))
+        return self.positions[start:end]
+
+    def select(self, filters: Optional[Dict[str, Union[str, List[str]]]]) -> Optional[np.ndarray]:
+        """
+        Sorted positions matching every field in `filters` (any of the values
+        when a field is given a list). Returns None when nothing is filtered.
+        """
+        filters = {field: value for field, value in (filters or {}).items() if value not in (None, "", [])}
+        if not filters:
+            return None
+
+        selected = None
+        for field, values in filters.items():
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"Unsupported filter '{field}', expected one of {FILTER_FIELDS}")
+            if isinstance(values, str):
+                values = [values]
+            matches = np.unique(np.concatenate([self._positions(field, value) for value in values]))
+            selected = matches if selected is None else np.intersect1d(selected, matches, assume_unique=True)
+            if len(selected) == 0:
+                break
+        return selected
+
+    def save(self, path: str):
+        """Writes the positions, then the value table, which marks the index complete."""
+        np.save(os.path.join(path, METADATA_POSITIONS_FILE), np.ascontiguousarray(self.positions, dtype=np.int64))
+        with open(os.path.join(path, METADATA_INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump({"format": 2, "num_records": self.num_records, "slices": self._slices}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> Optional["MetadataIndex"]:
+        """Memory-maps the positions (or reads them with `mmap=False`); None if the store has no metadata index."""
+        index_path = os.path.join(path, METADATA_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        positions = np.load(os.path.join(path, METADATA_POSITIONS_FILE), mmap_mode="r" if mmap else None)
+        return cls(data["slices"], positions, data["num_records"])
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held in private memory; memory-mapped positions live in the shared page cache."""
+        return 0 if isinstance(self.positions, np.memmap) else self.positions.nbytes
+
+
+def filter_key(filters: Optional[dict]) -> Optional[str]:
+    """Canonical form of a filter, so queries sharing one can share a FAISS search."""
+    filters = {field: value for field, value in (filters or {}).items() if value not in (None, "", [])}
+    if not filters:
+        return None
+    return json.dumps(
+        {field: sorted(normalize_filter_value(v) for v in ([value] if isinstance(value, str) else value))
+         for field, value in filters.items()},
+        sort_keys=True, ensure_ascii=False
+    )
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import mmap
+import pickle
+import numpy as np
+from typing import Iterable, Iterator, Union
+from collections.abc import Mapping
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+# One JSON record per line, in FAISS position order
+DOCSTORE_FILE = "docstore.jsonl"
+# int64 byte offsets, one per record plus the end of the file
+DOCSTORE_OFFSETS_FILE = "docstore.offsets.npy"
+# Legacy LangChain docstore, only read by the one-time migration
+PICKLE_DOCSTORE_FILE = "index.pkl"
+
+
+class MmapDocstoreWriter:
+    """
+    Appends records to a docstore one at a time, so a store can be written
+    while its documents are still being produced. Nothing is visible to
+    readers until `close` renames both files into place, the offsets last.
+    """
+
+    def __init__(self, path: str):
+        self.docstore_path = os.path.join(path, DOCSTORE_FILE)
+        self.offsets_path = os.path.join(path, DOCSTORE_OFFSETS_FILE)
+        self.suffix = f".tmp-{os.getpid()}"
+        self._file = open(self.docstore_path + self.suffix, "wb")
+        self._offsets = [0]
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def add(self, doc: Document):
+        self.add_raw(json.dumps(
+            {"page_content": doc.page_content, "metadata": doc.metadata},
+            ensure_ascii=False
+        ).encode("utf-8") + b"\n")
+
+    def add_raw(self, record: bytes):
+        """Appends an already encoded record line (see `MmapDocstore.raw`)."""
+        self._file.write(record)
+        self._offsets.append(self._offsets[-1] + len(record))
+
+    def close(self) -> int:
+        self._file.close()
+        with open(self.offsets_path + self.suffix, "wb") as f:
+            np.save(f, np.array(self._offsets, dtype=np.int64))
+        os.replace(self.docstore_path + self.suffix, self.docstore_path)
+        os.replace(self.offsets_path + self.suffix, self.offsets_path)
+        return len(self)
+
+    def abort(self):
+        self._file.close()
+        for tmp_path in (self.docstore_path + self.suffix, self.offsets_path + self.suffix):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def write_mmap_docstore(path: str, documents: Iterable[Document]) -> int:
+    """
+    Writes documents (in FAISS position order) as an offset-indexed JSON-lines
+    file that can be memory-mapped read-only. Returns the number of records.
+
+    Both files are written under temporary names and renamed into place, the
+    offsets last, so readers never see a half-written docstore.
+    """
+    writer = MmapDocstoreWriter(path)
+    try:
+        for doc in documents:
+            writer.add(doc)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def has_mmap_docstore(path: str) -> bool:
+    return (
+        os.path.exists(os.path.join(path, DOCSTORE_FILE))
+        and os.path.exists(os.path.join(path, DOCSTORE_OFFSETS_FILE))
+    )
+
+
+def migrate_pickle_docstore(path: str) -> int:
+    """
+    One-time conversion of a store's pickled `index.pkl` docstore into
+    `docstore.jsonl`. This is the only place the pickle is still loaded; after
+    it runs, the store is served without unpickling anything.
+    """
+    pickle_path = os.path.join(path, PICKLE_DOCSTORE_FILE)
+    if not os.path.exists(pickle_path):
+        raise FileNotFoundError(f"❌ No {PICKLE_DOCSTORE_FILE} to migrate in '{path}'.")
+
+    print(f"🔁 Migrating {pickle_path} to {DOCSTORE_FILE}...")
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    count = write_mmap_docstore(
+        path,
+        (docstore.search(index_to_docstore_id[i]) for i in range(len(index_to_docstore_id)))
+    )
+    print(f"✅ Migrated {count} documents.")
+    return count
+
+
+class PositionalIds(Mapping):
+    """`index_to_docstore_id` for stores whose docstore is addressed by FAISS position."""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, position: int) -> int:
+        position = int(position)
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return position
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class MmapDocstore(Docstore):
+    """
+    Read-only docstore over `docstore.jsonl`. The file and its offsets are
+    memory-mapped, so opening a store costs almost nothing, every worker shares
+    the same page-cache pages, and only the records a search returns are
+    turned into Documents.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(os.path.join(path, DOCSTORE_FILE), "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(self._file.name) else b""
+        self._offsets = np.load(os.path.join(path, DOCSTORE_OFFSETS_FILE), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+
+        record = json.loads(self.raw(position))
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def raw(self, position: int) -> bytes:
+        """The encoded record line at `position`, for copying records between docstores without decoding them."""
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return bytes(self._data[start:end])
+
+    def __iter__(self) -> Iterator[Document]:
+        """Every record in position order, decoded one at a time."""
+        for position in range(len(self)):
+            yield self.search(position)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+# One-time migration of existing stores:
+#   python -m rag.mmap_docstore ./database/vectorstore_glasshub/regulator/organization ...
+if __name__ == "__main__":
+    for store_path in sys.argv[1:]:
+        migrate_pickle_docstore(store_path)
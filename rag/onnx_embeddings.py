@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import shutil
+import inspect
+import numpy as np
+from typing import List, Optional
+from langchain_core.embeddings import Embeddings
+
+# Exported models live in <ONNX_MODEL_DIRECTORY>/<model name>/
+ONNX_MODEL_DIRECTORY = os.getenv("ONNX_MODEL_DIRECTORY", "./database/onnx_models")
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model.int8.onnx"
+ONNX_META_FILE = "onnx_export.json"
+# Minimum cosine similarity between ONNX and PyTorch vectors of every validation sentence
+ONNX_COSINE_TOLERANCE = float(os.getenv("EMBEDDING_ONNX_TOLERANCE", "0.98"))
+# paraphrase-multilingual-MiniLM-L12-v2 is trained on 128 tokens
+ONNX_MAX_SEQ_LENGTH = int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", "128"))
+
+VALIDATION_SENTENCES = [
+    "يجب على مقدم الخدمة الإبلاغ عن الحوادث الأمنية خلال 24 ساعة.",
+    "نوع الترخيص → ترخيص تقديم خدمات الاتصالات",
+    "التنظيمات → لائحة حماية البيانات الشخصية",
+    "المادة 12 من نظام الاتصالات وتقنية المعلومات",
+    "يلتزم المرخص له بالاحتفاظ بسجلات المشتركين لمدة لا تقل عن سنة.",
+    "The licensee shall notify the authority of any service outage.",
+    "Personal data must be encrypted at rest and in transit.",
+    "Cloud service providers must obtain prior approval before hosting government data.",
+]
+
+
+def model_directory(model_name: str, base_directory: str = ONNX_MODEL_DIRECTORY) -> str:
+    return os.path.join(base_directory, model_name.replace("/", "__"))
+
+
+def _mean_pooling(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Sentence-transformers pooling: average of the token vectors, ignoring padding."""
+    mask = attention_mask[..., None].astype(np.float32)
+    return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def cosine_similarities(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+
+
+def validate_against_reference(candidate: Embeddings, reference: Embeddings, sentences: List[str] = VALIDATION_SENTENCES,
+                               tolerance: float = ONNX_COSINE_TOLERANCE) -> dict:
+    """Cosine agreement between two embedding models on the same sentences."""
+    similarities = cosine_similarities(candidate.embed_documents(sentences), reference.embed_documents(sentences))
+    return {
+        "sentences": len(sentences),
+        "min_cosine": round(float(similarities.min()), 6),
+        "mean_cosine": round(float(similarities.mean()), 6),
+        "tolerance": tolerance,
+        "passed": bool(similarities.min() >= tolerance)
+    }
+
+
+def export_onnx_model(model_name: str, base_directory: str = ONNX_MODEL_DIRECTORY, quantize: bool = True,
+                      validate: bool = True) -> dict:
+    """
+    Exports the transformer of a sentence-transformers model to ONNX, applies
+    dynamic int8 quantization, and validates the result against the PyTorch
+    model. Everything is written to a temporary directory and renamed into
+    place, so concurrent workers never load a half-written export.
+    Returns the export metadata (also saved as onnx_export.json).
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    target = model_directory(model_name, base_directory)
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging, exist_ok=True)
+
+    try:
+        print(f"📤 Exporting {model_name} to ONNX...")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        tokenizer.save_pretrained(staging)
+
+        sample = tokenizer(VALIDATION_SENTENCES[:2], padding=True, truncation=True, max_length=ONNX_MAX_SEQ_LENGTH, return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        class _Transformer(torch.nn.Module):
+            # Fixed positional order for the exporter, whatever forward() looks like in this transformers version
+            def __init__(self, wrapped):
+                super().__init__()
+                self.wrapped = wrapped
+
+            def forward(self, *inputs):
+                return self.wrapped(**dict(zip(input_names, inputs))).last_hidden_state
+
+        # The TorchScript exporter handles dynamic_axes; newer torch defaults to dynamo
+        export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            torch.onnx.export(
+                _Transformer(model),
+                tuple(sample[name] for name in input_names),
+                os.path.join(staging, ONNX_MODEL_FILE),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                **export_kwargs
+            )
+
+        model_file = ONNX_MODEL_FILE
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print("🗜️ Quantizing weights to int8...")
+            quantize_dynamic(
+                os.path.join(staging, ONNX_MODEL_FILE),
+                os.path.join(staging, ONNX_QUANTIZED_MODEL_FILE),
+                weight_type=QuantType.QInt8
+            )
+            os.remove(os.path.join(staging, ONNX_MODEL_FILE))
+            model_file = ONNX_QUANTIZED_MODEL_FILE
+
+        meta = {"model_name": model_name, "model_file": model_file, "quantized": quantize, "max_seq_length": ONNX_MAX_SEQ_LENGTH}
+        if validate:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            meta["validation"] = validate_against_reference(
+                OnnxEmbeddings(staging, model_file=model_file),
+                HuggingFaceEmbeddings(model_name=model_name)
+            )
+            print(f"🔍 ONNX vs PyTorch: {meta['validation']}")
+
+        with open(os.path.join(staging, ONNX_META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    try:
+        os.rename(staging, target)
+    except OSError:
+        # Another worker finished its export first; keep that one
+        shutil.rmtree(staging, ignore_errors=True)
+        return load_export_meta(target)
+    print(f"✅ ONNX model written to {target}")
+    return meta
+
+
+def load_export_meta(directory: str) -> Optional[dict]:
+    meta_path = os.path.join(directory, ONNX_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings from an exported (optionally int8) ONNX transformer
+    with mean pooling, matching sentence-transformers' output. Inputs are
+    sorted by length before batching so each batch carries little padding.
+    """
+
+    def __init__(self, directory: str, model_file: Optional[str] = None, batch_size: int = 32,
+                 num_threads: int = 0, normalize: bool = False, max_seq_length: int = ONNX_MAX_SEQ_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        meta = load_export_meta(directory) or {}
+        self.directory = directory
+        self.model_file = model_file or meta.get("model_file", ONNX_QUANTIZED_MODEL_FILE)
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.max_seq_length = max_seq_length
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(directory, self.model_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+        inputs = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+        token_embeddings = self.session.run(["last_hidden_state"], inputs)[0]
+        vectors = _mean_pooling(token_embeddings, encoded["attention_mask"])
+        if self.normalize:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        order = np.argsort([len(text) for text in texts])
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch_ids = order[start:start + self.batch_size]
+            batch = self._embed_batch([texts[i] for i in batch_ids])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[batch_ids] = batch
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def load_onnx_embeddings(model_name: str, batch_size: int = 32, num_threads: int = 0, normalize: bool = False,
+                         base_directory: str = ONNX_MODEL_DIRECTORY) -> OnnxEmbeddings:
+    """
+    Loads the ONNX export of `model_name`. Exports are made ahead of time (the
+    image build runs `python -m rag.onnx_embeddings <model>`), never by a
+    serving worker, so this raises if the export is missing or failed its
+    validation against PyTorch.
+    """
+    directory = model_directory(model_name, base_directory)
+    meta = load_export_meta(directory)
+    if meta is None:
+        raise FileNotFoundError(
+            f"❌ No ONNX export of {model_name} in '{directory}'.\n"
+            f"💡 Export it ahead of time with `python -m rag.onnx_embeddings {model_name}`."
+        )
+
+    validation = meta.get("validation")
+    if validation is not None and not validation.get("passed"):
+        raise ValueError(
+            f"❌ ONNX export of {model_name} is outside the cosine tolerance "
+            f"(min {validation['min_cosine']} < {validation['tolerance']})."
+        )
+    return OnnxEmbeddings(directory, meta.get("model_file"), batch_size, num_threads, normalize, meta.get("max_seq_length", ONNX_MAX_SEQ_LENGTH))
+
+
+# Export ahead of time; the Dockerfile does this at image build with --build-arg EMBEDDING_BACKEND=onnx:
+#   python -m rag.onnx_embeddings sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
+if __name__ == "__main__":
+    for name in sys.argv[1:]:
+        export_onnx_model(name)
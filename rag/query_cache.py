@@ -0,0 +1,114 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from rag.embedding_cache import text_hash
+
+
+def normalize_query_text(text: str) -> str:
+    """NFC-normalizes and collapses whitespace so equivalent queries share a cache entry."""
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class QueryEmbeddingCache:
+    """Bounded, thread-safe LRU of query vectors keyed by (model id, normalized text)."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_id: str, text: str) -> Optional[List[float]]:
+        key = (model_id, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(vector)
+
+    def put(self, model_id: str, text: str, vector: List[float]):
+        if self.max_size <= 0:
+            return
+        key = (model_id, text)
+        with self._lock:
+            self._entries[key] = list(vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so `embed_query` is served from a QueryEmbeddingCache.
+    Document embedding goes through the on-disk `document_cache` when one is
+    given (see rag.embedding_cache), so only unseen chunks reach the model.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_id: str, cache: QueryEmbeddingCache, document_cache=None):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache = cache
+        self.document_cache = document_cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.document_cache is None or not texts:
+            return self.embeddings.embed_documents(texts)
+
+        hashes = [text_hash(text) for text in texts]
+        cached = self.document_cache.get_many(self.model_id, hashes)
+
+        # Each distinct unseen chunk is embedded once, in one batch
+        missing = {key: text for key, text in zip(hashes, texts) if key not in cached}
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.document_cache.put_many(self.model_id, computed)
+            cached.update(computed)
+
+        return [[float(value) for value in cached[key]] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        normalized = normalize_query_text(text)
+        vector = self.cache.get(self.model_id, normalized)
+        if vector is None:
+            vector = self.embeddings.embed_query(normalized)
+            self.cache.put(self.model_id, normalized, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeds many queries, running one batched forward pass for the cache misses."""
+        normalized = [normalize_query_text(text) for text in texts]
+        vectors: List[Optional[List[float]]] = [self.cache.get(self.model_id, text) for text in normalized]
+
+        missing = list(dict.fromkeys(text for text, vector in zip(normalized, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            for text, vector in computed.items():
+                self.cache.put(self.model_id, text, vector)
+            vectors = [vector if vector is not None else computed[text] for text, vector in zip(normalized, vectors)]
+
+        return vectors
@@ -0,0 +1,136 @@
+import os
+import uuid
+import shutil
+import threading
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+# <store>/CURRENT names the published version, served from <store>/versions/<version>/
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def new_version_id() -> str:
+    """Sortable, collision-free version name, e.g. 20250101T120000.123456-1a2b3c4d."""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}-{uuid.uuid4().hex[:8]}"
+
+
+def version_directory(store_path: str, version: str) -> str:
+    return os.path.join(store_path, VERSIONS_DIR, version)
+
+
+def list_versions(store_path: str) -> List[str]:
+    versions_path = os.path.join(store_path, VERSIONS_DIR)
+    if not os.path.isdir(versions_path):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_path)
+        if os.path.isdir(os.path.join(versions_path, name))
+    )
+
+
+def current_version(store_path: str) -> Optional[str]:
+    """The published version of a store, or None for stores without versions."""
+    try:
+        with open(os.path.join(store_path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_store_directory(store_path: str) -> Tuple[str, Optional[str]]:
+    """
+    Directory holding the index files to serve, and its version.
+    Stores written before versioning keep their files directly in `store_path`.
+    """
+    version = current_version(store_path)
+    if version is None:
+        return store_path, None
+    return version_directory(store_path, version), version
+
+
+def publish_version(store_path: str, version: str):
+    """
+    Points CURRENT at `version`. The pointer is written to a temporary file
+    and renamed, so readers see either the old version or the new one.
+    """
+    if not os.path.isdir(version_directory(store_path, version)):
+        raise FileNotFoundError(f"❌ Version '{version}' not found in '{store_path}'.")
+
+    current_path = os.path.join(store_path, CURRENT_FILE)
+    tmp_path = f"{current_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, current_path)
+    print(f"📌 Published version {version} of {store_path}")
+
+
+def prune_versions(store_path: str, keep: int = 2) -> List[str]:
+    """
+    Deletes all but the newest `keep` versions, never the published one.
+    Workers still serving a deleted version keep their open/mapped files
+    until they swap, so this is safe on POSIX file systems.
+    """
+    published = current_version(store_path)
+    versions = list_versions(store_path)
+    removed = []
+    for version in versions[:max(0, len(versions) - keep)]:
+        if version == published:
+            continue
+        shutil.rmtree(version_directory(store_path, version), ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+class StoreVersionWatcher:
+    """
+    Polls the CURRENT file of each store and calls `on_change(path)` when the
+    published version changes. Every worker runs its own watcher, so one
+    publish reaches all of them without a restart.
+
+    `store_paths` may be a callable, re-evaluated on every poll, so stores
+    loaded later (e.g. tenant stores) are watched too.
+    """
+
+    def __init__(
+        self,
+        store_paths: Union[Iterable[str], Callable[[], Iterable[str]]],
+        on_change: Callable[[str], None],
+        interval: float = 10.0
+    ):
+        self.store_paths = store_paths if callable(store_paths) else list(store_paths)
+        self.on_change = on_change
+        self.interval = interval
+        self._seen = {path: current_version(path) for path in self._paths()}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _paths(self) -> List[str]:
+        return list(self.store_paths() if callable(self.store_paths) else self.store_paths)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="store-version-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for path in self._paths():
+                version = current_version(path)
+                if path in self._seen and version == self._seen[path]:
+                    continue
+                try:
+                    self.on_change(path)
+                    self._seen[path] = version
+                except Exception as e:
+                    # Keep serving the old version and retry on the next poll
+                    print(f"❌ Failed to switch {path} to version {version}: {e}")
@@ -0,0 +1,279 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+def normalize_store_key(path_load: str) -> str:
+    """Turns any spelling of a vectorstore path into one registry key."""
+    return os.path.normcase(os.path.normpath(os.path.abspath(path_load)))
+
+
+class _StoreHandle:
+    """A loaded store plus the bookkeeping needed to retire it safely."""
+
+    def __init__(self, store, size_bytes: int = 0):
+        self.store = store
+        self.version = getattr(store, "version", None)
+        self.size_bytes = size_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.in_flight = 0
+        self.retired = False
+
+
+class VectorStoreRegistry:
+    """
+    Process-wide cache of loaded FAISS vectorstores, keyed by store path.
+
+    Stores are loaded lazily on first use. Loading holds a per-key lock, so
+    concurrent first requests for the same store share one load while other
+    stores stay available.
+
+    `reload` builds the new version next to the one being served and swaps it
+    in atomically. Searches that hold the old version through `acquire` finish
+    on it; it is closed once the last of them releases it.
+
+    With `max_bytes` / `max_stores` set, the registry is a bounded pool: after
+    each load, least-recently-used stores are evicted (closed once idle) until
+    it fits again. Pinned stores are never evicted.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], object],
+        closer: Optional[Callable[[object], None]] = None,
+        sizer: Optional[Callable[[object], int]] = None,
+        max_bytes: int = 0,
+        max_stores: int = 0
+    ):
+        self._loader = loader
+        self._closer = closer
+        self._sizer = sizer
+        self.max_bytes = max_bytes
+        self.max_stores = max_stores
+        # Least recently used first
+        self._stores: "OrderedDict[str, _StoreHandle]" = OrderedDict()
+        self._paths: Dict[str, str] = {}
+        self._pinned = set()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "loads": 0, "load_failures": 0, "evictions": 0}
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _lookup(self, key: str) -> Optional[_StoreHandle]:
+        """Returns the handle and marks it most recently used. Caller holds `_lock`."""
+        handle = self._stores.get(key)
+        if handle is not None:
+            self._stores.move_to_end(key)
+            handle.last_used = time.time()
+        return handle
+
+    def _load(self, path_load: str) -> _StoreHandle:
+        try:
+            store = self._loader(path_load)
+        except Exception:
+            with self._lock:
+                self._counters["load_failures"] += 1
+            raise
+        handle = _StoreHandle(store, self._sizer(store) if self._sizer else 0)
+        with self._lock:
+            self._counters["loads"] += 1
+        return handle
+
+    def get(self, path_load: str):
+        """Returns the store for `path_load`, loading it once if needed."""
+        key = normalize_store_key(path_load)
+        with self._lock:
+            handle = self._lookup(key)
+            if handle is not None:
+                self._counters["hits"] += 1
+                return handle.store
+
+        with self._key_lock(key):
+            # Another thread may have finished the load while we waited
+            with self._lock:
+                handle = self._lookup(key)
+                if handle is not None:
+                    self._counters["coalesced"] += 1
+                    return handle.store
+                self._counters["misses"] += 1
+
+            handle = self._load(path_load)
+            self._admit(key, path_load, handle)
+            return handle.store
+
+    def _admit(self, key: str, path_load: str, handle: _StoreHandle):
+        """Installs `handle` as the served store, then evicts down to the budget."""
+        with self._lock:
+            old_handle = self._stores.pop(key, None)
+            self._stores[key] = handle
+            self._paths[key] = path_load
+            victims = self._select_victims(key)
+        if old_handle is not None:
+            self._retire(old_handle)
+        for victim_key, victim in victims:
+            print(f"♻️ Evicted vectorstore {victim_key} ({victim.size_bytes} bytes) from the pool")
+            self._retire(victim)
+
+    def _select_victims(self, keep_key: str) -> list:
+        """Pops least-recently-used, unpinned stores until the pool fits. Caller holds `_lock`."""
+        victims = []
+        total_bytes = sum(handle.size_bytes for handle in self._stores.values())
+        for key in list(self._stores):
+            over_bytes = self.max_bytes and total_bytes > self.max_bytes
+            over_count = self.max_stores and len(self._stores) > self.max_stores
+            if not (over_bytes or over_count):
+                break
+            if key == keep_key or key in self._pinned:
+                continue
+            victim = self._stores.pop(key)
+            self._paths.pop(key, None)
+            total_bytes -= victim.size_bytes
+            self._counters["evictions"] += 1
+            victims.append((key, victim))
+        return victims
+
+    @contextmanager
+    def acquire(self, path_load: str):
+        """
+        Yields the current store and keeps it open until the block exits,
+        even if a reload swaps in a newer version meanwhile.
+        """
+        key = normalize_store_key(path_load)
+        loaded = False
+        while True:
+            with self._lock:
+                handle = self._lookup(key)
+                if handle is not None:
+                    handle.in_flight += 1
+                    if not loaded:
+                        self._counters["hits"] += 1
+                    break
+            # `get` counts the miss; an eviction racing with us just loops again
+            self.get(path_load)
+            loaded = True
+
+        try:
+            yield handle.store
+        finally:
+            with self._lock:
+                handle.in_flight -= 1
+                close_now = handle.retired and handle.in_flight == 0
+            if close_now:
+                self._close(handle)
+
+    def reload(self, path_load: str):
+        """
+        Loads `path_load` again and atomically replaces the served store.
+        The old store keeps serving until the swap and is closed after its
+        in-flight searches finish. If the load fails, the old store stays.
+        """
+        key = normalize_store_key(path_load)
+        with self._key_lock(key):
+            new_handle = self._load(path_load)
+            self._admit(key, path_load, new_handle)
+            return new_handle.store
+
+    def _retire(self, handle: _StoreHandle):
+        with self._lock:
+            handle.retired = True
+            close_now = handle.in_flight == 0
+        if close_now:
+            self._close(handle)
+
+    def _close(self, handle: _StoreHandle):
+        if self._closer is not None:
+            self._closer(handle.store)
+
+    def pin(self, path_load: str):
+        """Keeps `path_load` resident regardless of the pool budget."""
+        with self._lock:
+            self._pinned.add(normalize_store_key(path_load))
+
+    def unpin(self, path_load: str):
+        with self._lock:
+            self._pinned.discard(normalize_store_key(path_load))
+
+    def peek(self, path_load: str) -> Optional[object]:
+        """Returns the store if it is already loaded, without loading it."""
+        handle = self._stores.get(normalize_store_key(path_load))
+        return handle.store if handle is not None else None
+
+    def is_loaded(self, path_load: str) -> bool:
+        return self.peek(path_load) is not None
+
+    def version(self, path_load: str) -> Optional[str]:
+        """Version of the store being served for `path_load`, if it is loaded."""
+        handle = self._stores.get(normalize_store_key(path_load))
+        return handle.version if handle is not None else None
+
+    def handle_info(self, path_load: str) -> Optional[dict]:
+        handle = self._stores.get(normalize_store_key(path_load))
+        if handle is None:
+            return None
+        return {
+            "version": handle.version,
+            "size_bytes": handle.size_bytes,
+            "loaded_at": handle.loaded_at,
+            "last_used": handle.last_used,
+            "in_flight": handle.in_flight
+        }
+
+    def invalidate(self, path_load: str) -> bool:
+        """Drops a cached store so the next `get` reloads it from disk."""
+        key = normalize_store_key(path_load)
+        with self._key_lock(key):
+            with self._lock:
+                self._paths.pop(key, None)
+                handle = self._stores.pop(key, None)
+            if handle is None:
+                return False
+            self._retire(handle)
+            return True
+
+    def clear(self):
+        with self._lock:
+            handles = list(self._stores.values())
+            self._stores.clear()
+            self._paths.clear()
+        for handle in handles:
+            self._retire(handle)
+
+    def loaded_paths(self) -> Dict[str, str]:
+        """Maps each registry key to the path it was first loaded from."""
+        with self._lock:
+            return dict(self._paths)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"] + self._counters["coalesced"]
+            return {
+                **self._counters,
+                "hit_rate": round((lookups - self._counters["misses"]) / lookups, 4) if lookups else 0.0,
+                "loaded_stores": len(self._stores),
+                "pinned_stores": len(self._pinned),
+                "resident_bytes": sum(handle.size_bytes for handle in self._stores.values()),
+                "max_bytes": self.max_bytes,
+                "max_stores": self.max_stores,
+                # Least recently used first, i.e. in eviction order
+                "stores": [
+                    {
+                        "path": self._paths.get(key, key),
+                        "version": handle.version,
+                        "size_bytes": handle.size_bytes,
+                        "pinned": key in self._pinned,
+                        "in_flight": handle.in_flight,
+                        "last_used": handle.last_used
+                    }
+                    for key, handle in self._stores.items()
+                ]
+            }
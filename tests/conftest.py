@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Databases, caches and OSS settings must point somewhere harmless before any project module reads them
+_SCRATCH = tempfile.mkdtemp(prefix="rag-tests-")
+for name, value in {
+    "OSS_ACCESS_KEY_ID": "test",
+    "OSS_ACCESS_KEY_SECRET": "test",
+    "OSS_ENDPOINT": "oss-me-central-1.aliyuncs.com",
+    "OSS_BUCKET": "test-bucket",
+    "JOBS_DB_PATH": os.path.join(_SCRATCH, "jobs.sqlite"),
+    "CONTROL_CHECKPOINTS_DB_PATH": os.path.join(_SCRATCH, "control_checkpoints.sqlite"),
+    "EMBEDDING_CACHE_PATH": "",
+    "DOWNLOAD_CACHE_DIRECTORY": os.path.join(_SCRATCH, "download_cache"),
+    "DOCUMENT_PARSE_WORKERS": "1",
+    "CONTROL_RETRY_BACKOFF_SECONDS": "0"
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def hash_embeddings():
+    """Serves the benchmark's deterministic hashing model, so no sentence-transformers model is needed."""
+    from rag.embedding_provider import embedding_provider
+    from benchmarks.retrieval_benchmark import HashEmbeddings
+
+    document_cache = embedding_provider.document_cache
+    embedding_provider.document_cache = None
+    embedding_provider.use_embeddings(HashEmbeddings(64), "hash-64")
+    yield embedding_provider.get()
+    embedding_provider.document_cache = document_cache
+
+
+class FileServer:
+    """
+    Local HTTP server for the files in `files` (name -> bytes). It answers
+    conditional GETs (If-None-Match) with 304 and Range requests guarded by
+    If-Range with 206, like OSS, and records every request it gets. Each
+    response waits `delay` seconds; `max_active` is the most requests it
+    served at once.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.delay = 0.0
+        self.active = self.max_active = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server._lock:
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    time.sleep(server.delay)
+                    self._respond()
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _respond(self):
+                name = self.path.lstrip("/").split("?")[0]
+                server.requests.append({"path": name, "headers": dict(self.headers)})
+                if name not in server.files:
+                    self.send_error(404)
+                    return
+                body = server.files[name]
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                start = 0
+                range_header = self.headers.get("Range")
+                if range_header and self.headers.get("If-Range", etag) == etag:
+                    start = int(range_header.split("=")[1].split("-")[0])
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                else:
+                    self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body) - start))
+                self.end_headers()
+                self.wfile.write(body[start:])
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_port}/{name}"
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def file_server():
+    server = FileServer()
+    yield server
+    server.close()
+
+
+def make_docx(paragraphs) -> bytes:
+    """A .docx file with one heading and the given paragraphs."""
+    import io
+    from docx import Document
+
+    document = Document()
+    document.add_heading("Regulation", level=1)
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
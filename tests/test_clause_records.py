@@ -0,0 +1,57 @@
+import json
+
+from langchain_core.documents import Document
+
+from rag.knowledge_ingestion import build_clause_records, build_records
+from utils.helper_functions import collect_parsed_responses, extract_control_clauses
+
+CLAUSES = [
+    {"title": "البند 1", "description": "يجب حماية البيانات الشخصية", "regulation": "لائحة حماية البيانات الشخصية"},
+    {"title": "البند 2", "description": "", "page": 4},
+    {"title": "Clause 3", "description": "Report incidents within 72 hours", "page": 7},
+]
+
+
+def controls_document(items, source="controls.docx"):
+    return Document(page_content=json.dumps(items, ensure_ascii=False), metadata={"source": source})
+
+
+def test_controls_document_becomes_one_record_per_clause():
+    plain = Document(page_content="نص اللائحة العادي " * 80, metadata={"source": "plain.docx"})
+    records, plain_documents = build_clause_records([controls_document([{"parsed_response": CLAUSES}]), plain])
+
+    assert plain_documents == [plain]
+    # A clause without a description falls back to its title
+    assert [record.page_content for record in records] == ["يجب حماية البيانات الشخصية", "البند 2", "Report incidents within 72 hours"]
+    assert [record.metadata["clause_index"] for record in records] == [0, 1, 2]
+    assert all(record.metadata["record_type"] == "clause" and record.metadata["source"] == "controls.docx" for record in records)
+    assert records[2].metadata["result"] == CLAUSES[2] and records[2].metadata["page"] == 7
+    assert records[0].metadata["regulation"] == "لائحة حماية البيانات الشخصية"
+
+
+def test_clauses_are_gathered_from_every_parsed_response():
+    text = json.dumps([{"parsed_response": CLAUSES[:1]}, {"other": 1}, {"parsed_response": CLAUSES[2:]}], ensure_ascii=False)
+    assert extract_control_clauses(text) == [CLAUSES[0], CLAUSES[2]]
+    assert extract_control_clauses("مستند عادي بلا JSON") is None
+
+
+def test_broken_array_falls_back_to_its_objects():
+    text = "[" + json.dumps({"parsed_response": CLAUSES[:1]}, ensure_ascii=False) + ", {broken"
+    assert extract_control_clauses(text) == CLAUSES[:1]
+
+
+def test_ingestion_metadata_does_not_override_the_clause_own():
+    records = build_records(
+        [controls_document([{"parsed_response": CLAUSES}]), Document(page_content="نص عادي", metadata={"source": "plain.docx"})],
+        {"regulation": "نظام الاتصالات", "tenant": "acme", "unknown": "dropped"}
+    )
+    assert records[0].metadata["regulation"] == "لائحة حماية البيانات الشخصية"
+    assert records[2].metadata["regulation"] == "نظام الاتصالات"
+    assert all(record.metadata["tenant"] == "acme" and "unknown" not in record.metadata for record in records)
+    assert records[-1].metadata.get("record_type") is None
+
+
+def test_search_results_use_the_stored_clause_before_parsing_content():
+    legacy = {"content": json.dumps([{"parsed_response": CLAUSES[2:]}], ensure_ascii=False), "result": None}
+    results = [{"content": "يجب حماية البيانات الشخصية", "result": CLAUSES[0]}, legacy, {"content": "no json", "result": None}]
+    assert collect_parsed_responses(results) == [CLAUSES[0], CLAUSES[2]]
@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+import utils.create_instructions as create_instructions
+import utils.helper_functions as helper_functions
+from utils.control_checkpoints import CHUNK_UNIT, ControlCheckpointStore, document_hash
+
+
+class FakeLLM:
+    """Stands in for the two LLM calls; chunks with "FAIL extraction" and clauses with "FAIL instruction" always fail."""
+
+    def __init__(self):
+        self.extractions = 0
+        self.instructions = 0
+        self.failing_instructions = set()
+
+    def extract(self, endpoint, prompt, max_tokens, thinking):
+        self.extractions += 1
+        if "FAIL extraction" in json.dumps(prompt, ensure_ascii=False):
+            raise RuntimeError("LLM unavailable")
+        descriptions = [clause["description"] for clause in prompt]
+        return {"response": json.dumps({"flattened": [
+            {"title": f"البند {i + 1}", "description": f"{description} clause"} for i, description in enumerate(descriptions)
+        ]}, ensure_ascii=False)}
+
+    def instruct(self, description):
+        self.instructions += 1
+        if "FAIL instruction" in description or description in self.failing_instructions:
+            raise ValueError("not JSON")
+        return json.dumps({"description_control": description})
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(helper_functions, "extract_clauses_with_system_message", fake.extract)
+    monkeypatch.setattr(create_instructions, "generate_clause_instruction", fake.instruct)
+    return fake
+
+
+@pytest.fixture
+def checkpoints(tmp_path):
+    return ControlCheckpointStore(str(tmp_path / "checkpoints.sqlite"))
+
+
+def chunk(source, *descriptions):
+    return {"source": source, "content": json.dumps({"clauses": [{"description": d} for d in descriptions]}, ensure_ascii=False)}
+
+
+def run(checkpoints, chunks, max_attempts=3):
+    stats = {}
+    results = helper_functions.process_all_formatted_results(chunks, checkpoints=checkpoints, stats=stats, max_attempts=max_attempts)
+    return results, stats
+
+
+def test_rerun_resumes_from_checkpoints(llm, checkpoints):
+    chunks = [chunk("a.docx", "حماية البيانات الشخصية", "الإبلاغ عن الحوادث"), chunk("a.docx", "Retain audit records")]
+    first, stats = run(checkpoints, chunks)
+    assert stats["chunks_resumed"] == 0 and stats["clauses"] == 3 and not stats["partial"]
+    calls = (llm.extractions, llm.instructions)
+
+    second, stats = run(checkpoints, chunks)
+    assert (llm.extractions, llm.instructions) == calls
+    assert stats["chunks_resumed"] == 2 and stats["clauses_resumed"] == 3
+    assert second == first
+
+
+def test_only_missing_clauses_are_processed_again(llm, checkpoints):
+    chunks = [chunk("a.docx", "حماية البيانات الشخصية", "Retain audit records")]
+    llm.failing_instructions.add("Retain audit records clause")
+    _, stats = run(checkpoints, chunks, max_attempts=1)
+    assert stats["clauses"] == 1 and stats["clauses_failed"] == 1 and stats["partial"]
+
+    # With a higher limit the failed clause gets another try, the finished one is reused
+    llm.failing_instructions.clear()
+    llm.instructions = 0
+    results, stats = run(checkpoints, chunks, max_attempts=2)
+    assert llm.instructions == 1
+    assert stats["clauses_resumed"] == 1 and stats["clauses"] == 2 and not stats["partial"]
+    assert len(results[0]["parsed_response"]) == 2
+
+
+def test_failing_units_are_retried_then_left_out(llm, checkpoints):
+    chunks = [chunk("a.docx", "FAIL extraction"), chunk("a.docx", "حماية البيانات الشخصية", "FAIL instruction")]
+    results, stats = run(checkpoints, chunks, max_attempts=3)
+    assert llm.extractions == 3 + 1
+    assert llm.instructions == 1 + 3
+    assert stats["chunks_failed"] == 1 and stats["clauses_failed"] == 1 and stats["partial"]
+    assert [item["description"] for item in results[0]["parsed_response"]] == ["حماية البيانات الشخصية clause"]
+
+    # A rerun gets its own attempts: only the failed units reach the LLM again
+    llm.extractions = llm.instructions = 0
+    _, stats = run(checkpoints, chunks, max_attempts=3)
+    assert llm.extractions == 3 and llm.instructions == 3
+    assert stats["chunks_resumed"] == 1 and stats["clauses_resumed"] == 1 and stats["partial"]
+
+
+def test_failures_are_counted_for_the_latest_run(llm, checkpoints):
+    chunks = [chunk("a.docx", "FAIL extraction")]
+    document = document_hash([chunks[0]["content"]], helper_functions.control_pipeline_hash())
+    run(checkpoints, chunks, max_attempts=3)
+    assert checkpoints.load_failures(document, 0) == {CHUNK_UNIT: 3}
+    run(checkpoints, chunks, max_attempts=1)
+    assert checkpoints.load_failures(document, 0) == {CHUNK_UNIT: 1}
+
+    checkpoints.forget(document)
+    assert checkpoints.load_failures(document, 0) == {}
+
+
+def test_forgotten_documents_start_over(llm, checkpoints):
+    chunks = [chunk("a.docx", "حماية البيانات الشخصية"), chunk("b.docx", "Retain audit records")]
+    run(checkpoints, chunks)
+
+    documents = helper_functions.forget_control_checkpoints(chunks[:1], checkpoints=checkpoints)
+    assert documents == helper_functions.control_document_hashes(chunks[:1])
+    llm.extractions = llm.instructions = 0
+    _, stats = run(checkpoints, chunks)
+    assert llm.extractions == 1 and llm.instructions == 1
+    assert stats["chunks_resumed"] == 1 and stats["clauses_resumed"] == 1
+
+
+def test_changing_the_model_starts_over(llm, checkpoints, monkeypatch):
+    chunks = [chunk("a.docx", "حماية البيانات الشخصية")]
+    run(checkpoints, chunks)
+    monkeypatch.setattr(helper_functions, "CONTROL_MODEL_NAME", "another-model")
+    _, stats = run(checkpoints, chunks)
+    assert stats["chunks_resumed"] == 0 and stats["clauses_resumed"] == 0
+
+
+def test_store_round_trip(checkpoints):
+    assert checkpoints.load_chunk("doc", 0) is None
+    checkpoints.save_chunk("doc", 0, "a.docx", [{"description": "حماية البيانات"}])
+    checkpoints.save_clause("doc", 0, 0, "hash", {"description": "حماية البيانات"})
+    assert checkpoints.load_chunk("doc", 0) == [{"description": "حماية البيانات"}]
+    assert checkpoints.load_clauses("doc", 0) == {0: {"description_hash": "hash", "result": {"description": "حماية البيانات"}}}
+    checkpoints.forget("doc")
+    assert checkpoints.load_chunk("doc", 0) is None and checkpoints.load_clauses("doc", 0) == {}
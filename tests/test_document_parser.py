@@ -0,0 +1,70 @@
+from docx import Document
+from docx.enum.text import WD_BREAK
+
+import rag.document_parser as document_parser
+from rag.document_parser import parse_document, parse_documents, parse_docx
+
+
+def write_regulation(path):
+    document = Document()
+    document.add_heading("نظام الاتصالات", level=1)
+    document.add_paragraph("تمهيد النظام.")
+    document.add_heading("الفصل الأول", level=2)
+    document.add_paragraph("المادة 1: يجب الحصول على ترخيص.")
+    document.add_paragraph("").add_run().add_break(WD_BREAK.PAGE)
+    document.add_paragraph("المادة 2: مدة الترخيص خمس سنوات.")
+    table = document.add_table(rows=2, cols=2)
+    for row, cells in zip(table.rows, [("البند", "المدة"), ("الترخيص", "5 سنوات")]):
+        for cell, text in zip(row.cells, cells):
+            cell.text = text
+    document.add_heading("Annex", level=1)
+    document.add_paragraph("Reporting duties.")
+    document.save(str(path))
+    return str(path)
+
+
+def test_sections_carry_heading_paths_and_pages(tmp_path):
+    sections = parse_docx(write_regulation(tmp_path / "law.docx"))
+
+    assert [doc.metadata["heading_path"] for doc in sections] == ["نظام الاتصالات", "نظام الاتصالات > الفصل الأول", "Annex"]
+    chapter = sections[1]
+    assert chapter.page_content.split("\n\n") == [
+        "الفصل الأول", "المادة 1: يجب الحصول على ترخيص.", "المادة 2: مدة الترخيص خمس سنوات.", "البند | المدة\nالترخيص | 5 سنوات"
+    ]
+    # The explicit page break moves article 2 and everything after it to page 2
+    assert (chapter.metadata["page"], chapter.metadata["page_end"]) == (1, 2)
+    assert sections[2].metadata["page"] == 2
+    assert all(doc.metadata["source"] == "law.docx" and doc.metadata["parser"] == "python-docx" for doc in sections)
+    assert [doc.metadata["section_index"] for doc in sections] == [0, 1, 2]
+
+
+def test_whole_file_mode_returns_one_document(tmp_path):
+    documents = parse_docx(write_regulation(tmp_path / "law.docx"), split_sections=False)
+    assert len(documents) == 1
+    assert "Reporting duties." in documents[0].page_content and "المادة 1" in documents[0].page_content
+
+
+def test_files_python_docx_cannot_read_fully_fall_back(tmp_path, monkeypatch):
+    fallback = []
+    monkeypatch.setattr(document_parser, "parse_with_unstructured", lambda path: fallback.append(path) or [])
+
+    empty = tmp_path / "empty.docx"
+    Document().save(str(empty))
+    broken = tmp_path / "broken.docx"
+    broken.write_bytes(b"not a zip file")
+    parse_document(str(empty))
+    parse_document(str(broken))
+    assert fallback == [str(empty), str(broken)]
+
+
+def test_process_pool_keeps_file_order(tmp_path):
+    paths = []
+    for name in ("b.docx", "a.docx", "c.docx"):
+        document = Document()
+        document.add_paragraph(f"content of {name}")
+        document.save(str(tmp_path / name))
+        paths.append(str(tmp_path / name))
+
+    parallel = parse_documents(paths, max_workers=2)
+    assert [doc.page_content for doc in parallel] == ["content of b.docx", "content of a.docx", "content of c.docx"]
+    assert [doc.metadata for doc in parallel] == [doc.metadata for doc in parse_documents(paths, max_workers=1)]
@@ -0,0 +1,145 @@
+import os
+import hashlib
+
+import pytest
+
+from utils.downloader import Downloader, cache_key
+
+BODY = os.urandom(300_000)
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    downloader = Downloader(concurrency=2, cache_directory=str(tmp_path / "cache"))
+    yield downloader
+    downloader.close()
+
+
+@pytest.fixture
+def uncached():
+    downloader = Downloader(concurrency=4, max_bytes=200_000, cache_directory=None)
+    yield downloader
+    downloader.close()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_files_download_concurrently_in_order(uncached, file_server, tmp_path):
+    names = [f"{i}.docx" for i in range(8)]
+    for i, name in enumerate(names):
+        file_server.files[name] = bytes([i]) * 50_000
+    file_server.delay = 0.1
+    results = uncached.download_many([file_server.url(name) for name in names], str(tmp_path / "files"))
+
+    assert [os.path.basename(result["path"]) for result in results] == names
+    assert all(result["ok"] and result["size"] == 50_000 for result in results)
+    assert read(tmp_path / "files" / "3.docx") == bytes([3]) * 50_000
+    # One pooled client, never more requests at once than its limit
+    assert 1 < file_server.max_active <= 4
+
+
+def test_failures_are_reported_per_file(uncached, file_server, tmp_path):
+    file_server.files["ok.docx"] = BODY[:1000]
+    file_server.files["large.docx"] = BODY
+    results = uncached.download_many([file_server.url(name) for name in ("ok.docx", "missing.docx", "large.docx")], str(tmp_path))
+
+    assert [result["ok"] for result in results] == [True, False, False]
+    assert results[1]["status_code"] == 404
+    assert results[2]["error"].startswith("FileTooLarge")
+    # Failed downloads leave neither the file nor a partial one behind
+    assert sorted(os.listdir(tmp_path)) == ["ok.docx"]
+
+
+def test_missing_file_fails_without_leaving_a_file(uncached, file_server, tmp_path):
+    result = uncached.download(file_server.url("missing.docx"), str(tmp_path / "missing.docx"))
+    assert not result["ok"] and result["status_code"] == 404
+    assert not os.path.exists(tmp_path / "missing.docx")
+
+
+def interrupt_after(downloader, url, body, received):
+    """Leaves the cache as a download cut off after `received` bytes would."""
+    paths = downloader.cache.paths(url)
+    with open(paths["part"], "wb") as f:
+        f.write(body[:received])
+    downloader.cache.write_meta(paths, {"url": cache_key(url), "etag": f'"{hashlib.md5(body).hexdigest()}"',
+                                        "last_modified": None, "complete": False})
+
+
+def test_unchanged_file_is_revalidated_with_304(downloader, file_server, tmp_path):
+    file_server.files["a.docx"] = BODY
+    first = downloader.download(file_server.url("a.docx"), str(tmp_path / "first.docx"))
+    second = downloader.download(file_server.url("a.docx"), str(tmp_path / "second.docx"))
+
+    assert first["ok"] and first["cache"] == "miss" and first["bytes"] == len(BODY)
+    assert second["ok"] and second["cache"] == "hit" and second["status_code"] == 304
+    assert second["bytes"] == 0
+    assert "If-None-Match" in file_server.requests[-1]["headers"]
+    assert read(tmp_path / "second.docx") == BODY
+
+
+def test_changed_file_is_downloaded_again(downloader, file_server, tmp_path):
+    file_server.files["a.docx"] = BODY
+    downloader.download(file_server.url("a.docx"), str(tmp_path / "a.docx"))
+    file_server.files["a.docx"] = BODY[::-1]
+    result = downloader.download(file_server.url("a.docx"), str(tmp_path / "a.docx"))
+
+    assert result["ok"] and result["cache"] == "miss" and result["bytes"] == len(BODY)
+    assert read(tmp_path / "a.docx") == BODY[::-1]
+
+
+def test_interrupted_download_resumes_with_range(downloader, file_server, tmp_path):
+    file_server.files["a.docx"] = BODY
+    url = file_server.url("a.docx")
+    interrupt_after(downloader, url, BODY, 100_000)
+    result = downloader.download(url, str(tmp_path / "a.docx"))
+
+    assert result["ok"] and result["cache"] == "resumed" and result["status_code"] == 206
+    assert result["bytes"] == len(BODY) - 100_000
+    assert file_server.requests[-1]["headers"]["Range"] == "bytes=100000-"
+    assert read(tmp_path / "a.docx") == BODY
+    # The completed entry now revalidates like any other
+    assert downloader.download(url, str(tmp_path / "again.docx"))["cache"] == "hit"
+
+
+def test_resume_starts_over_when_the_object_changed(downloader, file_server, tmp_path):
+    url = file_server.url("a.docx")
+    interrupt_after(downloader, url, BODY, 100_000)
+    file_server.files["a.docx"] = BODY[::-1]
+    result = downloader.download(url, str(tmp_path / "a.docx"))
+
+    assert result["ok"] and result["cache"] == "miss" and result["status_code"] == 200
+    assert read(tmp_path / "a.docx") == BODY[::-1]
+
+
+def test_signed_urls_share_one_cache_entry(downloader, file_server, tmp_path):
+    file_server.files["a.docx"] = BODY
+    downloader.download(file_server.url("a.docx") + "?Expires=1&Signature=x&OSSAccessKeyId=k", str(tmp_path / "a.docx"))
+    result = downloader.download(file_server.url("a.docx") + "?Expires=2&Signature=y&OSSAccessKeyId=k", str(tmp_path / "b.docx"))
+    assert result["cache"] == "hit"
+    assert cache_key("http://host/a.docx?Signature=x&v=1") == cache_key("http://host/a.docx?v=1&Signature=y")
+
+
+def test_locked_entry_is_bypassed_not_waited_for(downloader, file_server, tmp_path):
+    file_server.files["a.docx"] = BODY
+    url = file_server.url("a.docx")
+    # Another process is fetching the same object
+    assert downloader.cache.acquire(downloader.cache.paths(url))
+    result = downloader.download(url, str(tmp_path / "a.docx"))
+    assert result["ok"] and read(tmp_path / "a.docx") == BODY
+    assert not os.path.exists(downloader.cache.paths(url)["data"])
+
+
+def test_prune_drops_least_recently_used_entries(downloader, file_server, tmp_path):
+    for name in ("old.docx", "new.docx"):
+        file_server.files[name] = BODY
+        downloader.download(file_server.url(name), str(tmp_path / name))
+    old = downloader.cache.paths(file_server.url("old.docx"))["data"]
+    os.utime(old, (1, 1))
+
+    downloader.cache.max_bytes = len(BODY)
+    downloader.cache.prune()
+    assert not os.path.exists(old)
+    assert os.path.exists(downloader.cache.paths(file_server.url("new.docx"))["data"])
@@ -0,0 +1,100 @@
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from rag.embedding_cache import ChunkEmbeddingCache, text_hash
+from rag.query_cache import CachedQueryEmbeddings, QueryEmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ChunkEmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    yield cache
+    cache.close()
+
+
+def embeddings_with(cache, model_id="model-a"):
+    model = CountingEmbeddings()
+    return CachedQueryEmbeddings(model, model_id, QueryEmbeddingCache(0), document_cache=cache), model
+
+
+def set_used_at(cache, seconds_ago):
+    with cache._lock:
+        cache._connect().execute("UPDATE chunk_embeddings SET used_at = ?", (time.time() - seconds_ago,))
+        cache._connect().commit()
+
+
+def test_only_unseen_chunks_reach_the_model(cache):
+    embeddings, model = embeddings_with(cache)
+    first = embeddings.embed_documents(["حماية البيانات", "license", "حماية البيانات"])
+    assert model.embedded == ["حماية البيانات", "license"]
+
+    second = embeddings.embed_documents(["license", "report incidents", "حماية البيانات"])
+    assert model.embedded == ["حماية البيانات", "license", "report incidents"]
+    assert second[0] == first[1] and second[2] == first[0]
+    assert cache.stats()["hits"] == 2 and cache.stats()["writes"] == 3
+
+
+def test_models_do_not_share_vectors(cache):
+    embeddings_with(cache, "model-a")[0].embed_documents(["license"])
+    other, model = embeddings_with(cache, "model-b")
+    other.embed_documents(["license"])
+    assert model.embedded == ["license"]
+
+    cache.clear("model-a")
+    assert cache.get_many("model-a", [text_hash("license")]) == {}
+    assert text_hash("license") in cache.get_many("model-b", [text_hash("license")])
+
+
+def test_prune_drops_least_recently_used_vectors(tmp_path):
+    # Each vector is 2 float32 values, 8 bytes
+    cache = ChunkEmbeddingCache(str(tmp_path / "embeddings.sqlite"), max_bytes=16)
+    cache.put_many("model", {"old": [1.0, 1.0], "older": [2.0, 2.0]})
+    set_used_at(cache, 3 * 86400)
+    cache.get_many("model", ["old"])
+    cache.put_many("model", {"new": [3.0, 3.0]})
+
+    assert cache.prune() == 1
+    assert sorted(cache.get_many("model", ["old", "older", "new"])) == ["new", "old"]
+    assert cache.prune() == 0
+    cache.close()
+
+
+def test_expired_vectors_are_dropped_on_open(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = ChunkEmbeddingCache(path, max_age_days=1)
+    cache.put_many("model", {"a": [1.0]})
+    set_used_at(cache, 2 * 86400)
+    cache.put_many("model", {"b": [2.0]})
+    cache.close()
+
+    assert sorted(ChunkEmbeddingCache(path, max_age_days=1).get_many("model", ["a", "b"])) == ["b"]
+
+
+def test_cache_without_usage_times_is_migrated(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE chunk_embeddings (model_id TEXT NOT NULL, text_hash TEXT NOT NULL, dimension INTEGER NOT NULL,"
+                       " vector BLOB NOT NULL, PRIMARY KEY (model_id, text_hash)) WITHOUT ROWID")
+    connection.execute("INSERT INTO chunk_embeddings VALUES ('model', 'a', 2, ?)", (np.array([1.0, 2.0], dtype=np.float32).tobytes(),))
+    connection.commit()
+    connection.close()
+
+    cache = ChunkEmbeddingCache(path, max_age_days=1)
+    assert cache.get_many("model", ["a"])["a"].tolist() == [1.0, 2.0]
+    cache.close()
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import rag.knowledge_retriever as knowledge_retriever
+from rag.metadata_index import MetadataIndex
+from benchmarks.retrieval_benchmark import LICENSE_TYPES, REGULATIONS, build_store, make_chunk
+
+SIZE = 1200
+K = 5
+
+
+@pytest.fixture(scope="module", params=["flat", "ivf", "hnsw"])
+def store(request, tmp_path_factory, hash_embeddings):
+    directory = str(tmp_path_factory.mktemp(f"store_{request.param}"))
+    build = build_store(directory, hash_embeddings, SIZE, 0, {"index_type": request.param})
+    return request.param, directory, build["vectors"]
+
+
+def exact_top_k(vectors, query_vector, allowed, k):
+    distances = ((vectors[allowed] - query_vector) ** 2).sum(axis=1)
+    return set(allowed[np.argsort(distances, kind="stable")[:k]].tolist())
+
+
+def search(db, query, filters, k=K):
+    return knowledge_retriever.search_many(db, [query], [k], filters=[filters])[0]
+
+
+@pytest.mark.parametrize("load_mode", ["memory", "mmap"])
+def test_filtered_results_match_the_filter(store, load_mode):
+    index_type, directory, vectors = store
+    db = knowledge_retriever.load_vectorstore(directory, load_mode)
+    try:
+        license_type = LICENSE_TYPES[1]
+        allowed = np.array([p for p in range(SIZE) if make_chunk(p).metadata["license_type"] == license_type])
+        query = make_chunk(int(allowed[7])).page_content
+        query_vector = np.asarray(db.embedding_function.embed_query(query), dtype=np.float32)
+
+        results = search(db, query, {"license_type": license_type})
+        assert len(results) == K
+        assert all(doc.metadata["license_type"] == license_type for doc, _ in results)
+
+        expected = exact_top_k(vectors, query_vector, allowed, K)
+        # Every synthetic chunk ends with its position
+        got = {int(doc.page_content.rsplit("(بند ", 1)[1].rstrip(")")) for doc, _ in results}
+        recall = len(expected & got) / K
+        # Flat search is exact; IVF and HNSW only have to be close
+        assert recall == 1.0 if index_type == "flat" else recall >= 0.6, (expected, got)
+    finally:
+        knowledge_retriever.close_vectorstore(db)
+
+
+def test_filters_combine_fields_and_accept_lists(store):
+    _, directory, _ = store
+    db = knowledge_retriever.load_vectorstore(directory, "mmap")
+    try:
+        regulations = REGULATIONS[:2]
+        license_type = LICENSE_TYPES[0]
+        filters = {"regulation": regulations, "license_type": license_type}
+        results = search(db, f"{license_type} {regulations[0]}", filters, k=10)
+        assert results
+        for doc, _ in results:
+            assert doc.metadata["regulation"] in regulations
+            assert doc.metadata["license_type"] == license_type
+    finally:
+        knowledge_retriever.close_vectorstore(db)
+
+
+def test_filter_without_matches_returns_nothing(store):
+    _, directory, _ = store
+    db = knowledge_retriever.load_vectorstore(directory, "mmap")
+    try:
+        assert search(db, "حماية البيانات", {"source": "missing.docx"}) == []
+        with pytest.raises(ValueError):
+            search(db, "حماية البيانات", {"unknown_field": "x"})
+    finally:
+        knowledge_retriever.close_vectorstore(db)
+
+
+def test_metadata_index_round_trip(tmp_path):
+    metadatas = [{"source": "a.docx", "tenant": "acme"}, {"source": "b.docx"}, {"source": "a.docx", "tenant": ""}]
+    MetadataIndex.build(metadatas).save(str(tmp_path))
+    index = MetadataIndex.load(str(tmp_path))
+
+    assert index.nbytes == 0 and index.values("source") == ["a.docx", "b.docx"]
+    assert index.select({"source": "a.docx"}).tolist() == [0, 2]
+    assert index.select({"source": ["a.docx", "b.docx"], "tenant": "acme"}).tolist() == [0]
+    assert index.select({"tenant": None}) is None
+    assert MetadataIndex.load(str(tmp_path / "missing")) is None
@@ -0,0 +1,98 @@
+import pytest
+
+import rag.knowledge_ingestion as knowledge_ingestion
+from rag.ingestion_manifest import classify_file, load_manifest
+from rag.mmap_docstore import MmapDocstore
+from tests.conftest import make_docx
+
+FILES = {
+    "a.docx": ["يجب على مقدم الخدمة حماية البيانات الشخصية للمستفيدين وعدم مشاركتها دون موافقة مسبقة."],
+    "b.docx": ["The licensee shall report every security incident to the authority within 72 hours."],
+    "c.docx": ["يلتزم المرخص له بالاحتفاظ بسجلات المراجعة الدورية لمدة لا تقل عن خمس سنوات."],
+}
+
+
+def test_classify_file():
+    previous = {"a.docx": {"sha256": "1", "metadata": {"tenant": "x"}}}
+    assert classify_file(previous, "b.docx", "1", {}) == "added"
+    assert classify_file(previous, "a.docx", "2", {"tenant": "x"}) == "changed"
+    # Restamping a file with other metadata changes it too
+    assert classify_file(previous, "a.docx", "1", {"tenant": "y"}) == "changed"
+    assert classify_file(previous, "a.docx", "1", {"tenant": "x"}) == "unchanged"
+
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch, file_server, hash_embeddings):
+    monkeypatch.setattr(knowledge_ingestion, "VECTORSTORE_DIRECTORY", str(tmp_path / "vectorstores"))
+    uploads = []
+    monkeypatch.setattr(knowledge_ingestion, "upload_vectorstore", lambda build, path: uploads.append(path))
+
+    def run(names, **options):
+        urls = [file_server.url(name) for name in names]
+        return knowledge_ingestion.ingest_company_knowledge(urls, str(tmp_path / "downloads"), "tests/store", **options)
+
+    run.build_directory = knowledge_ingestion.build_directory_for("tests/store")
+    run.uploads = uploads
+    return run
+
+
+def stored_texts(directory):
+    docstore = MmapDocstore(directory)
+    try:
+        return [doc.page_content for doc in docstore]
+    finally:
+        docstore.close()
+
+
+def test_only_added_changed_and_removed_files_touch_the_index(ingest, file_server):
+    for name in ("a.docx", "b.docx"):
+        file_server.files[name] = make_docx(FILES[name])
+    report = ingest(["a.docx", "b.docx"])
+    assert report["ingestion"]["mode"] == "full"
+    first_ids = load_manifest(ingest.build_directory)["files"]["a.docx"]["ids"]
+    total = report["ingestion"]["total_vectors"]
+
+    # Unchanged files keep their vectors and ids
+    report = ingest(["a.docx", "b.docx"])
+    assert report["ingestion"]["mode"] == "unchanged"
+
+    file_server.files["b.docx"] = make_docx(FILES["b.docx"] + ["Records must be encrypted at rest."])
+    file_server.files["c.docx"] = make_docx(FILES["c.docx"])
+    report = ingest(["a.docx", "b.docx", "c.docx"])
+    files = report["ingestion"]["files"]
+    assert report["ingestion"]["mode"] == "incremental"
+    assert (files["added"], files["changed"], files["unchanged"]) == (["c.docx"], ["b.docx"], ["a.docx"])
+    manifest = load_manifest(ingest.build_directory)
+    assert manifest["files"]["a.docx"]["ids"] == first_ids
+    assert report["ingestion"]["added_vectors"] == len(manifest["files"]["b.docx"]["ids"]) + len(manifest["files"]["c.docx"]["ids"])
+    assert any("encrypted at rest" in text for text in stored_texts(ingest.build_directory))
+
+    # A file no longer listed is removed with its vectors
+    report = ingest(["b.docx", "c.docx"])
+    assert report["ingestion"]["files"]["removed"] == ["a.docx"]
+    assert report["ingestion"]["removed_vectors"] == len(first_ids)
+    assert "a.docx" not in load_manifest(ingest.build_directory)["files"]
+    texts = stored_texts(ingest.build_directory)
+    assert len(texts) == report["ingestion"]["total_vectors"]
+    assert not any("حماية البيانات الشخصية" in text for text in texts)
+    assert total > 0 and ingest.uploads == ["tests/store"] * 3
+
+
+def test_failed_download_keeps_the_previous_vectors(ingest, file_server):
+    for name in ("a.docx", "b.docx"):
+        file_server.files[name] = make_docx(FILES[name])
+    ingest(["a.docx", "b.docx"])
+    del file_server.files["b.docx"]
+
+    report = ingest(["a.docx", "b.docx"])
+    assert report["ingestion"]["mode"] == "unchanged"
+    assert report["ingestion"]["files"]["kept_after_failed_download"] == ["b.docx"]
+    assert "b.docx" in load_manifest(ingest.build_directory)["files"]
+
+
+def test_new_index_options_force_a_full_rebuild(ingest, file_server):
+    file_server.files["a.docx"] = make_docx(FILES["a.docx"])
+    ingest(["a.docx"])
+    report = ingest(["a.docx"], compression="fp16")
+    assert report["ingestion"]["mode"] == "full"
+    assert report["ingestion"]["reason"] == "index options changed"
@@ -0,0 +1,96 @@
+import faiss
+import numpy as np
+import pytest
+
+from rag.index_builder import (build_faiss_index, build_index_config, evaluate_index, search_vectors, storage_report,
+                               stored_ids, update_faiss_index)
+
+
+def clustered_vectors(count=2000, dimension=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dimension))
+    return (centers[rng.integers(0, 20, count)] + rng.normal(scale=0.3, size=(count, dimension))).astype(np.float32)
+
+
+def test_index_config_per_type():
+    ivf = build_index_config(2000, 32, "ivf", nprobe=500)
+    assert ivf["nlist"] == 2000 // 39 and ivf["nprobe"] == ivf["nlist"]
+    assert ivf["factory"] == f"IVF{ivf['nlist']},Flat"
+    assert build_index_config(2000, 32, "hnsw")["factory"] == "HNSW32"
+    assert build_index_config(2000, 32, "HNSW", hnsw_m=16, compression="sq8")["factory"] == "HNSW16_SQ8"
+    assert build_index_config(2000, 32)["factory"] == "Flat"
+    with pytest.raises(ValueError):
+        build_index_config(2000, 32, "lsh")
+
+
+@pytest.mark.parametrize("index_type, options, min_recall", [
+    ("flat", {}, 1.0),
+    ("ivf", {"nprobe": 16}, 0.9),
+    ("hnsw", {}, 0.9),
+])
+def test_each_index_type_finds_the_exact_neighbors(index_type, options, min_recall):
+    vectors = clustered_vectors()
+    config = build_index_config(len(vectors), vectors.shape[1], index_type, **options)
+    index = build_faiss_index(vectors, config)
+    report = evaluate_index(index, vectors, config, num_queries=50, k=10)
+    assert index.ntotal == len(vectors)
+    assert report["recall_at_10"] >= min_recall, report
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_stable_ids_survive_removal_and_additions(index_type):
+    vectors = clustered_vectors(1000)
+    config = build_index_config(len(vectors), vectors.shape[1], index_type, nprobe=64)
+    index = build_faiss_index(vectors, config, np.arange(len(vectors)))
+    assert stored_ids(index) is None
+
+    extra = clustered_vectors(10, seed=1)
+    index = update_faiss_index(index, config, np.arange(100), extra, np.arange(1000, 1010), full_vectors=vectors)
+    ids = stored_ids(index)
+    assert len(ids) == 910 and ids[0] == 100 and ids[-1] == 1009
+
+    # Hits come back as positions in the sorted ids
+    _, positions = search_vectors(index, extra[:1], 1, ids=ids)
+    assert ids[positions[0, 0]] == 1000
+
+
+def test_pq_code_books_are_sized_to_the_training_set():
+    assert build_index_config(100_000, 32, compression="pq")["pq_nbits"] == 8
+    # 5000 / 39 points only train 2^7 centroids
+    config = build_index_config(5000, 32, compression="pq", pq_m=48)
+    assert config["pq_nbits"] == 7 and config["pq_m"] == 32 and config["factory"] == "PQ32x7"
+
+    small = build_index_config(500, 32, compression="pq", rerank=True)
+    assert small["compression"] == "sq8" and small["factory"] == "SQ8" and "pq_nbits" not in small
+    assert small["rerank"]
+
+
+@pytest.mark.parametrize("compression, ratio", [("fp16", 2), ("sq8", 4)])
+def test_compressed_storage_is_smaller(tmp_path, compression, ratio):
+    vectors = clustered_vectors()
+    config = build_index_config(len(vectors), vectors.shape[1], compression=compression)
+    index = build_faiss_index(vectors, config)
+    faiss.write_index(index, str(tmp_path / "index.faiss"))
+    assert storage_report(str(tmp_path), index)["compression_ratio"] == pytest.approx(ratio, rel=0.05)
+
+
+@pytest.mark.parametrize("compression", ["sq8", "pq"])
+def test_rerank_orders_candidates_by_exact_distance(compression):
+    vectors = clustered_vectors(5000)
+    queries = vectors[:20] + np.random.default_rng(2).normal(scale=0.1, size=(20, vectors.shape[1])).astype(np.float32)
+    exact = np.argsort(((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2), axis=1)[:, :10]
+
+    config = build_index_config(len(vectors), vectors.shape[1], compression=compression, pq_m=8, rerank=True,
+                                rerank_factor=10)
+    index = build_faiss_index(vectors, config)
+    _, plain = search_vectors(index, queries, 10, {**config, "rerank": False})
+    distances, reranked = search_vectors(index, queries, 10, config, vectors)
+
+    def recall(found):
+        return np.mean([len(set(f) & set(e)) / 10 for f, e in zip(found, exact)])
+
+    assert recall(reranked) >= 0.9 and recall(reranked) > recall(plain)
+    # Distances are exact float32 ones, in ascending order
+    expected = ((vectors[reranked] - queries[:, None, :]) ** 2).sum(axis=2)
+    assert np.allclose(distances, expected, rtol=1e-4, atol=1e-4)
+    assert np.all(np.diff(distances, axis=1) >= 0)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from rag.ingestion_pipeline import Batcher, IngestionPipeline
+from rag.mmap_docstore import MmapDocstore, MmapDocstoreWriter, has_mmap_docstore
+
+
+def test_items_flow_through_every_stage():
+    batcher = Batcher(4)
+    results = []
+    lock = threading.Lock()
+
+    def sink(batch):
+        with lock:
+            results.append(batch)
+
+    stats = (IngestionPipeline(range(10))
+             .stage("split", lambda n: [[n] * 2], workers=3)
+             .stage("batch", batcher, flush=batcher.flush)
+             .run(sink))
+
+    assert sorted(sum(results, [])) == sorted(list(range(10)) * 2)
+    assert [len(batch) for batch in results] == [4, 4, 4, 4, 4]
+    assert stats["stages"]["split"]["items_in"] == 10 and stats["stages"]["split"]["workers"] == 3
+    assert stats["stages"]["batch"]["items_out"] == 5
+
+
+def test_bounded_queues_hold_back_the_source():
+    pulled, sunk = [], []
+    in_flight = []
+
+    def source():
+        for n in range(50):
+            pulled.append(n)
+            in_flight.append(len(pulled) - len(sunk))
+            yield n
+
+    def slow_sink(item):
+        time.sleep(0.002)
+        sunk.append(item)
+
+    IngestionPipeline(source(), queue_size=2).stage("a", lambda n: [n]).stage("b", lambda n: [n]).run(slow_sink)
+    assert len(sunk) == 50
+    # Two queues of two, one item in each worker and one being fed
+    assert max(in_flight) <= 8
+
+
+def test_first_error_stops_the_pipeline_and_is_raised():
+    seen = []
+
+    def fail_on_three(n):
+        if n == 3:
+            raise ValueError("unreadable file")
+        return [n]
+
+    with pytest.raises(ValueError, match="unreadable file"):
+        IngestionPipeline(range(1000)).stage("parse", fail_on_three).run(seen.append)
+    assert len(seen) < 1000
+
+    def broken_source():
+        yield 1
+        raise OSError("download failed")
+
+    with pytest.raises(OSError):
+        IngestionPipeline(broken_source()).stage("parse", lambda n: [n]).run(lambda item: None)
+
+
+def test_stage_shape_is_checked():
+    with pytest.raises(ValueError):
+        IngestionPipeline([]).stage("batch", Batcher(2), workers=2, flush=lambda: [])
+    with pytest.raises(ValueError):
+        IngestionPipeline([]).run(lambda item: None)
+
+
+def test_docstore_writer_streams_records_to_disk(tmp_path):
+    (tmp_path / "store").mkdir()
+    (tmp_path / "aborted").mkdir()
+    writer = MmapDocstoreWriter(str(tmp_path / "store"))
+    for n in range(3):
+        writer.add(Document(page_content=f"البند {n}", metadata={"source": "a.docx", "position": n}))
+    assert writer.close() == 3
+
+    docstore = MmapDocstore(str(tmp_path / "store"))
+    try:
+        assert [doc.page_content for doc in docstore] == ["البند 0", "البند 1", "البند 2"]
+        assert docstore.search(2).metadata == {"source": "a.docx", "position": 2}
+    finally:
+        docstore.close()
+
+    aborted = MmapDocstoreWriter(str(tmp_path / "aborted"))
+    aborted.add(Document(page_content="partial"))
+    aborted.abort()
+    assert not has_mmap_docstore(str(tmp_path / "aborted"))
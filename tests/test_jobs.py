@@ -0,0 +1,138 @@
+import time
+import threading
+
+import pytest
+from fastapi.responses import JSONResponse
+
+from utils import jobs
+from utils.jobs import FINISHED_STATUSES, JobManager, JobStore, check_cancelled, report_progress
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(jobs, "CANCEL_CHECK_INTERVAL", 0.0)
+    monkeypatch.setattr(jobs, "JOB_SLOT_WAIT_INTERVAL", 0.05)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+@pytest.fixture
+def manager(store):
+    manager = JobManager(store, {"work": 1})
+    yield manager
+    manager.shutdown()
+
+
+def wait_for(store, job_id, statuses=FINISHED_STATUSES, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id, with_result=True)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"{job_id} stayed {store.get(job_id)['status']}")
+
+
+def test_successful_job_records_progress_and_result(manager, store):
+    def work(value):
+        report_progress(0.5, "Halfway")
+        check_cancelled()
+        return {"success": True, "value": value}
+
+    job_id = manager.submit("work", work, 42, params={"value": 42})
+    job = wait_for(store, job_id)
+    assert job["status"] == "succeeded" and job["progress"] == 1
+    assert job["result"] == {"success": True, "value": 42}
+    assert job["params"] == {"value": 42}
+    assert job["started_at"] <= job["finished_at"]
+
+
+@pytest.mark.parametrize("outcome, error", [
+    ({"success": False, "message": "Nothing to index"}, "Nothing to index"),
+    (JSONResponse(status_code=400, content={"error": "Bad input"}), "Bad input"),
+])
+def test_reported_failures_fail_the_job(manager, store, outcome, error):
+    job = wait_for(store, manager.submit("work", lambda: outcome))
+    assert job["status"] == "failed" and job["error"] == error
+
+
+def test_exception_fails_the_job(manager, store):
+    def work():
+        raise ValueError("broken file")
+
+    job = wait_for(store, manager.submit("work", work))
+    assert job["status"] == "failed" and job["error"] == "ValueError: broken file"
+
+
+def test_queued_job_cancelled_before_it_starts(manager, store):
+    release = threading.Event()
+    blocker = manager.submit("work", release.wait, 10)
+    wait_for(store, blocker, ("running",))
+    queued = manager.submit("work", lambda: {"success": True})
+
+    assert manager.cancel(queued)["cancel_requested"]
+    release.set()
+    assert wait_for(store, queued)["status"] == "cancelled"
+    assert store.get(queued)["started_at"] is None
+    assert wait_for(store, blocker)["status"] == "succeeded"
+
+
+def test_running_job_stops_at_its_next_check(manager, store):
+    started = threading.Event()
+
+    def work():
+        started.set()
+        while True:
+            check_cancelled()
+            time.sleep(0.01)
+
+    job_id = manager.submit("work", work)
+    started.wait(5)
+    manager.cancel(job_id)
+    assert wait_for(store, job_id)["status"] == "cancelled"
+
+
+def test_slot_limit_holds_across_workers(store):
+    # Two managers on one database stand in for two worker processes
+    first, second = JobManager(store, {"work": 1}), JobManager(JobStore(store.path), {"work": 1})
+    release = threading.Event()
+    try:
+        running = first.submit("work", release.wait, 10)
+        wait_for(store, running, ("running",))
+        waiting = second.submit("work", lambda: {"success": True})
+        time.sleep(0.3)
+        job = store.get(waiting)
+        assert job["status"] == "queued" and job["message"] == "Waiting for a free slot"
+
+        release.set()
+        assert wait_for(store, waiting)["status"] == "succeeded"
+    finally:
+        release.set()
+        first.shutdown()
+        second.shutdown()
+
+
+def test_orphaned_jobs_fail_when_their_process_is_gone(store):
+    # Above any pid the kernel hands out
+    dead_pid = 2 ** 31 - 1
+    store.create("work-dead", "work", None)
+    store._execute("UPDATE jobs SET pid = ?, status = 'running' WHERE id = 'work-dead'", (dead_pid,))
+    store.create("work-reused", "work", None)
+    # Same pid as a live process, but another process identity: the pid was reused
+    store._execute("UPDATE jobs SET pid_token = 'other-boot:1' WHERE id = 'work-reused'")
+    store.create("work-alive", "work", None)
+
+    assert store.fail_orphaned() == 2
+    assert store.get("work-dead")["status"] == "failed"
+    assert store.get("work-reused")["status"] == "failed"
+    assert store.get("work-alive")["status"] == "queued"
+
+
+def test_concurrency_spec_overrides_defaults():
+    concurrency = jobs.parse_concurrency("create_rag_system=2, extract_terms=0")
+    assert concurrency["create_rag_system"] == 2
+    assert concurrency["extract_terms"] == 1
+    assert concurrency["generate_controls"] == 1
@@ -0,0 +1,64 @@
+import numpy as np
+
+from rag.keyword_index import KeywordIndex, normalize_arabic, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "يجب على مقدم الخدمة حماية البيانات الشخصية للمستفيدين",
+    "The licensee shall report incidents within 72 hours",
+    "المادة 12 من لائحة جودة الخدمة",
+    "يلتزم المرخص له بالإبلاغ عن الحوادث السيبرانية",
+    "Data protection officer must approve the retention policy",
+]
+
+
+def test_normalization_folds_arabic_variants():
+    assert normalize_arabic("إِلْتِزَامـــ") == normalize_arabic("التزام")
+    assert normalize_arabic("مدرسة") == normalize_arabic("مدرسه")
+    assert tokenize("والبيانات") == tokenize("البيانات") == ["بيانات"]
+    assert "12" in tokenize("المادة 12")
+
+
+def test_search_ranks_matching_records_first():
+    index = KeywordIndex.build(TEXTS)
+    hits = index.search("حماية البيانات", k=3)
+    assert hits[0][0] == 0
+    assert all(score > 0 for _, score in hits)
+
+    # Article numbers are kept as terms
+    assert index.search("المادة 12", k=1)[0][0] == 2
+    assert index.search("incidents 72 hours", k=1)[0][0] == 1
+    assert index.search("nothing matches this", k=5) == []
+
+
+def test_search_respects_allowed_positions():
+    index = KeywordIndex.build(TEXTS)
+    hits = index.search("البيانات data protection", k=5, allowed=np.array([4]))
+    assert [position for position, _ in hits] == [4]
+    assert index.search("البيانات", k=5, allowed=np.array([], dtype=np.int64)) == []
+
+
+def test_save_and_memory_mapped_load_give_the_same_results(tmp_path):
+    index = KeywordIndex.build(TEXTS)
+    index.save(str(tmp_path))
+    loaded = KeywordIndex.load(str(tmp_path))
+
+    assert loaded.num_docs == len(TEXTS)
+    assert loaded.nbytes == 0
+    for query in ("حماية البيانات", "incidents", "الحوادث السيبرانية"):
+        assert loaded.search(query, k=3) == index.search(query, k=3)
+
+
+def test_load_without_index_returns_none(tmp_path):
+    assert KeywordIndex.load(str(tmp_path)) is None
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]])
+    assert fused[0] == 1
+    assert fused.index(3) < fused.index(2)
+    assert set(fused) == {1, 2, 3, 4}
+
+
+def test_reciprocal_rank_fusion_of_one_list_keeps_its_order():
+    assert reciprocal_rank_fusion([[5, 2, 9]]) == [5, 2, 9]
+    assert reciprocal_rank_fusion([[], []]) == []
@@ -0,0 +1,93 @@
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks.retrieval_benchmark import HashEmbeddings
+from rag.embedding_provider import EmbeddingProvider
+from rag.onnx_embeddings import ONNX_META_FILE, load_onnx_embeddings, model_directory, validate_against_reference
+
+WORDS = ["ترخيص", "الطيف", "حماية", "البيانات", "license", "incident", "report"]
+DIMENSION = 8
+
+
+def save_tiny_model(directory, validation_passed=True):
+    """A word-embedding lookup exported like a transformer: token ids in, last_hidden_state out."""
+    import onnx
+    from onnx import TensorProto, helper
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocabulary = {"[PAD]": 0, "[UNK]": 1, **{word: i + 2 for i, word in enumerate(WORDS)}}
+    tokenizer = Tokenizer(models.WordLevel(vocabulary, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="[PAD]", unk_token="[UNK]").save_pretrained(directory)
+
+    table = np.random.default_rng(0).normal(size=(len(vocabulary), DIMENSION)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+        "tiny",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "tokens"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "tokens"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "tokens", DIMENSION])],
+        [helper.make_tensor("table", TensorProto.FLOAT, table.shape, table.flatten())]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8)
+    onnx.save(model, str(directory / "model.onnx"))
+
+    validation = {"passed": validation_passed, "min_cosine": 0.99 if validation_passed else 0.5, "tolerance": 0.98}
+    with open(directory / ONNX_META_FILE, "w", encoding="utf-8") as f:
+        json.dump({"model_file": "model.onnx", "max_seq_length": 16, "validation": validation}, f)
+    return {word: table[i] for word, i in vocabulary.items()}
+
+
+@pytest.fixture
+def export(tmp_path):
+    directory = tmp_path / model_directory("org/tiny", "")
+    directory.mkdir(parents=True)
+    return str(tmp_path), save_tiny_model(directory)
+
+
+def test_embeddings_are_mean_pooled_without_padding(export):
+    base_directory, table = export
+    embeddings = load_onnx_embeddings("org/tiny", batch_size=2, base_directory=base_directory)
+    texts = ["ترخيص الطيف", "license", "حماية البيانات report incident", "unknown word"]
+    vectors = np.array(embeddings.embed_documents(texts))
+
+    # Batched by length, returned in input order; padding never counts
+    for text, vector in zip(texts, vectors):
+        expected = np.mean([table.get(word, table["[UNK]"]) for word in text.split()], axis=0)
+        assert np.allclose(vector, expected, atol=1e-6)
+    assert np.allclose(embeddings.embed_query(texts[0]), vectors[0], atol=1e-6)
+    assert embeddings.embed_documents([]) == []
+
+
+def test_normalized_embeddings_have_unit_length(export):
+    base_directory, _ = export
+    embeddings = load_onnx_embeddings("org/tiny", normalize=True, base_directory=base_directory)
+    assert np.allclose(np.linalg.norm(embeddings.embed_documents(["ترخيص", "license report"]), axis=1), 1.0)
+
+
+def test_missing_or_invalid_export_fails_fast(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_onnx_embeddings("org/missing", base_directory=str(tmp_path))
+
+    directory = tmp_path / model_directory("org/tiny", "")
+    directory.mkdir(parents=True)
+    save_tiny_model(directory, validation_passed=False)
+    with pytest.raises(ValueError):
+        load_onnx_embeddings("org/tiny", base_directory=str(tmp_path))
+
+
+def test_validation_compares_against_the_reference(export):
+    base_directory, _ = export
+    embeddings = load_onnx_embeddings("org/tiny", base_directory=base_directory)
+    assert validate_against_reference(embeddings, embeddings)["passed"]
+    assert not validate_against_reference(embeddings, HashEmbeddings(DIMENSION), sentences=WORDS)["passed"]
+
+
+def test_backends_never_share_cache_entries():
+    torch_provider = EmbeddingProvider(backend="torch", document_cache_path="")
+    onnx_provider = EmbeddingProvider(backend="onnx", document_cache_path="")
+    assert torch_provider.model_id != onnx_provider.model_id
+    assert onnx_provider.model_id.endswith("|backend=onnx")
@@ -0,0 +1,84 @@
+from langchain_core.embeddings import Embeddings
+
+from rag.embedding_provider import EmbeddingProvider
+from rag.query_cache import CachedQueryEmbeddings, QueryEmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.queries = []
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 0.0]
+
+
+def cached(max_size=2, model_id="model-a"):
+    model = CountingEmbeddings()
+    return CachedQueryEmbeddings(model, model_id=model_id, cache=QueryEmbeddingCache(max_size)), model
+
+
+def test_repeated_query_is_a_hit():
+    embeddings, model = cached()
+    first = embeddings.embed_query("ترخيص الطيف الترددي")
+    # Whitespace differences share the entry
+    assert embeddings.embed_query("  ترخيص   الطيف\nالترددي ") == first
+    assert model.queries == ["ترخيص الطيف الترددي"]
+    assert embeddings.cache.stats()["hits"] == 1 and embeddings.cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_query_is_evicted():
+    embeddings, model = cached(max_size=2)
+    embeddings.embed_query("a")
+    embeddings.embed_query("bb")
+    embeddings.embed_query("a")  # bb is now the least recently used
+    embeddings.embed_query("ccc")
+
+    assert embeddings.cache.stats()["size"] == 2
+    embeddings.embed_query("a")
+    assert model.queries == ["a", "bb", "ccc"]
+    embeddings.embed_query("bb")
+    assert model.queries == ["a", "bb", "ccc", "bb"]
+
+
+def test_entries_are_kept_apart_per_model():
+    cache = QueryEmbeddingCache(8)
+    cache.put("model-a", "query", [1.0])
+    assert cache.get("model-b", "query") is None
+    assert cache.get("model-a", "query") == [1.0]
+
+
+def test_zero_size_disables_the_cache():
+    embeddings, model = cached(max_size=0)
+    embeddings.embed_query("a")
+    embeddings.embed_query("a")
+    assert model.queries == ["a", "a"]
+
+
+def test_batch_embeds_each_miss_once():
+    embeddings, model = cached(max_size=8)
+    embeddings.embed_query("a")
+    vectors = embeddings.embed_queries(["a", "bb", "bb ", "ccc"])
+
+    assert model.batches == [["bb", "ccc"]]
+    assert vectors[1] == vectors[2]
+    assert len(vectors) == 4 and all(vector is not None for vector in vectors)
+
+
+def test_swapping_the_model_clears_cached_queries():
+    provider = EmbeddingProvider(query_cache_size=8, document_cache_path="")
+    first = CountingEmbeddings()
+    provider.use_embeddings(first, "model-a")
+    provider.get().embed_query("a")
+    assert provider.query_cache.stats()["size"] == 1
+
+    second = CountingEmbeddings()
+    provider.use_embeddings(second, "model-b")
+    assert provider.query_cache.stats()["size"] == 0
+    provider.get().embed_query("a")
+    assert second.queries == ["a"]
@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from agent.reports import Reports
+
+IMAGES = [f"/evidence/image_{n}.png" for n in range(6)]
+
+
+class FakeVLM:
+    """Answers like the VLM endpoint; earlier images take longer, so they finish last when run at once."""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.failing = set()
+        self._lock = threading.Lock()
+
+    def invoke(self, messages, image_paths=None, language=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            image = image_paths[0]
+            time.sleep(0.01 * (len(IMAGES) - IMAGES.index(image)))
+            if image in self.failing:
+                raise RuntimeError("VLM unavailable")
+            if "Return a JSON object" in messages[0].content:
+                report = messages[0].content.split("Report:")[-1].strip()
+                return SimpleNamespace(content=json.dumps({"compliance_status": "COMPLIANT", "Brief_report": report}))
+            return SimpleNamespace(content=f"report of {image}")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def reports():
+    reports = Reports("check", "English", "C-1", list(IMAGES), {"title": "Access control"}, api="http://vlm.invalid")
+    reports.llm = FakeVLM()
+    return reports
+
+
+def test_results_keep_image_order_under_concurrency(reports):
+    results = reports.run_full_pipeline_ids(max_concurrency=3)
+
+    assert [result["id"] for result in results] == list(range(len(IMAGES)))
+    assert [result["image_name"] for result in results] == [f"image_{n}.png" for n in range(len(IMAGES))]
+    assert [result["report"] for result in results] == [f"report of {image}" for image in IMAGES]
+    assert all(result["Brief_report"] == result["report"] and result["latency_seconds"] > 0 for result in results)
+    assert 1 < reports.llm.max_active <= 3
+
+
+def test_images_are_evaluated_without_touching_the_instance(reports):
+    reports.llm.failing.add(IMAGES[2])
+    results = reports.run_full_pipeline_ids(max_concurrency=1)
+
+    assert reports.llm.max_active == 1
+    assert reports.image_paths == IMAGES and reports.report_text is None
+    assert results[2]["error"] == "VLM unavailable" and "compliance" not in results[2]
+    assert all(result["compliance"] == "COMPLIANT" for n, result in enumerate(results) if n != 2)
+
+
+def test_single_report_is_cached_on_the_instance(reports):
+    reports.image_paths = IMAGES[:1]
+    first = reports.run_full_pipeline()
+    assert reports.report_text == first["report"] == f"report of {IMAGES[0]}"
+    assert reports.run_full_pipeline()["report"] == first["report"]
+    assert Reports("check", "English", "C-1", [], {}, api="http://vlm.invalid").run_full_pipeline_ids() == []
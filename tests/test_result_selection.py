@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import rag.knowledge_retriever as knowledge_retriever
+from benchmarks.retrieval_benchmark import build_store, make_chunk
+
+SIZE = 400
+QUERY = make_chunk(17).page_content
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory, hash_embeddings):
+    directory = str(tmp_path_factory.mktemp("store"))
+    vectors = build_store(directory, hash_embeddings, SIZE, 0, {})["vectors"]
+    db = knowledge_retriever.load_vectorstore(directory, "mmap")
+    db.test_vectors = vectors
+    yield db
+    knowledge_retriever.close_vectorstore(db)
+
+
+def search(db, k=10, **selection):
+    return knowledge_retriever.search_many(db, [QUERY], [k], selections=[knowledge_retriever.build_selection(**selection)])[0]
+
+
+def positions(results):
+    # Every synthetic chunk ends with its position
+    return [int(doc.page_content.rsplit("(بند ", 1)[1].rstrip(")")) for doc, _ in results]
+
+
+def cosine(a, b):
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def mean_pairwise_similarity(vectors):
+    return np.mean([cosine(a, b) for i, a in enumerate(vectors) for b in vectors[i + 1:]])
+
+
+def test_scores_are_cosine_similarities_in_rank_order(db):
+    results = search(db)
+    query_vector = np.asarray(db.embedding_function.embed_query(QUERY), dtype=np.float32)
+    scores = [score for _, score in results]
+
+    assert positions(results)[0] == 17 and scores[0] == pytest.approx(1.0, abs=1e-4)
+    assert scores == sorted(scores, reverse=True)
+    for position, score in zip(positions(results), scores):
+        assert score == pytest.approx(cosine(query_vector, db.test_vectors[position]), abs=1e-4)
+
+
+def test_scores_without_stored_norms_match(db, monkeypatch):
+    expected = search(db)
+    monkeypatch.setattr(db, "vector_norms", None)
+    results = search(db)
+    assert positions(results) == positions(expected)
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-4)
+
+
+def test_score_threshold_drops_weak_hits(db):
+    scores = [score for _, score in search(db)]
+    threshold = scores[4]
+    results = search(db, score_threshold=threshold)
+    assert len(results) >= 5 and all(score >= threshold for _, score in results)
+    assert search(db, score_threshold=1.01) == []
+
+
+def test_mmr_trades_relevance_for_diversity(db):
+    plain = search(db, k=5)
+    # Only relevance counts with lambda_mult=1
+    assert positions(search(db, k=5, use_mmr=True, fetch_k=40, lambda_mult=1.0)) == positions(plain)
+
+    diverse = search(db, k=5, use_mmr=True, fetch_k=40, lambda_mult=0.2)
+    assert len(diverse) == 5 and positions(diverse)[0] == 17
+    assert mean_pairwise_similarity(db.test_vectors[positions(diverse)]) < mean_pairwise_similarity(db.test_vectors[positions(plain)])
+    assert set(positions(diverse)) <= set(positions(search(db, k=40)))
+
+
+def test_selection_applies_per_query(db):
+    selections = [None, knowledge_retriever.build_selection(score_threshold=1.01)]
+    plain, empty = knowledge_retriever.search_many(db, [QUERY, QUERY], [3, 3], selections=selections)
+    assert len(plain) == 3 and empty == []
+    assert knowledge_retriever.build_selection() is None
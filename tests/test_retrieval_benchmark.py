@@ -0,0 +1,35 @@
+import json
+
+import rag.knowledge_retriever as knowledge_retriever
+from benchmarks.retrieval_benchmark import compare_reports, flatten_metrics, parse_args, run
+from rag.embedding_provider import embedding_provider
+
+
+def benchmark(tmp_path, *options):
+    output = tmp_path / "report.json"
+    args = parse_args(["run", "--sizes", "300", "--queries", "10", "--threads", "1", "--duration", "0.1", "--dimension", "64",
+                       "--workdir", str(tmp_path / "stores"), "--output", str(output), *options])
+    assert run(args) == 0
+    with open(output, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_hybrid_overlap_is_reported_apart_from_vector_recall(tmp_path, monkeypatch, hash_embeddings):
+    # run() sets these process-wide; monkeypatch puts them back afterwards
+    monkeypatch.setattr(knowledge_retriever, "HYBRID_SEARCH", False)
+    monkeypatch.setattr(knowledge_retriever, "VECTORSTORE_LOAD_MODE", knowledge_retriever.VECTORSTORE_LOAD_MODE)
+    monkeypatch.setattr(embedding_provider.query_cache, "max_size", embedding_provider.query_cache.max_size)
+
+    vector_only = benchmark(tmp_path, "--no-hybrid")
+    hybrid = benchmark(tmp_path, "--hybrid")
+
+    for api in ("regulator", "enterprise"):
+        # Flat search is exact, whether or not BM25 hits get fused into the served results
+        assert vector_only["results"][0]["apis"][api]["recall_at_k"] == 1.0
+        assert hybrid["results"][0]["apis"][api]["recall_at_k"] == 1.0
+        assert "hybrid_overlap_at_k" not in vector_only["results"][0]["apis"][api]
+        assert 0 <= hybrid["results"][0]["apis"][api]["hybrid_overlap_at_k"] <= 1
+
+    assert not any(metric == "hybrid_overlap_at_k" for _, _, metric in flatten_metrics(hybrid))
+    recall = compare_reports(vector_only, hybrid)["rows"]
+    assert all(row["change"] == 0 for row in recall if row["metric"] == "recall_at_k")
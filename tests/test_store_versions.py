@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pytest
+
+import rag.knowledge_retriever as knowledge_retriever
+from benchmarks.retrieval_benchmark import build_store
+from rag.store_versions import current_version, list_versions, version_directory
+
+
+@pytest.fixture
+def store_path(tmp_path, hash_embeddings):
+    path = str(tmp_path / "store")
+
+    def build(version, size):
+        build_store(version_directory(path, version), hash_embeddings, size, 0, {})
+
+    build.path = path
+    yield build
+    knowledge_retriever.vectorstore_registry.invalidate(path)
+
+
+def test_reload_swaps_versions_under_running_searches(store_path):
+    registry = knowledge_retriever.vectorstore_registry
+    store_path("v1", 200)
+    knowledge_retriever.publish_store_version(store_path.path, "v1")
+    assert registry.get(store_path.path).index.ntotal == 200
+
+    store_path("v2", 300)
+    knowledge_retriever.publish_store_version(store_path.path, "v2")
+    with registry.acquire(store_path.path) as old:
+        assert knowledge_retriever.reload_vectorstore(store_path.path) == "v2"
+        # A search that started on v1 finishes on it
+        assert old.version == "v1" and knowledge_retriever.search_many(old, ["ترخيص"], [3])[0]
+    assert registry.get(store_path.path).index.ntotal == 300
+    # Already serving the published version
+    assert knowledge_retriever.reload_vectorstore(store_path.path) == "v2"
+
+
+def test_inconsistent_version_is_never_published(store_path):
+    store_path("v1", 200)
+    knowledge_retriever.publish_store_version(store_path.path, "v1")
+
+    # A download that mixed files of two builds
+    store_path("v2", 300)
+    for name in ("docstore.jsonl", "docstore.offsets.npy"):
+        shutil.copy(os.path.join(version_directory(store_path.path, "v1"), name), version_directory(store_path.path, "v2"))
+    with pytest.raises(ValueError):
+        knowledge_retriever.publish_store_version(store_path.path, "v2")
+
+    os.remove(os.path.join(version_directory(store_path.path, "v2"), "index.faiss"))
+    with pytest.raises(FileNotFoundError):
+        knowledge_retriever.publish_store_version(store_path.path, "v2")
+    assert current_version(store_path.path) == "v1"
+
+
+def test_old_versions_are_pruned_but_not_the_published_one(store_path, monkeypatch):
+    monkeypatch.setattr(knowledge_retriever, "VECTORSTORE_KEEP_VERSIONS", 2)
+    for version in ("v1", "v2", "v3"):
+        store_path(version, 50)
+    knowledge_retriever.publish_store_version(store_path.path, "v1")
+    assert list_versions(store_path.path) == ["v1", "v2", "v3"]
+
+    knowledge_retriever.publish_store_version(store_path.path, "v3")
+    assert list_versions(store_path.path) == ["v2", "v3"]
@@ -0,0 +1,172 @@
+import threading
+
+import pytest
+
+import rag.knowledge_retriever as knowledge_retriever
+from rag.vectorstore_registry import VectorStoreRegistry
+
+
+class FakeStore:
+    def __init__(self, path, generation, size_bytes=10):
+        self.path = path
+        self.version = f"v{generation}"
+        self.size_bytes = size_bytes
+        self.closed = False
+
+
+def make_registry(**limits):
+    loads, generations = [], {}
+
+    def loader(path):
+        generations[path] = generations.get(path, 0) + 1
+        loads.append(path)
+        return FakeStore(path, generations[path])
+
+    def closer(store):
+        store.closed = True
+
+    registry = VectorStoreRegistry(loader, closer, sizer=lambda store: store.size_bytes, **limits)
+    return registry, loads
+
+
+def test_get_loads_once_and_normalizes_paths(tmp_path):
+    registry, loads = make_registry()
+    store = registry.get(str(tmp_path / "a"))
+    assert registry.get(str(tmp_path / "x" / ".." / "a")) is store
+    assert len(loads) == 1
+    assert registry.stats()["hits"] == 1
+
+
+def test_concurrent_first_requests_share_one_load():
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def loader(path):
+        loads.append(path)
+        started.set()
+        release.wait(5)
+        return FakeStore(path, 1)
+
+    registry = VectorStoreRegistry(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("/stores/a"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(loads) == 1
+    assert len(results) == 4 and all(store is results[0] for store in results)
+
+
+def test_invalidate_forces_a_fresh_load():
+    registry, loads = make_registry()
+    store = registry.get("/stores/a")
+    assert registry.invalidate("/stores/a")
+    assert store.closed
+    assert registry.get("/stores/a") is not store
+    assert len(loads) == 2
+
+
+def test_acquire_during_reload_finishes_on_the_old_version():
+    registry, _ = make_registry()
+    with registry.acquire("/stores/a") as old:
+        new = registry.reload("/stores/a")
+        assert new is not old and new.version == "v2"
+        assert registry.version("/stores/a") == "v2"
+        assert not old.closed
+        with registry.acquire("/stores/a") as current:
+            assert current is new
+    assert old.closed and not new.closed
+
+
+def test_failed_reload_keeps_serving_the_old_store():
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        if len(calls) > 1:
+            raise OSError("broken version")
+        return FakeStore(path, 1)
+
+    registry = VectorStoreRegistry(loader)
+    store = registry.get("/stores/a")
+    with pytest.raises(OSError):
+        registry.reload("/stores/a")
+    assert registry.get("/stores/a") is store
+
+
+def test_evicts_least_recently_used_over_store_limit():
+    registry, _ = make_registry(max_stores=2)
+    a = registry.get("/stores/a")
+    registry.get("/stores/b")
+    registry.get("/stores/a")  # b is now the least recently used
+    registry.get("/stores/c")
+
+    assert registry.is_loaded("/stores/a") and registry.is_loaded("/stores/c")
+    assert not registry.is_loaded("/stores/b")
+    assert not a.closed
+    assert registry.stats()["evictions"] == 1
+
+
+def test_evicts_down_to_byte_budget():
+    registry, _ = make_registry(max_bytes=25)
+    b = registry.get("/stores/b")
+    registry.get("/stores/c")
+    registry.get("/stores/d")
+
+    assert b.closed and not registry.is_loaded("/stores/b")
+    assert registry.stats()["resident_bytes"] == 20
+
+
+def test_pinned_store_is_never_evicted():
+    registry, _ = make_registry(max_stores=1)
+    registry.pin("/stores/a")
+    a = registry.get("/stores/a")
+    b = registry.get("/stores/b")
+    registry.get("/stores/c")
+
+    assert registry.is_loaded("/stores/a") and not a.closed
+    assert b.closed
+    registry.unpin("/stores/a")
+    registry.get("/stores/d")
+    assert a.closed
+
+
+def test_store_in_use_is_closed_only_after_release():
+    registry, _ = make_registry(max_stores=1)
+    with registry.acquire("/stores/a") as a:
+        registry.get("/stores/b")
+        assert not registry.is_loaded("/stores/a")
+        assert not a.closed
+    assert a.closed
+
+
+def test_failed_loads_are_counted():
+    def loader(path):
+        raise OSError("missing index")
+
+    registry = VectorStoreRegistry(loader)
+    with pytest.raises(OSError):
+        registry.get("/stores/a")
+    assert not registry.is_loaded("/stores/a")
+    assert registry.stats()["load_failures"] == 1
+
+
+def test_tenant_paths_resolve_inside_the_vectorstore_directory(tmp_path, monkeypatch):
+    root = tmp_path / "vectorstores"
+    for store in ("tenant_a/regulator", "builds/tenant_a/regulator"):
+        (root / store).mkdir(parents=True)
+        (root / store / "index.faiss").write_bytes(b"")
+    (tmp_path / "outside").mkdir()
+    (tmp_path / "outside" / "index.faiss").write_bytes(b"")
+    monkeypatch.setattr(knowledge_retriever, "VECTORSTORE_DIRECTORY", str(root))
+
+    assert knowledge_retriever.resolve_store_path("tenant_a/regulator") == str(root / "tenant_a" / "regulator")
+    assert knowledge_retriever.resolve_store_path(str(root / "tenant_a" / "regulator")) == str(root / "tenant_a" / "regulator")
+    # Anything else falls back to the router's store
+    for requested in ("", "tenant_b", "builds/tenant_a/regulator", str(tmp_path / "outside"), "../outside"):
+        assert knowledge_retriever.resolve_store_path(requested, default="default") == "default"
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+from utils.jobs import check_cancelled
+
+# Finished chunk and clause results of control generation, shared by every worker process
+CONTROL_CHECKPOINTS_DB_PATH = os.getenv("CONTROL_CHECKPOINTS_DB_PATH", "./database/control_checkpoints.sqlite")
+# Checkpoints not touched for this many days are dropped; 0 keeps them forever
+CONTROL_CHECKPOINT_MAX_AGE_DAYS = float(os.getenv("CONTROL_CHECKPOINT_MAX_AGE_DAYS", "30"))
+# Attempts at one chunk or clause within a run before it is left out of that run's result; a rerun tries it again
+CONTROL_MAX_ATTEMPTS = max(1, int(os.getenv("CONTROL_MAX_ATTEMPTS", "3")))
+# Seconds before the first retry of a unit; each further retry waits that much longer
+CONTROL_RETRY_BACKOFF_SECONDS = float(os.getenv("CONTROL_RETRY_BACKOFF_SECONDS", "5"))
+# Name of the model behind the LLM endpoints; change it with the model so checkpoints of the old one are not reused
+CONTROL_MODEL_NAME = os.getenv("CONTROL_MODEL_NAME", "")
+# Failures of a chunk's clause extraction are recorded under this clause number
+CHUNK_UNIT = -1
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_hash(contents: List[str], pipeline: str = "") -> str:
+    """
+    Identifies a document by the text of its chunks, in order, and the
+    `pipeline` (prompts and model) processing it.
+    """
+    digest = hashlib.sha256(pipeline.encode("utf-8"))
+    for content in contents:
+        digest.update(text_hash(content).encode("ascii"))
+    return digest.hexdigest()
+
+
+def run_with_retries(fn: Callable, attempts: int, on_failure: Callable[[Exception], None], label: str):
+    """
+    Calls `fn` up to `attempts` times, waiting longer before each retry, and
+    returns its result, or None once every attempt failed. `on_failure` sees
+    each error, e.g. to record it.
+    """
+    for attempt in range(attempts):
+        if attempt:
+            check_cancelled()
+            time.sleep(CONTROL_RETRY_BACKOFF_SECONDS * attempt)
+        try:
+            return fn()
+        except Exception as e:
+            print(f"❌ {label} failed (attempt {attempt + 1}/{attempts}): {e}")
+            on_failure(e)
+    return None
+
+
+class ControlCheckpointStore:
+    """
+    Results of the two LLM steps of control generation, in SQLite (WAL):
+    the clauses extracted from each chunk, keyed by (document hash, chunk
+    index), and each processed clause, keyed by (document hash, chunk index,
+    clause index). A rerun over the same document reuses them instead of
+    calling the LLM again. Failed attempts of the latest run are counted per
+    unit as well, to see what kept failing; every run starts them over.
+    """
+
+    def __init__(self, path: str, max_age_days: float = CONTROL_CHECKPOINT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age_days = max_age_days
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on first use and drops expired checkpoints. Caller holds `_lock`."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " document TEXT NOT NULL, chunk INTEGER NOT NULL, source TEXT, clauses TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (document, chunk))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS clauses ("
+                " document TEXT NOT NULL, chunk INTEGER NOT NULL, clause INTEGER NOT NULL, description_hash TEXT NOT NULL,"
+                " result TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (document, chunk, clause))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                " document TEXT NOT NULL, chunk INTEGER NOT NULL, clause INTEGER NOT NULL, attempts INTEGER NOT NULL,"
+                " error TEXT, updated_at REAL NOT NULL, PRIMARY KEY (document, chunk, clause))"
+            )
+            if self.max_age_days > 0:
+                cutoff = time.time() - self.max_age_days * 86400
+                connection.execute("DELETE FROM chunks WHERE updated_at < ?", (cutoff,))
+                connection.execute("DELETE FROM clauses WHERE updated_at < ?", (cutoff,))
+                connection.execute("DELETE FROM failures WHERE updated_at < ?", (cutoff,))
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql: str, args: tuple = ()):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(sql, args)
+            connection.commit()
+
+    def _query(self, sql: str, args: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    def load_chunk(self, document: str, chunk: int) -> Optional[list]:
+        """Clauses extracted from a chunk by an earlier run, or None."""
+        rows = self._query("SELECT clauses FROM chunks WHERE document = ? AND chunk = ?", (document, chunk))
+        return json.loads(rows[0]["clauses"]) if rows else None
+
+    def save_chunk(self, document: str, chunk: int, source: str, clauses: list):
+        self._execute(
+            "INSERT OR REPLACE INTO chunks (document, chunk, source, clauses, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (document, chunk, source, json.dumps(clauses, ensure_ascii=False), time.time())
+        )
+
+    def load_clauses(self, document: str, chunk: int) -> Dict[int, dict]:
+        """Processed clauses of a chunk by clause index, with their description hash."""
+        rows = self._query(
+            "SELECT clause, description_hash, result FROM clauses WHERE document = ? AND chunk = ?", (document, chunk)
+        )
+        return {row["clause"]: {"description_hash": row["description_hash"], "result": json.loads(row["result"])} for row in rows}
+
+    def save_clause(self, document: str, chunk: int, clause: int, description_hash: str, result: dict):
+        self._execute(
+            "INSERT OR REPLACE INTO clauses (document, chunk, clause, description_hash, result, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (document, chunk, clause, description_hash, json.dumps(result, ensure_ascii=False), time.time())
+        )
+
+    def load_failures(self, document: str, chunk: int) -> Dict[int, int]:
+        """Failed attempts so far by clause index, with `CHUNK_UNIT` for the chunk's own extraction."""
+        rows = self._query("SELECT clause, attempts FROM failures WHERE document = ? AND chunk = ?", (document, chunk))
+        return {row["clause"]: row["attempts"] for row in rows}
+
+    def record_failure(self, document: str, chunk: int, clause: int, error: str):
+        self._execute(
+            "INSERT INTO failures (document, chunk, clause, attempts, error, updated_at) VALUES (?, ?, ?, 1, ?, ?)"
+            " ON CONFLICT (document, chunk, clause) DO UPDATE SET"
+            " attempts = attempts + 1, error = excluded.error, updated_at = excluded.updated_at",
+            (document, chunk, clause, error, time.time())
+        )
+
+    def clear_failures(self, document: str):
+        """Drops the failure counts of a document, e.g. when a new run over it starts."""
+        self._execute("DELETE FROM failures WHERE document = ?", (document,))
+
+    def forget(self, document: str):
+        """Drops every checkpoint and failure count of a document, so the next run starts over."""
+        self._execute("DELETE FROM chunks WHERE document = ?", (document,))
+        self._execute("DELETE FROM clauses WHERE document = ?", (document,))
+        self._execute("DELETE FROM failures WHERE document = ?", (document,))
+
+
+control_checkpoints = ControlCheckpointStore(CONTROL_CHECKPOINTS_DB_PATH)
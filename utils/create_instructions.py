@@ -1,12 +1,17 @@
 import requests
 import json
 import re
+from typing import Callable, Dict, Optional
+from utils.jobs import check_cancelled, report_progress
+from utils.control_checkpoints import run_with_retries
+
+LLM_CHAT_URL = "https://qwen-3-llm.delightfulsky-f308bdb7.westus3.azurecontainerapps.io/api/chat_llm"
 
 def generate_text(prompt, max_tokens=5000, thinking=False):
     """
     Sends a request to the open-source LLM endpoint with the given prompt.
     """
-    url = "https://qwen-3-llm.delightfulsky-f308bdb7.westus3.azurecontainerapps.io/api/chat_llm"
+    url = LLM_CHAT_URL
     headers = {
         "accept": "application/json",
         "Content-Type": "application/x-www-form-urlencoded"
@@ -24,8 +29,7 @@ def generate_text(prompt, max_tokens=5000, thinking=False):
         print(f"Error making request to LLM: {e}")
         return None
 
-def generate_clause_instruction(clause: str) -> str:
-    prompt_english = """
+CLAUSE_INSTRUCTION_PROMPT = """
 You are a legal compliance expert. Your task is to transform a given legal or regulatory clause into a clear set of measurable instructions that can be used by a language model to audit documents for compliance.
 
 Follow these steps:
@@ -86,8 +90,9 @@ Respond ONLY in the following JSON format:
 }
 
 """
-    
-    full_prompt_english = prompt_english + f"### Clause to Transform:{clause}"
+
+def generate_clause_instruction(clause: str) -> str:
+    full_prompt_english = CLAUSE_INSTRUCTION_PROMPT + f"### Clause to Transform:{clause}"
 
     response = generate_text(full_prompt_english)
     
@@ -145,39 +150,57 @@ Please provide your conclusion using one of the following decisions:
 If NON-COMPLIANT or INDECISIVE, explain briefly which parts are missing or unsupported and what evidence would be needed to confirm compliance.
 """.strip()
 
-def process_parsed_response(data: dict) -> dict:
+def process_parsed_response(data: dict, completed: Optional[Dict[int, dict]] = None,
+                            on_result: Optional[Callable[[int, dict], None]] = None, max_attempts: int = 1,
+                            on_failure: Optional[Callable[[int, Exception], None]] = None) -> dict:
     """
     Processes each clause description in the parsed_response list
     to generate and attach clause instructions and audit instructions.
+    `completed` maps list positions to results of an earlier run, which are
+    reused as they are; `on_result(position, item)` is called for every
+    clause processed now, e.g. to checkpoint it. A clause is tried up to
+    `max_attempts` times, and `on_failure(position, error)` is called for
+    every failed attempt.
     """
     processed_items = []
+    completed = completed or {}
+    clauses = data.get("parsed_response", [])
+
+    for position, item in enumerate(clauses):
+        if position in completed:
+            processed_items.append(completed[position])
+            continue
 
-    for item in data.get("parsed_response", []):
         description = item.get("description", "").strip()
 
         if not description:
             print(f"Skipping item due to missing description: {item.get('title', 'No Title')}")
             continue
 
-        try:
+        check_cancelled()
+        report_progress(None, f"Clause {position + 1}/{len(clauses)}: {item.get('title', 'No Title')}")
+
+        def build_instructions(description=description):
             # Generate clause instruction (JSON string)
             clause_instruction_json_str = generate_clause_instruction(description)
 
-            # Parse it to dict
-            clause_instruction_obj = json.loads(clause_instruction_json_str)
-
-            # Generate audit instruction
-            clause_audit_text = build_clause_audit_instruction(clause_instruction_json_str)
+            # Parse it to dict, then generate audit instruction
+            return json.loads(clause_instruction_json_str), build_clause_audit_instruction(clause_instruction_json_str)
 
-            # Add results to the item
-            item["clause_instruction"] = clause_instruction_obj
-            item["clause_audit_instruction"] = clause_audit_text
-
-        except Exception as e:
-            print(f"Error processing '{item.get('title', 'No Title')}': {e}")
+        instructions = run_with_retries(
+            build_instructions, max_attempts,
+            lambda e, position=position: on_failure(position, e) if on_failure is not None else None,
+            f"Processing '{item.get('title', 'No Title')}'"
+        )
+        if instructions is None:
             continue
 
+        # Add results to the item
+        item["clause_instruction"], item["clause_audit_instruction"] = instructions
+
         processed_items.append(item)
+        if on_result is not None:
+            on_result(position, item)
 
     return {"parsed_response": processed_items}
 
@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import threading
+import urllib.parse
+from email.utils import formatdate
+from typing import Dict, List, Optional
+import httpx
+
+# Downloads in flight at once, across every caller in this process
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+# Files larger than this are rejected (bytes, 0 = no limit)
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+# Connect / read / pool timeout of each request (seconds)
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "30"))
+# Wall-clock limit for one file, so a slow trickle cannot hold a slot forever (seconds)
+DOWNLOAD_FILE_TIMEOUT = float(os.getenv("DOWNLOAD_FILE_TIMEOUT", "600"))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Local copies of downloaded sources, revalidated with conditional GETs (empty disables the cache)
+DOWNLOAD_CACHE_DIRECTORY = os.getenv("DOWNLOAD_CACHE_DIRECTORY", "./database/download_cache")
+# Least recently used entries are dropped beyond this size (bytes, 0 = no limit)
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+# Query parameters of signed OSS URLs; they change on every call but name the same object
+SIGNING_PARAMS = {"expires", "ossaccesskeyid", "signature", "security-token"}
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+def filename_for_url(url: str) -> str:
+    return urllib.parse.unquote(os.path.basename(urllib.parse.urlparse(url).path))
+
+
+def cache_key(url: str) -> str:
+    """Identity of the object behind `url`: the URL without its signing parameters."""
+    parsed = urllib.parse.urlparse(url)
+    query = [
+        (name, value) for name, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+        if name.lower() not in SIGNING_PARAMS and not name.lower().startswith("x-oss-")
+    ]
+    return urllib.parse.urlunparse(parsed._replace(query=urllib.parse.urlencode(sorted(query)), fragment=""))
+
+
+def _link_or_copy(source: str, local_path: str):
+    """Puts a copy of a cached file at `local_path`: a hard link when possible, so nothing is copied."""
+    if os.path.exists(local_path) and os.path.samefile(source, local_path):
+        # Already linked; renaming over another link to the same file would be a no-op
+        return
+    tmp_path = f"{local_path}.link-{os.getpid()}-{threading.get_ident()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, local_path)
+
+
+class DownloadCache:
+    """
+    Source documents by URL, with the ETag / Last-Modified / size the server
+    sent. Per entry: `<key>.data` (complete, read-only since callers get hard
+    links to it), `<key>.part` (an interrupted download, resumed with a Range
+    request) and `<key>.json` (validators). `<key>.lock` marks a download in
+    progress; another process that finds it fresh bypasses the cache for
+    that file instead of waiting.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DOWNLOAD_CACHE_MAX_BYTES, lock_timeout: float = DOWNLOAD_FILE_TIMEOUT):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, url: str) -> dict:
+        base = os.path.join(self.directory, hashlib.sha256(cache_key(url).encode("utf-8")).hexdigest())
+        return {name: f"{base}.{name}" for name in ("data", "part", "json", "lock")}
+
+    def read_meta(self, paths: dict) -> dict:
+        try:
+            with open(paths["json"], "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self, paths: dict, meta: dict):
+        tmp_path = f"{paths['json']}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, paths["json"])
+
+    def acquire(self, paths: dict) -> bool:
+        try:
+            os.close(os.open(paths["lock"], os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            # A lock older than a whole download is left over from a crashed process
+            try:
+                if time.time() - os.path.getmtime(paths["lock"]) < self.lock_timeout:
+                    return False
+                os.remove(paths["lock"])
+            except FileNotFoundError:
+                pass
+            return self.acquire(paths)
+
+    def release(self, paths: dict):
+        try:
+            os.remove(paths["lock"])
+        except FileNotFoundError:
+            pass
+
+    def discard(self, paths: dict, *names: str):
+        for name in names or ("data", "part", "json"):
+            if os.path.exists(paths[name]):
+                os.remove(paths[name])
+
+    def prune(self):
+        """Drops least recently used entries until the cache fits `max_bytes`."""
+        if not self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith((".data", ".part")):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            base = path.rsplit(".", 1)[0]
+            paths = {"data": f"{base}.data", "part": f"{base}.part", "json": f"{base}.json", "lock": f"{base}.lock"}
+            if os.path.exists(paths["lock"]):
+                continue
+            self.discard(paths)
+            total -= size
+
+
+class Downloader:
+    """
+    Streams files to disk over one pooled httpx.AsyncClient. The client and
+    its event loop live on a background thread, so synchronous callers (the
+    admin endpoints, the ingestion pipeline threads) all share the same
+    keep-alive connections and the same concurrency limit.
+
+    Each file is written to a temporary name and renamed into place once
+    complete; a failed or oversized download never leaves a partial file.
+
+    With a cache, a URL seen before is revalidated with a conditional GET
+    (If-None-Match / If-Modified-Since): a 304 moves no bytes and the local
+    copy is linked from the cache. An interrupted download is resumed with a
+    Range request (If-Range guards against the object changing meanwhile).
+    """
+
+    def __init__(self, concurrency: int = DOWNLOAD_CONCURRENCY, max_bytes: int = DOWNLOAD_MAX_BYTES,
+                 timeout: float = DOWNLOAD_TIMEOUT, file_timeout: float = DOWNLOAD_FILE_TIMEOUT,
+                 cache_directory: Optional[str] = DOWNLOAD_CACHE_DIRECTORY):
+        self.concurrency = max(1, concurrency)
+        self.cache = DownloadCache(cache_directory, lock_timeout=file_timeout) if cache_directory else None
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.file_timeout = file_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="downloader", daemon=True)
+                self._thread.start()
+
+                async def setup():
+                    self._semaphore = asyncio.Semaphore(self.concurrency)
+                    self._client = httpx.AsyncClient(
+                        timeout=httpx.Timeout(self.timeout),
+                        limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+                        follow_redirects=True
+                    )
+
+                asyncio.run_coroutine_threadsafe(setup(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = self._client = self._semaphore = self._thread = None
+
+    async def _stream_to_file(self, url: str, local_path: str, result: dict):
+        tmp_path = f"{local_path}.part-{os.getpid()}-{id(result)}"
+        try:
+            async with self._client.stream("GET", url) as response:
+                result["status_code"] = response.status_code
+                response.raise_for_status()
+                declared = int(response.headers.get("content-length") or 0)
+                if self.max_bytes and declared > self.max_bytes:
+                    raise FileTooLarge(f"{declared} bytes declared, limit is {self.max_bytes}")
+
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        result["bytes"] += len(chunk)
+                        if self.max_bytes and result["bytes"] > self.max_bytes:
+                            raise FileTooLarge(f"more than {self.max_bytes} bytes")
+                        f.write(chunk)
+            os.replace(tmp_path, local_path)
+            result["size"] = result["bytes"]
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def _fetch_cached(self, url: str, local_path: str, result: dict):
+        paths = self.cache.paths(url)
+        if not self.cache.acquire(paths):
+            # Another process is fetching the same object right now
+            result["cache"] = "bypass"
+            return await self._stream_to_file(url, local_path, result)
+
+        try:
+            meta = self.cache.read_meta(paths)
+            validators = {key: meta[key] for key in ("etag", "last_modified") if meta.get(key)}
+            # Range offsets count stored bytes, so the body must not be content-encoded
+            headers = {"Accept-Encoding": "identity"}
+            offset = 0
+            if meta.get("complete") and os.path.exists(paths["data"]):
+                if "etag" in validators:
+                    headers["If-None-Match"] = validators["etag"]
+                if "last_modified" in validators:
+                    headers["If-Modified-Since"] = validators["last_modified"]
+            elif os.path.exists(paths["part"]) and validators:
+                offset = os.path.getsize(paths["part"])
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = validators.get("etag") or validators["last_modified"]
+
+            async with self._client.stream("GET", url, headers=headers) as response:
+                result["status_code"] = response.status_code
+                if response.status_code == 304 and "Range" not in headers:
+                    result["cache"] = "hit"
+                    if self.max_bytes and os.path.getsize(paths["data"]) > self.max_bytes:
+                        raise FileTooLarge(f"{os.path.getsize(paths['data'])} bytes cached, limit is {self.max_bytes}")
+                    os.utime(paths["data"])
+                    _link_or_copy(paths["data"], local_path)
+                    result["size"] = os.path.getsize(local_path)
+                    return
+                response.raise_for_status()
+
+                if response.status_code == 206 and response.headers.get("content-range", "").startswith(f"bytes {offset}-"):
+                    result["cache"] = "resumed"
+                else:
+                    # The object changed or the server ignored the range: start over
+                    result["cache"] = "miss"
+                    offset = 0
+                declared = int(response.headers.get("content-length") or 0)
+                if self.max_bytes and offset + declared > self.max_bytes:
+                    self.cache.discard(paths, "part")
+                    raise FileTooLarge(f"{offset + declared} bytes declared, limit is {self.max_bytes}")
+
+                # A 206 may omit the validators; they are the ones the range was checked against
+                previous = validators if result["cache"] == "resumed" else {}
+                meta = {
+                    "url": cache_key(url),
+                    "etag": response.headers.get("etag") or previous.get("etag"),
+                    "last_modified": response.headers.get("last-modified") or previous.get("last_modified"),
+                    "complete": False
+                }
+                if not meta["etag"] and not meta["last_modified"]:
+                    # Without validators there is nothing to revalidate or resume against; pin the fetch time
+                    meta["last_modified"] = formatdate(usegmt=True)
+                self.cache.write_meta(paths, meta)
+
+                try:
+                    with open(paths["part"], "ab" if offset else "wb") as f:
+                        # Chunks as they arrive, so an interrupted transfer keeps everything received
+                        async for chunk in response.aiter_bytes():
+                            result["bytes"] += len(chunk)
+                            if self.max_bytes and offset + result["bytes"] > self.max_bytes:
+                                raise FileTooLarge(f"more than {self.max_bytes} bytes")
+                            f.write(chunk)
+                except FileTooLarge:
+                    self.cache.discard(paths, "part")
+                    raise
+
+            # Callers get hard links to the data file; read-only guards it against writes through them
+            os.chmod(paths["part"], 0o444)
+            os.replace(paths["part"], paths["data"])
+            meta.update(complete=True, size=os.path.getsize(paths["data"]))
+            self.cache.write_meta(paths, meta)
+            _link_or_copy(paths["data"], local_path)
+            result["size"] = meta["size"]
+        finally:
+            self.cache.release(paths)
+
+    async def _download(self, url: str, local_path: str) -> dict:
+        result = {"url": url, "path": local_path, "ok": False, "status_code": None, "bytes": 0, "size": None,
+                  "cache": None, "seconds": 0.0, "error": None}
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                fetch = self._fetch_cached if self.cache is not None else self._stream_to_file
+                await asyncio.wait_for(fetch(url, local_path, result), self.file_timeout)
+                result["ok"] = True
+            except asyncio.TimeoutError:
+                result["error"] = f"timed out after {self.file_timeout}s"
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {(str(e).splitlines() or [''])[0]}"
+            result["seconds"] = round(time.perf_counter() - started, 3)
+
+        if result["ok"]:
+            print(f"✅ Downloaded from URL: {url} → {local_path} ({result['bytes']} bytes transferred, cache {result['cache']}, {result['seconds']}s)")
+        else:
+            print(f"❌ Download failed: {url}: {result['error']}")
+        return result
+
+    async def _download_many(self, targets: List[tuple], concurrency: Optional[int]) -> List[dict]:
+        # A per-call limit on top of the process-wide one
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        if semaphore is None:
+            return list(await asyncio.gather(*(self._download(url, path) for url, path in targets)))
+
+        async def limited(url, path):
+            async with semaphore:
+                return await self._download(url, path)
+
+        return list(await asyncio.gather(*(limited(url, path) for url, path in targets)))
+
+    def download(self, url: str, local_path: str) -> dict:
+        """Downloads one file; blocks the calling thread, not the others. Returns its result."""
+        loop = self._start()
+        return asyncio.run_coroutine_threadsafe(self._download(url, local_path), loop).result()
+
+    def download_many(self, urls: List[str], download_dir: str, concurrency: Optional[int] = None) -> List[dict]:
+        """
+        Downloads every URL into `download_dir` concurrently, named after the
+        URL path. Returns one result per URL, in order:
+        {url, path, ok, status_code, bytes (transferred), size, cache, seconds, error}.
+        """
+        os.makedirs(download_dir, exist_ok=True)
+        loop = self._start()
+        targets = [(url, os.path.join(download_dir, filename_for_url(url))) for url in urls]
+        started = time.perf_counter()
+        results = asyncio.run_coroutine_threadsafe(self._download_many(targets, concurrency), loop).result()
+        succeeded = sum(result["ok"] for result in results)
+        hits = sum(result["cache"] == "hit" for result in results)
+        transferred = sum(result["bytes"] for result in results)
+        print(f"📥 Downloaded {succeeded}/{len(results)} files ({hits} unchanged in cache, {transferred} bytes transferred) "
+              f"in {time.perf_counter() - started:.2f}s.")
+        if self.cache is not None:
+            self.cache.prune()
+        return results
+
+
+# Shared by every download in this process
+downloader = Downloader()
+
+
+def download_urls(urls: List[str], download_dir: str, concurrency: Optional[int] = None) -> Dict[str, dict]:
+    """Per-file download results keyed by local file name."""
+    return {os.path.basename(result["path"]): result for result in downloader.download_many(urls, download_dir, concurrency)}
@@ -4,10 +4,15 @@ from PIL import Image
 import io, requests, oss2, httpx, logging
 from fastapi import UploadFile
 from docx2pdf import convert
-from langchain_community.document_loaders import UnstructuredFileLoader  
+from rag.document_parser import parse_documents
+from utils.downloader import downloader, download_urls
 from pydantic import ValidationError
 from utils.schemas import LLMComplianceResult
-from utils.create_instructions import process_parsed_response
+from utils.create_instructions import (process_parsed_response, build_clause_audit_instruction, CLAUSE_INSTRUCTION_PROMPT,
+                                      LLM_CHAT_URL)
+from utils.control_checkpoints import (control_checkpoints, document_hash, text_hash, run_with_retries, CHUNK_UNIT,
+                                       CONTROL_MAX_ATTEMPTS, CONTROL_MODEL_NAME)
+from utils.jobs import check_cancelled, report_progress
 from pathlib import Path
 import importlib.util
 from typing import List
@@ -335,6 +340,65 @@ def extract_json_from_text(text: str):
         return None
 
 
+def extract_control_clauses(text: str):
+    """
+    Returns the clauses of every `parsed_response` array found in a controls
+    document (the JSON written by /generate_controls), or None when the text
+    is not a controls document.
+    """
+    items = extract_json_from_text(text)
+
+    if not isinstance(items, list):
+        # Fall back to scanning top-level objects when the array itself is broken
+        items = []
+        for block in extract_json_objects(text):
+            try:
+                items.append(json.loads(block))
+            except json.JSONDecodeError:
+                continue
+
+    control_items = [item for item in items if isinstance(item, dict) and "parsed_response" in item]
+    if not control_items:
+        return None
+
+    clauses = []
+    for item in control_items:
+        for clause in item.get("parsed_response") or []:
+            if isinstance(clause, dict):
+                clauses.append(clause)
+    return clauses
+
+
+def collect_parsed_responses(results):
+    """
+    Gathers the clauses of every `parsed_response` array embedded in the
+    retrieved contents, skipping results without a valid JSON array.
+    Clause records indexed at ingestion already carry their result and are
+    used as-is.
+    """
+    js_clean_data = []
+    for idx, result in enumerate(results):
+        if result.get("result"):
+            js_clean_data.append(result["result"])
+            continue
+
+        content = result.get("content", "")
+        js = extract_json_from_text(content)
+
+        if not js or not isinstance(js, list):
+            logger.warning(f"Skipping result {idx}: no valid JSON array found.")
+            continue
+
+        # Loop over all elements in the JSON array
+        for item in js:
+            if isinstance(item, dict) and "parsed_response" in item:
+                parsed = item["parsed_response"]
+                if parsed:  # Only append non-empty lists
+                    js_clean_data.extend(parsed)
+
+    return js_clean_data
+
+
 def upload_to_alibaba_oss_static(bucket, local_file_path, object_name, bucket_name="glasshub-files-staging", endpoint="oss-me-central-1.aliyuncs.com"):
     try:
         with open(local_file_path, 'rb') as file:
@@ -394,8 +458,7 @@ def init_oss_bucket(access_key_id, access_key_secret, endpoint, bucket_name):
     return bucket
 
 
-def extract_clauses_with_system_message(QWEN3_ENDPOINT: str, prompt: str, max_tokens: int = 512, thinking: bool = False):
-    system_message = """
+CLAUSE_EXTRACTION_SYSTEM_MESSAGE = """
     أنت مساعد ذكي مخصص لاستخراج البنود القانونية والتنظيمية من النصوص.
     📌 المطلوب:
     قم باستخراج التعليمات الصريحة أو الالتزامات أو القيود من مستندات مكتوبة بالعربية أو الإنجليزية (مثل السياسات أو العقود)، وأرجعها ككائن JSON بالهيكل التالي تحت المفتاح `flattened`:
@@ -444,6 +507,23 @@ def extract_clauses_with_system_message(QWEN3_ENDPOINT: str, prompt: str, max_to
     🔒 لا تخرج عن هذا التنسيق أبدًا. فقط أرجع الكائن JSON أعلاه بدون أي تعليقات أو تنسيقات إضافية.
     """
 
+
+def control_pipeline_hash() -> str:
+    """
+    Identifies the prompts, endpoints and model behind control generation.
+    It is part of every checkpoint key, so changing any of them starts over
+    instead of mixing results of the old and the new pipeline.
+    """
+    return text_hash(json.dumps(
+        [CLAUSE_EXTRACTION_SYSTEM_MESSAGE, CLAUSE_INSTRUCTION_PROMPT, build_clause_audit_instruction(""),
+         QWEN3_ENDPOINT_CHAT, LLM_CHAT_URL, CONTROL_MODEL_NAME],
+        ensure_ascii=False
+    ))
+
+
+def extract_clauses_with_system_message(QWEN3_ENDPOINT: str, prompt: str, max_tokens: int = 512, thinking: bool = False):
+    system_message = CLAUSE_EXTRACTION_SYSTEM_MESSAGE
+
     # Combine system + user message
     full_prompt = f"{system_message}\n\nUSER:\n{prompt}"
 
@@ -466,17 +546,9 @@ def extract_clauses_with_system_message(QWEN3_ENDPOINT: str, prompt: str, max_to
 
 
 def download_from_url(url, local_path):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        with open(local_path, 'wb') as f:
-            f.write(response.content)
-        print(f"✅ Downloaded from URL: {url} → {local_path}")
-        return True
-    except Exception as e:
-        print(f"❌ Download failed: {e}")
-        return False
-    
+    """Streams one file to `local_path` through the shared download pool; returns whether it succeeded."""
+    return downloader.download(url, local_path)["ok"]
+
 
 def convert_docx_to_pdf(docx_path, pdf_path):
     convert(docx_path, pdf_path)
@@ -506,27 +578,16 @@ def save_temp_file(uploaded_file: UploadFile, save_path: str):
 
 
 def download_files_from_cloud_storage(json_data: List[str], download_dir="./database/glasshub_files"):
-    os.makedirs(download_dir, exist_ok=True)
-
-    for url in json_data:
-        filename = urllib.parse.unquote(os.path.basename(url))
-        local_path = os.path.join(download_dir, filename)
-        download_from_url(url, local_path)
+    """Downloads every URL into `download_dir` concurrently; returns the per-file results keyed by file name."""
+    return download_urls(json_data, download_dir)
 
 
 def load_documents(docx_path: str = DOCX_DIRECTORY):
-    documents = []
-    for filename in os.listdir(docx_path):
-        if filename.endswith(".docx"):
-            file_path = os.path.join(docx_path, filename)
-            loader = UnstructuredFileLoader(file_path)
-            pages = loader.load()
-
-            for i, doc in enumerate(pages):
-                doc.metadata["source"] = filename  # Set real file name as source
-                doc.metadata["page_number"] = i + 1
-                documents.append(doc)
-    return documents
+    # One document per file: callers extract JSON and prompt the LLM on whole files
+    return parse_documents(
+        [os.path.join(docx_path, filename) for filename in sorted(os.listdir(docx_path)) if filename.endswith(".docx")],
+        split_sections=False
+    )
 
 
 def retrieve_full_knowledge_from_docx(documents):
@@ -544,63 +605,158 @@ def retrieve_full_knowledge_from_docx(documents):
 
     return formatted_results
 
-def process_all_formatted_results(formatted_results, min_length=10):
+def control_document_hashes(formatted_results) -> dict:
+    """
+    Checkpoint key of each source: chunks are numbered within their document,
+    which is identified by the text of all its chunks and the pipeline.
+    """
+    contents_by_source = defaultdict(list)
+    for item in formatted_results:
+        contents_by_source[item["source"]].append(item["content"])
+    pipeline = control_pipeline_hash()
+    return {source: document_hash(contents, pipeline) for source, contents in contents_by_source.items()}
+
+
+def forget_control_checkpoints(formatted_results, checkpoints=control_checkpoints) -> dict:
+    """Drops the checkpoints and failure counts of these documents, so the next run starts over; returns their keys."""
+    documents = control_document_hashes(formatted_results)
+    for document in documents.values():
+        checkpoints.forget(document)
+    return documents
+
+
+def extract_chunk_terms(flattened) -> list:
+    """Asks the LLM for the clauses of one chunk; raises when the call fails or its answer is not the expected JSON."""
+    terms = extract_clauses_with_system_message(QWEN3_ENDPOINT_CHAT, flattened, 10000, False)
+
+    # Case 1: dict with "response" string
+    if isinstance(terms, dict):
+        terms = terms.get("response", terms)  # get JSON string
+
+    # Case 2: now terms should be str
+    if not isinstance(terms, str):
+        raise ValueError(f"Unexpected type {type(terms)}")
+    return json.loads(terms).get("flattened", [])
+
+
+def process_all_formatted_results(formatted_results, min_length=10, checkpoints=control_checkpoints, stats=None,
+                                  max_attempts=CONTROL_MAX_ATTEMPTS):
+    """
+    Extracts the clauses of every chunk with the LLM, then builds the
+    instructions of every clause. With `checkpoints`, each finished chunk and
+    clause is stored under its document hash and position, so a rerun over
+    the same document only calls the LLM for what is still missing. The hash
+    covers the prompts and model too (`control_pipeline_hash`).
+
+    A failing chunk or clause is retried up to `max_attempts` times within
+    this run, then left out so the rest still finish; the next run tries it
+    again. `stats`, when given, receives the counts of finished, resumed and
+    failed units, and `partial` when anything was left out.
+    """
     all_parsed_responses = []
+    counts = {"chunks": len(formatted_results), "chunks_resumed": 0, "chunks_failed": 0,
+              "clauses": 0, "clauses_resumed": 0, "clauses_failed": 0}
+
+    documents = control_document_hashes(formatted_results)
+    if checkpoints is not None:
+        # Failure counts describe the latest run only
+        for document in documents.values():
+            checkpoints.clear_failures(document)
+    chunks_per_source = defaultdict(int)
+    for item in formatted_results:
+        chunks_per_source[item["source"]] += 1
+    chunk_numbers = defaultdict(int)
 
     for item in formatted_results:
         content = item["content"]
         source = item["source"]
         page = item.get("page", "Page not specified")
+        document = documents[source]
+        chunk = chunk_numbers[source]
+        chunk_numbers[source] += 1
 
-        # 1️⃣ Extract JSON blocks
-        json_blocks = extract_json_objects(content)
-        data_js = []
-        for block in json_blocks:
-            try:
-                data_js.append(json.loads(block))
-            except Exception as e:
-                print(f"Error loading block from {source}, page {page}: {e}")
+        check_cancelled()
+        report_progress(None, f"{source}: chunk {chunk + 1}/{chunks_per_source[source]}")
 
-        if not data_js:
-            print(f"No valid JSON blocks found in {source}, page {page}")
-            continue
+        flattened_terms = checkpoints.load_chunk(document, chunk) if checkpoints is not None else None
 
-        # 2️⃣ Flatten clauses
-        flattened = flatten_clauses(data_js, source, page)
+        def record_failure(clause, error):
+            if checkpoints is not None:
+                checkpoints.record_failure(document, chunk, clause, f"{type(error).__name__}: {error}")
 
-        # 3️⃣ Call LLM to extract clauses
-        terms = extract_clauses_with_system_message(QWEN3_ENDPOINT_CHAT, flattened, 10000, False)
+        if flattened_terms is not None:
+            counts["chunks_resumed"] += 1
+        else:
+            # 1️⃣ Extract JSON blocks
+            json_blocks = extract_json_objects(content)
+            data_js = []
+            for block in json_blocks:
+                try:
+                    data_js.append(json.loads(block))
+                except Exception as e:
+                    print(f"Error loading block from {source}, page {page}: {e}")
+
+            if not data_js:
+                print(f"No valid JSON blocks found in {source}, page {page}")
+                continue
 
-        # 4️⃣ Normalize LLM output
-        # Case 1: dict with "response" string
-        if isinstance(terms, dict):
-            terms = terms.get("response", terms)  # get JSON string
+            # 2️⃣ Flatten clauses
+            flattened = flatten_clauses(data_js, source, page)
 
-        # Case 2: now terms should be str
-        if isinstance(terms, str):
-            try:
-                terms_dict = json.loads(terms)
-            except json.JSONDecodeError as e:
-                print(f"Could not decode terms for {source}, page {page}: {e}")
+            # 3️⃣ Call LLM to extract clauses, retrying until the chunk is left out of this run
+            flattened_terms = run_with_retries(
+                lambda: extract_chunk_terms(flattened), max_attempts, lambda e: record_failure(CHUNK_UNIT, e),
+                f"Clause extraction for {source}, page {page}"
+            )
+            if flattened_terms is None:
+                counts["chunks_failed"] += 1
                 continue
-        else:
-            print(f"Unexpected type {type(terms)} for {source}, page {page}")
-            continue
 
-        # 5️⃣ Extract flattened terms
-        flattened_terms = terms_dict.get("flattened", [])
-        parsed_response = [
-            clause for clause in flattened_terms
+            # 4️⃣ Keep the flattened terms
+            if checkpoints is not None:
+                checkpoints.save_chunk(document, chunk, source, flattened_terms)
+
+        # Clause checkpoints use the position in the unfiltered list, so they survive a different min_length
+        kept = [
+            (position, clause) for position, clause in enumerate(flattened_terms)
             if len(clause.get("description", "")) >= min_length
         ]
+        parsed_response = [clause for _, clause in kept]
 
         if not parsed_response:
             print(f"No parsed clauses survived filtering for {source}, page {page}")
             continue
 
-        json_parsed_response = process_parsed_response({"parsed_response": parsed_response})
+        completed = {}
+        if checkpoints is not None:
+            saved = checkpoints.load_clauses(document, chunk)
+            for index, (position, clause) in enumerate(kept):
+                # Only reuse a result that was built from this very description
+                if position in saved and saved[position]["description_hash"] == text_hash(clause["description"].strip()):
+                    completed[index] = saved[position]["result"]
+        finished = set(completed)
+
+        def on_result(index, clause):
+            finished.add(index)
+            if checkpoints is not None:
+                checkpoints.save_clause(document, chunk, kept[index][0], text_hash(clause["description"].strip()), clause)
+
+        json_parsed_response = process_parsed_response(
+            {"parsed_response": parsed_response}, completed, on_result, max_attempts,
+            lambda index, error: record_failure(kept[index][0], error)
+        )
         all_parsed_responses.append(json_parsed_response)
 
+        counts["clauses"] += len(json_parsed_response["parsed_response"])
+        counts["clauses_resumed"] += len(completed)
+        counts["clauses_failed"] += sum(
+            1 for index, clause in enumerate(parsed_response)
+            if index not in finished and clause.get("description", "").strip()
+        )
+
+    if stats is not None:
+        stats.update(counts)
+        stats["partial"] = counts["chunks_failed"] > 0 or counts["clauses_failed"] > 0
     return all_parsed_responses
 
 
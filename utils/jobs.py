@@ -0,0 +1,447 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+# Job state is shared by every worker process through this database
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./database/jobs.sqlite")
+# Jobs of one type running at once across all worker processes, e.g. "create_rag_system=1,generate_controls=2"
+JOB_CONCURRENCY = os.getenv("JOB_CONCURRENCY", "")
+# One at a time by default: these jobs are heavy on CPU, memory and the LLM endpoint
+DEFAULT_JOB_CONCURRENCY = {"create_rag_system": 1, "generate_controls": 1, "extract_terms": 1}
+# Queued jobs per type and process beyond which new submissions are refused
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+# Uploaded files are copied here for jobs that outlive the request
+JOB_UPLOAD_DIRECTORY = os.getenv("JOB_UPLOAD_DIRECTORY", "./database/job_uploads")
+# Seconds between two database reads of a job's cancel flag
+CANCEL_CHECK_INTERVAL = 1.0
+# Seconds a queued job waits before trying again for a slot another worker holds
+JOB_SLOT_WAIT_INTERVAL = 2.0
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(BaseException):
+    """Like asyncio.CancelledError, not an Exception, so the endpoints' catch-all handlers let it through."""
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def parse_concurrency(spec: str) -> Dict[str, int]:
+    concurrency = dict(DEFAULT_JOB_CONCURRENCY)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        job_type, _, value = item.partition("=")
+        concurrency[job_type.strip()] = max(1, int(value))
+    return concurrency
+
+
+def _process_token(pid: int) -> Optional[str]:
+    """
+    Boot id plus the process start time, which together tell a process apart
+    from a later one given the same pid (pids are reused, e.g. after a
+    container restart). None where /proc is unavailable.
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r", encoding="utf-8") as f:
+            boot_id = f.read().strip()
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            # Field 22 is the start time; the command name (field 2) may contain spaces, so count after it
+            start_time = f.read().rpartition(")")[2].split()[19]
+        return f"{boot_id}:{start_time}"
+    except (OSError, IndexError):
+        return None
+
+
+def _pid_alive(pid: Optional[int], token: Optional[str] = None) -> bool:
+    """Whether `pid` still runs; with a `token`, whether it is still the same process."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return token is None or _process_token(pid) in (None, token)
+
+
+class JobStore:
+    """Jobs table in SQLite (WAL), so any worker can answer for a job another worker runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database on first use. Caller holds `_lock`."""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, type TEXT NOT NULL, status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0,"
+                " message TEXT, params TEXT, result TEXT, error TEXT, pid INTEGER, cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL, pid_token TEXT)"
+            )
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+            if "pid_token" not in columns:
+                # Databases from before the token: their jobs keep the pid-only check
+                connection.execute("ALTER TABLE jobs ADD COLUMN pid_token TEXT")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_type_status ON jobs (type, status)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql: str, args: tuple = ()) -> int:
+        with self._lock:
+            connection = self._connect()
+            cursor = connection.execute(sql, args)
+            connection.commit()
+            return cursor.rowcount
+
+    def _query(self, sql: str, args: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    def create(self, job_id: str, job_type: str, params: Optional[dict]):
+        self._execute(
+            "INSERT INTO jobs (id, type, status, message, params, pid, pid_token, created_at)"
+            " VALUES (?, ?, 'queued', 'Queued', ?, ?, ?, ?)",
+            (job_id, job_type, json.dumps(params, ensure_ascii=False, default=str), os.getpid(),
+             _process_token(os.getpid()), time.time())
+        )
+
+    def start(self, job_id: str, limit: int) -> Optional[bool]:
+        """
+        Marks a queued job running if fewer than `limit` jobs of its type run
+        in any worker. False when it was cancelled while queued, None when all
+        slots are taken. The check and the update share one write transaction,
+        so two workers cannot both take the last slot.
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT type, status, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None or row["status"] != "queued" or row["cancel_requested"]:
+                    return False
+                running = connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE type = ? AND status = 'running'", (row["type"],)
+                ).fetchone()[0]
+                if running >= limit:
+                    connection.execute(
+                        "UPDATE jobs SET message = 'Waiting for a free slot' WHERE id = ?", (job_id,)
+                    )
+                    return None
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', message = 'Running', started_at = ? WHERE id = ?",
+                    (time.time(), job_id)
+                )
+                return True
+            finally:
+                connection.commit()
+
+    def progress(self, job_id: str, progress: Optional[float], message: Optional[str]):
+        """None for either keeps its current value."""
+        self._execute(
+            "UPDATE jobs SET progress = COALESCE(?, progress), message = COALESCE(?, message) WHERE id = ? AND status = 'running'",
+            (None if progress is None else min(1.0, max(0.0, progress)), message, job_id)
+        )
+
+    def finish(self, job_id: str, status: str, result=None, error: Optional[str] = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END, message = ?,"
+            " result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, status, status.capitalize(), None if result is None else json.dumps(result, ensure_ascii=False, default=str),
+             error, time.time(), job_id)
+        )
+
+    def request_cancel(self, job_id: str) -> bool:
+        return self._execute(
+            f"UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status NOT IN {FINISHED_STATUSES}", (job_id,)
+        ) == 1
+
+    def cancel_requested(self, job_id: str) -> bool:
+        rows = self._query("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,))
+        return bool(rows and rows[0]["cancel_requested"])
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[dict]:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0], with_result) if rows else None
+
+    def list(self, job_type: Optional[str] = None, status: Optional[str] = None, limit: int = 50) -> List[dict]:
+        clauses, args = [], []
+        if job_type:
+            clauses.append("type = ?")
+            args.append(job_type)
+        if status:
+            clauses.append("status = ?")
+            args.append(status)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._query(f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*args, limit))
+        return [self._to_dict(row) for row in rows]
+
+    def fail_orphaned(self) -> int:
+        """Jobs left queued or running by a process that no longer exists, even if another one now has its pid."""
+        orphaned = [
+            row["id"] for row in self._query(f"SELECT id, pid, pid_token FROM jobs WHERE status NOT IN {FINISHED_STATUSES}")
+            if not _pid_alive(row["pid"], row["pid_token"])
+        ]
+        for job_id in orphaned:
+            self.finish(job_id, "failed", error="Interrupted: the worker running this job stopped.")
+        return len(orphaned)
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row, with_result: bool = False) -> dict:
+        job = {
+            "job_id": row["id"],
+            "type": row["type"],
+            "status": row["status"],
+            "progress": round(row["progress"], 4),
+            "message": row["message"],
+            "error": row["error"],
+            "cancel_requested": bool(row["cancel_requested"]),
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"]
+        }
+        if with_result:
+            job["params"] = json.loads(row["params"]) if row["params"] else None
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+
+class JobContext:
+    """Handle a running job uses to report progress and notice cancellation."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._cancelled = False
+        self._checked_at = 0.0
+
+    def progress(self, fraction: Optional[float], message: Optional[str] = None):
+        self.store.progress(self.job_id, fraction, message)
+
+    def cancelled(self) -> bool:
+        if not self._cancelled and time.monotonic() - self._checked_at >= CANCEL_CHECK_INTERVAL:
+            self._checked_at = time.monotonic()
+            self._cancelled = self.store.cancel_requested(self.job_id)
+        return self._cancelled
+
+    def check_cancelled(self):
+        """Raises JobCancelled once cancellation was requested; call it between units of work."""
+        if self.cancelled():
+            raise JobCancelled(f"Job {self.job_id} was cancelled.")
+
+
+_current = threading.local()
+
+
+def current_job() -> Optional[JobContext]:
+    """The job running on this thread, or None for a plain request. Threads a job starts itself do not inherit it."""
+    return getattr(_current, "job", None)
+
+
+def report_progress(fraction: Optional[float], message: Optional[str] = None):
+    """
+    Records progress of the job running on this thread; does nothing outside a
+    job. A None fraction only updates the message.
+    """
+    job = current_job()
+    if job is not None:
+        job.progress(fraction, message)
+
+
+def check_cancelled():
+    job = current_job()
+    if job is not None:
+        job.check_cancelled()
+
+
+def endpoint_result(value):
+    """
+    Splits an endpoint's return value into (succeeded, JSON payload). The
+    admin endpoints report failures in their body ({"success": False}) or as
+    an error JSONResponse rather than by raising.
+    """
+    if isinstance(value, JSONResponse):
+        payload = json.loads(value.body) if value.body else None
+        return value.status_code < 400, payload
+    if isinstance(value, dict) and value.get("success") is False:
+        return False, value
+    return True, value
+
+
+class JobManager:
+    """
+    Runs submitted work on a bounded thread pool per job type and records
+    every state change in the job store. Work runs in the process that
+    accepted it; status, results and cancellation go through the database,
+    so any worker can serve them. The per-type limit is taken from the
+    database too, so it holds across workers: a job waits while its type's
+    slots are busy anywhere.
+    """
+
+    def __init__(self, store: JobStore, concurrency: Optional[Dict[str, int]] = None, max_queued: int = JOB_MAX_QUEUED):
+        self.store = store
+        self.concurrency = concurrency or parse_concurrency(JOB_CONCURRENCY)
+        self.max_queued = max_queued
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, job_type: str) -> ThreadPoolExecutor:
+        """Caller holds `_lock`."""
+        if job_type not in self._pools:
+            self._pools[job_type] = ThreadPoolExecutor(
+                max_workers=self.concurrency.get(job_type, 1), thread_name_prefix=f"job-{job_type}"
+            )
+        return self._pools[job_type]
+
+    def submit(self, job_type: str, fn: Callable, *args, params: Optional[dict] = None, **kwargs) -> str:
+        """
+        Queues `fn(*args, **kwargs)` and returns the job id at once. `fn` may
+        call `report_progress` / `check_cancelled`; its return value becomes
+        the job result (see `endpoint_result`).
+        """
+        with self._lock:
+            pending = sum(1 for job_id, future in self._futures.items() if job_id.startswith(f"{job_type}-") and not future.done())
+            if pending >= self.max_queued + self.concurrency.get(job_type, 1):
+                raise JobQueueFull(f"Too many {job_type} jobs waiting, try again later.")
+
+            job_id = f"{job_type}-{uuid.uuid4().hex}"
+            self.store.create(job_id, job_type, params)
+            self._futures[job_id] = self._pool(job_type).submit(self._run, job_type, job_id, fn, args, kwargs)
+            self._futures = {key: future for key, future in self._futures.items() if not future.done()}
+        return job_id
+
+    def _run(self, job_type: str, job_id: str, fn: Callable, args: tuple, kwargs: dict):
+        limit = self.concurrency.get(job_type, 1)
+        started = self.store.start(job_id, limit)
+        while started is None:
+            # Another worker holds the slot; a slot held by a dead worker is freed by failing its job
+            time.sleep(JOB_SLOT_WAIT_INTERVAL)
+            self.store.fail_orphaned()
+            started = self.store.start(job_id, limit)
+        if not started:
+            self.store.finish(job_id, "cancelled", error="Cancelled before it started.")
+            return
+
+        _current.job = JobContext(self.store, job_id)
+        try:
+            succeeded, payload = endpoint_result(fn(*args, **kwargs))
+            if succeeded:
+                self.store.finish(job_id, "succeeded", payload)
+            else:
+                error = (payload.get("message") or payload.get("error")) if isinstance(payload, dict) else None
+                self.store.finish(job_id, "failed", payload, error or "The job reported a failure.")
+        except JobCancelled as e:
+            self.store.finish(job_id, "cancelled", error=str(e))
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {e}")
+            self.store.finish(job_id, "failed", error=f"{type(e).__name__}: {e}")
+        finally:
+            _current.job = None
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """
+        Requests cancellation. A queued job never starts; a running one stops
+        at its next `check_cancelled`. Returns the job, or None if unknown.
+        """
+        self.store.request_cancel(job_id)
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            self.store.finish(job_id, "cancelled", error="Cancelled before it started.")
+        return self.store.get(job_id)
+
+    def shutdown(self):
+        """Cancels this process's queued jobs and asks its running ones to stop."""
+        with self._lock:
+            futures, self._futures = dict(self._futures), {}
+            pools, self._pools = list(self._pools.values()), {}
+        for job_id, future in futures.items():
+            if future.cancel():
+                self.store.finish(job_id, "cancelled", error="Server shut down before the job started.")
+            elif not future.done():
+                self.store.request_cancel(job_id)
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager(JobStore(JOBS_DB_PATH))
+
+
+def scratch_directory(base: str) -> str:
+    """
+    Creates a new directory under `base` for one call's files. Calls can run
+    at once in different workers, so each cleans up only its own directory.
+    """
+    directory = os.path.join(base, uuid.uuid4().hex)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def submit_endpoint_job(job_type: str, fn: Callable, *args, params: Optional[dict] = None, **kwargs) -> dict:
+    """Runs an endpoint function as a background job; the response the `*_job` endpoints return."""
+    try:
+        job_id = job_manager.submit(job_type, fn, *args, params=params, **kwargs)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+        "cancel_url": f"/jobs/{job_id}/cancel"
+    }
+
+
+def submit_upload_job(job_type: str, fn: Callable, upload_arg: str, uploads: List[UploadFile], params: Optional[dict] = None,
+                      **kwargs) -> dict:
+    """
+    Like `submit_endpoint_job` for endpoints taking uploaded files, which are
+    closed once the request returns: they are copied to disk first and handed
+    to `fn` (as its `upload_arg`) reopened; the copies are removed afterwards.
+    """
+    directory = os.path.join(JOB_UPLOAD_DIRECTORY, uuid.uuid4().hex)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for position, upload in enumerate(uploads):
+        # Numbered subdirectories keep same-named uploads apart
+        path = os.path.join(directory, str(position), os.path.basename(upload.filename or "upload"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(upload.file, f)
+        paths.append(path)
+
+    def run():
+        files = [open(path, "rb") for path in paths]
+        try:
+            stashed = [UploadFile(file=f, filename=os.path.basename(path)) for f, path in zip(files, paths)]
+            return fn(**{upload_arg: stashed}, **kwargs)
+        finally:
+            for f in files:
+                f.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    try:
+        return submit_endpoint_job(job_type, run, params=params)
+    except HTTPException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
@@ -0,0 +1,47 @@
+def current_rss_bytes() -> int:
+    """
+    Resident set size of the current process in bytes, or 0 if unavailable.
+    Reads /proc on Linux and falls back to the peak RSS reported by `resource`.
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return 0
+
+
+def private_memory_bytes() -> int:
+    """
+    Anonymous memory of the current process in bytes (heap, numpy arrays,
+    FAISS structures read into memory), or 0 if unavailable. Unlike RSS it
+    leaves out memory-mapped file pages, which every worker shares through
+    the page cache, so it is what each extra worker really costs.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Anonymous:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def format_bytes(size: int) -> str:
+    if size < 1024 * 1024:
+        return f"{size / 1024:.2f} KB"
+    if size < 1024 * 1024 * 1024:
+        return f"{size / (1024 * 1024):.2f} MB"
+    return f"{size / (1024 * 1024 * 1024):.2f} GB"
+
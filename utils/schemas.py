@@ -2,7 +2,7 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 from enum import Enum
 
 # Report
@@ -30,25 +30,77 @@ class ControlsRequest(BaseModel):
     controls: List[ControlData]
 
 
+class MetadataFilters(BaseModel):
+    # Each field takes one value or a list of accepted values
+    source: Optional[Union[str, List[str]]] = None
+    regulation: Optional[Union[str, List[str]]] = None
+    license_type: Optional[Union[str, List[str]]] = None
+    tenant: Optional[Union[str, List[str]]] = None
+
 class FilterTermsRequestEnterprise(BaseModel):
-    path_load: str
+    path_load: str = ""  # Store under the vectorstore directory, e.g. a tenant's; empty or unknown uses the router's store
     user_question: str
     is_licensed: str
     license_type: str
     regulations: str
     service_type: str
     k: int = 4
+    filters: Optional[MetadataFilters] = None
+    score_threshold: Optional[float] = None  # Minimum cosine similarity of a returned hit
+    use_mmr: bool = False                    # Pick k diverse hits out of fetch_k candidates
+    fetch_k: Optional[int] = None            # MMR candidates, defaults to 4 * k
+    lambda_mult: float = 0.5                 # MMR trade-off: 1 = relevance only, 0 = diversity only
 
 class FilterTermsRequestRegulator(BaseModel):
-    path_load: str
+    path_load: str = ""  # Store under the vectorstore directory, e.g. a tenant's; empty or unknown uses the router's store
     license_type: str
     regulations: str
     k: int = 4
+    filters: Optional[MetadataFilters] = None
+    score_threshold: Optional[float] = None  # Minimum cosine similarity of a returned hit
+    use_mmr: bool = False                    # Pick k diverse hits out of fetch_k candidates
+    fetch_k: Optional[int] = None            # MMR candidates, defaults to 4 * k
+    lambda_mult: float = 0.5                 # MMR trade-off: 1 = relevance only, 0 = diversity only
 
 # RAG
 class FileURLsRag(BaseModel):
     urls: List[str]
 
+class IndexType(str, Enum):
+    FLAT = "flat"
+    IVF = "ivf"
+    HNSW = "hnsw"
+
+class IndexCompression(str, Enum):
+    NONE = "none"
+    FP16 = "fp16"
+    SQ8 = "sq8"
+    PQ = "pq"
+
+class IndexOptions(BaseModel):
+    index_type: IndexType = IndexType.FLAT
+    nlist: Optional[int] = None  # IVF centroids, defaults to ~4*sqrt(n)
+    nprobe: int = 8              # IVF lists scanned per query
+    hnsw_m: int = 32             # HNSW graph degree
+    ef_construction: int = 200
+    ef_search: int = 64
+    compression: IndexCompression = IndexCompression.NONE
+    pq_m: int = 48               # PQ sub-quantizers, must divide the embedding size
+    pq_nbits: int = 8            # Capped so each code book gets ~39 training points per centroid
+    rerank: bool = False         # Re-rank compressed hits with float32 vectors kept on disk
+    rerank_factor: int = 4
+
+class RecordMetadata(BaseModel):
+    # Stamped on every record of the ingested files, for filtered search
+    regulation: Optional[str] = None
+    license_type: Optional[str] = None
+    tenant: Optional[str] = None
+
+class CreateRagSystemRequest(FileURLsRag):
+    index_options: IndexOptions = IndexOptions()
+    metadata: RecordMetadata = RecordMetadata()
+    incremental: bool = True     # Only embed new or changed files; False forces a full rebuild
+
 class FileControlInput(BaseModel):
     url: str
     name_file: str